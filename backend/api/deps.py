@@ -4,7 +4,7 @@ from core.database import get_db_session
 from services.auth import get_current_user
 from services.agent_manager import AgentManager
 from langchain_openai import ChatOpenAI
-from models.user import User
+from core.schemas import UserPrincipal
 from typing import Annotated
 
 async def get_db() -> AsyncSession:
@@ -23,9 +23,15 @@ def get_llm_instance(request: Request) -> ChatOpenAI:
         raise HTTPException(status_code=503, detail="LLM is not initialized.")
     return llm_instance
 
+def get_formatter_llm(request: Request) -> ChatOpenAI:
+    """LLM used for the structured-output formatting call; falls back to the agent LLM."""
+    formatter_llm = getattr(request.app.state, "formatter_llm", None)
+    return formatter_llm if formatter_llm is not None else get_llm_instance(request)
+
 # Annotated Dependencies
 SessionDep = Annotated[AsyncSession, Depends(get_db)]
-UserDep = Annotated[User, Depends(get_current_user)]
+UserDep = Annotated[UserPrincipal, Depends(get_current_user)]
 AgentManagerDep = Annotated[AgentManager, Depends(get_agent_manager)]
 LLMDep = Annotated[ChatOpenAI, Depends(get_llm_instance)]
+FormatterLLMDep = Annotated[ChatOpenAI, Depends(get_formatter_llm)]
 
@@ -1,7 +1,8 @@
 from fastapi import APIRouter # type: ignore
-from api.v1.endpoints import sessions, auth, users
+from api.v1.endpoints import sessions, auth, users, system
 
 api_router = APIRouter()
 api_router.include_router(sessions.router, prefix="/sessions", tags=["sessions"])
 api_router.include_router(auth.router, prefix="/auth", tags=["auth"])
 api_router.include_router(users.router, prefix="/users", tags=["users"])
+api_router.include_router(system.router, prefix="/system", tags=["system"])
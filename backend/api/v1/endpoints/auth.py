@@ -5,26 +5,45 @@ from services import user as user_crud
 from core.schemas import UserCreate, UserSchema, Token
 from core.schemas import UserCreate, UserSchema, Token
 from services.auth import create_access_token
-from core.security import verify_password
+from core.security import averify_and_update, PasswordHashBusyError
 from api import deps
 
 router = APIRouter()
 
+def _busy_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many authentication requests, please retry shortly.",
+        headers={"Retry-After": "1"},
+    )
+
 @router.post("/register", response_model=UserSchema, status_code=201)
 async def register_user(user: UserCreate, db: deps.SessionDep):
     db_user = await user_crud.get_user_by_username(db, username=user.username)
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
-    return await user_crud.create_user(db=db, user=user)
+    try:
+        return await user_crud.create_user(db=db, user=user)
+    except PasswordHashBusyError:
+        raise _busy_exception()
 
 @router.post("/login", response_model=Token)
 async def login_for_access_token(db: deps.SessionDep, form_data: OAuth2PasswordRequestForm = Depends()):
     user = await user_crud.get_user_by_username(db, username=form_data.username)
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    verified, new_hash = False, None
+    if user:
+        try:
+            verified, new_hash = await averify_and_update(form_data.password, user.hashed_password)
+        except PasswordHashBusyError:
+            raise _busy_exception()
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        # The stored hash used an outdated bcrypt cost; replace it now that we know the password
+        await user_crud.update_user_password_hash(db, user, new_hash)
     access_token = create_access_token(data={"sub": user.username})
     return {"access_token": access_token, "token_type": "bearer", "user": UserSchema.from_orm(user)}
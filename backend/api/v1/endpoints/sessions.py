@@ -1,14 +1,28 @@
-from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi import APIRouter, HTTPException, Depends, Header, Request, Response, WebSocket, WebSocketDisconnect, Query, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from core.schemas import SessionCreate, ChatSessionResponse, MessageRequest, MessageResponse, SessionListResponse, ChatMessageResponse
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+from contextlib import aclosing
+import asyncio
+import json
+import time
+from core.schemas import SessionCreate, ChatSessionResponse, MessageRequest, MessageResponse, SessionListResponse, ChatMessageResponse, UserPrincipal, JobCreate, JobResponse
 from models.user import User
 from services import chat as chat_crud
-from services import user as user_crud
 from api import deps
-from langchain.agents import AgentExecutor # type: ignore
-from services.message_converter import db_messages_to_lc_messages
+from services import memory
+from services.response_cache import response_cache
+from services.idempotency import idempotency_store, request_fingerprint, IdempotencyKeyReusedError
+from services.session_locks import session_locks, SessionBusyError
+from services.jobs import job_runner, Job, JobQueueFullError
 from langchain_openai import ChatOpenAI
-from services.agent import get_agent_response
+from services.agent import get_agent_response, TurnProgress
+from services.turns import save_partial_turn, stream_turn
+from services.auth import get_current_user
+from core.database import AsyncSessionLocal
+from core import config
+from langchain_core.messages import BaseMessage
 
 router = APIRouter()
 
@@ -17,85 +31,180 @@ from services.agent_manager import AgentManager
 from api import deps
 
 
+async def _run_idempotent(idempotency_key: Optional[str], scope: str, payload: Any, response: Response, work: Callable[[], Awaitable[Any]]) -> Any:
+    """Runs ``work`` once per Idempotency-Key: retries replay the stored result or wait for the running one."""
+    if not idempotency_key:
+        return await work()
+    try:
+        result, replayed = await idempotency_store.run(f"{scope}:{idempotency_key}", request_fingerprint(payload), work)
+    except IdempotencyKeyReusedError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+async def _supervise_turn(turn: Awaitable[Any], progress: TurnProgress, request: Optional[Request] = None) -> Any:
+    """Runs a turn within ``TURN_TIMEOUT_SECONDS`` and, given the request, cancels it once the client disconnects.
+
+    A cancelled turn saves its partial answer (see ``save_partial_turn``) before this raises 504 or 499.
+    """
+    task = asyncio.ensure_future(turn)
+    deadline = time.monotonic() + config.TURN_TIMEOUT_SECONDS
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                progress.status = "timed_out"
+                break
+            done, _ = await asyncio.wait({task}, timeout=min(remaining, config.DISCONNECT_POLL_SECONDS) if request else remaining)
+            if done:
+                return task.result()
+            if request is not None and await request.is_disconnected():
+                progress.status = "cancelled"
+                break
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+
+    task.cancel()
+    await asyncio.wait({task})
+    if not task.cancelled():
+        return task.result() # Finished before the cancellation landed
+    if progress.status == "timed_out":
+        raise HTTPException(status_code=504, detail="The agent did not finish in time; its partial answer was saved.")
+    raise HTTPException(status_code=499, detail="Client closed request.")
+
 @router.post("/", response_model=ChatSessionResponse, status_code=201)
 async def create_session(
     session_data: SessionCreate, 
-    db: deps.SessionDep,
+    request: Request,
+    response: Response,
     current_user: deps.UserDep,
     agent_manager: deps.AgentManagerDep,
-    llm_instance: deps.LLMDep
+    formatter_llm: deps.FormatterLLMDep,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
-    """Starts a new chat session for a user."""
-        
-    user = await user_crud.get_user_by_id(db, current_user.id)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found.")
+    """Starts a new chat session for a user.
 
-    new_session, _ = await chat_crud.create_chat_session(
-        db, current_user.id, session_data.initial_message
-    )
-    
-    # Get user-specific agent
-    agent_executor = await agent_manager.get_agent(user)
-    if not agent_executor:
-         raise HTTPException(status_code=500, detail="Failed to initialize AI agent.")
+    The turn is cancelled if the client disconnects (unless an ``Idempotency-Key`` lets a retry pick it up)
+    or it runs past ``TURN_TIMEOUT_SECONDS``; either way the session is kept with the partial answer.
+    """
+    progress = TurnProgress()
 
-    ai_response_content, tool_names_used, tool_calls = await get_agent_response(
-        agent_executor, session_data.initial_message, [], llm_instance
-    )
-    
-    await chat_crud.add_ai_message_to_session(
-        db, new_session.id, ai_response_content, tool_names_used, tool_calls
-    )
-    
-    messages = await chat_crud.get_chat_messages(db, new_session.id)
-    
-    return ChatSessionResponse(
-        id=new_session.id,
-        user_id=new_session.user_id,
-        title=new_session.title,
-        created_at=new_session.created_at,
-        updated_at=new_session.updated_at,
-        messages=[ChatMessageResponse.from_orm(m) for m in messages]
-    )
+    async def turn() -> ChatSessionResponse:
+        new_session, user_message = chat_crud.new_chat_session(current_user.id, session_data.initial_message)
+
+        # Get user-specific agent
+        agent_executor = await agent_manager.get_agent(current_user)
+        if not agent_executor:
+             raise HTTPException(status_code=500, detail="Failed to initialize AI agent.")
+
+        cache_scope = response_cache.scope_key(agent_manager.tool_scope(current_user.id), [])
+        try:
+            ai_response_content, tool_names_used, tool_calls = await get_agent_response(
+                agent_executor, session_data.initial_message, [], formatter_llm, cache_scope, progress=progress
+            )
+        except asyncio.CancelledError:
+            await asyncio.shield(save_partial_turn(new_session.id, session_data.initial_message, progress, new_session, user_message))
+            raise
+
+        ai_message = chat_crud.new_ai_message(new_session.id, ai_response_content, tool_names_used, tool_calls)
+        # Session, user message and AI message are written in one transaction
+        async with AsyncSessionLocal() as db:
+            await chat_crud.save_turn(db, new_session, user_message, ai_message)
+
+        return ChatSessionResponse(
+            id=new_session.id,
+            user_id=new_session.user_id,
+            title=new_session.title,
+            created_at=new_session.created_at,
+            updated_at=new_session.updated_at,
+            last_message_at=new_session.last_message_at,
+            message_count=new_session.message_count,
+            last_message_preview=new_session.last_message_preview,
+            messages=[ChatMessageResponse.from_orm(user_message), ChatMessageResponse.from_orm(ai_message)]
+        )
+
+    async def work() -> ChatSessionResponse:
+        return await _supervise_turn(turn(), progress, None if idempotency_key else request)
+
+    return await _run_idempotent(idempotency_key, f"{current_user.id}:create_session", session_data.model_dump(), response, work)
 
 @router.post("/chat", response_model=MessageResponse)
 async def send_message(
     message_data: MessageRequest, 
-    db: deps.SessionDep,
+    request: Request,
+    response: Response,
     current_user: deps.UserDep,
     agent_manager: deps.AgentManagerDep,
-    llm_instance: deps.LLMDep
+    llm_instance: deps.LLMDep,
+    formatter_llm: deps.FormatterLLMDep,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
-    """Sends a new message to an existing chat session."""
-        
-    session = await chat_crud.get_chat_session(db, message_data.session_id)
+    """Sends a new message to an existing chat session.
+
+    Turns of one session run one at a time; with an ``Idempotency-Key`` a retried request returns the
+    original turn's result instead of running the agent again. Without one, the turn is cancelled when the
+    client disconnects; a turn past ``TURN_TIMEOUT_SECONDS`` is cancelled too. Cancelled turns keep the
+    user message and an AI message with the partial answer (``content.status`` is "cancelled" or "timed_out").
+    """
+    progress = TurnProgress()
+
+    async def work() -> MessageResponse:
+        # Ownership first: a caller must not be able to hold or queue on someone else's session
+        await _check_session_owner(message_data.session_id, current_user)
+        try:
+            async with session_locks.hold(message_data.session_id):
+                turn = _send_message_turn(message_data, current_user, agent_manager, llm_instance, formatter_llm, progress)
+                return await _supervise_turn(turn, progress, None if idempotency_key else request)
+        except SessionBusyError as e:
+            raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+
+    return await _run_idempotent(idempotency_key, f"{current_user.id}:chat", message_data.model_dump(), response, work)
+
+async def _check_session_owner(session_id: str, current_user: UserPrincipal):
+    """Raises 404 when the session does not exist and 403 when it belongs to another user."""
+    async with AsyncSessionLocal() as db:
+        session = await chat_crud.get_chat_session(db, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Chat session not found.")
-    
     if session.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Forbidden: User ID does not match session owner.")
-        
-    history_records = await chat_crud.get_chat_messages(db, message_data.session_id)
-    lc_history = db_messages_to_lc_messages(history_records)
-    
-    user_message = await chat_crud.add_user_message_to_session(
-        db, message_data.session_id, message_data.content
-    )
-    
+
+async def _send_message_turn(
+    message_data: MessageRequest,
+    current_user: UserPrincipal,
+    agent_manager: AgentManager,
+    llm_instance: ChatOpenAI,
+    formatter_llm: ChatOpenAI,
+    progress: TurnProgress
+) -> MessageResponse:
+    # Own, short-lived DB sessions: an idempotent turn can outlive the request that started it, and no
+    # connection is held while the agent runs
+    async with AsyncSessionLocal() as db:
+        lc_history = await memory.load_history(db, message_data.session_id)
+    user_message = chat_crud.new_user_message(message_data.session_id, message_data.content)
+
     # Get user-specific agent
     agent_executor = await agent_manager.get_agent(current_user)
     if not agent_executor:
          raise HTTPException(status_code=500, detail="Failed to initialize AI agent.")
-    
-    ai_response_content, tool_names_used, tool_calls = await get_agent_response(
-        agent_executor, message_data.content, lc_history, llm_instance 
-    )
-    
-    ai_message = await chat_crud.add_ai_message_to_session(
-        db, message_data.session_id, ai_response_content, tool_names_used, tool_calls
-    )
-    
+
+    cache_scope = response_cache.scope_key(agent_manager.tool_scope(current_user.id), lc_history)
+    try:
+        ai_response_content, tool_names_used, tool_calls = await get_agent_response(
+            agent_executor, message_data.content, lc_history, formatter_llm, cache_scope, progress=progress
+        )
+    except asyncio.CancelledError:
+        # Shielded so the partial turn is written before the session lock is released
+        await asyncio.shield(save_partial_turn(message_data.session_id, message_data.content, progress, user_message))
+        raise
+
+    ai_message = chat_crud.new_ai_message(message_data.session_id, ai_response_content, tool_names_used, tool_calls)
+    async with AsyncSessionLocal() as db:
+        await chat_crud.save_turn(db, user_message, ai_message, touch_session_id=message_data.session_id)
+    memory.schedule_summarization(llm_instance, message_data.session_id)
+
     return MessageResponse(
         session_id=message_data.session_id,
         user_message=ChatMessageResponse.from_orm(user_message),
@@ -104,29 +213,229 @@ async def send_message(
         tool_calls=tool_calls
     )
 
-@router.get("/{session_id}", response_model=ChatSessionResponse)
-async def get_session(session_id: str, db: deps.SessionDep, current_user: deps.UserDep):
-    """Retrieves a specific chat session and all its messages."""
-    session = await chat_crud.get_chat_session(db, session_id)
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def _sse_event(event: str, data: Any) -> str:
+    """Formats a single Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+async def _sse_stream(events: AsyncIterator[Tuple[str, Any]]) -> AsyncIterator[str]:
+    async for event, data in events:
+        yield _sse_event(event, data)
+
+@router.post("/stream")
+async def create_session_stream(
+    session_data: SessionCreate,
+    current_user: deps.UserDep,
+    agent_manager: deps.AgentManagerDep,
+    llm_instance: deps.LLMDep,
+    formatter_llm: deps.FormatterLLMDep
+):
+    """Starts a new chat session and streams the AI response as Server-Sent Events."""
+    agent_executor = await agent_manager.get_agent(current_user)
+    if not agent_executor:
+         raise HTTPException(status_code=500, detail="Failed to initialize AI agent.")
+
+    # Short-lived DB session: no connection is held while the response streams
+    async with AsyncSessionLocal() as db:
+        new_session, user_message = await chat_crud.create_chat_session(
+            db, current_user.id, session_data.initial_message
+        )
+    session_response = ChatSessionResponse(
+        id=new_session.id,
+        user_id=new_session.user_id,
+        title=new_session.title,
+        created_at=new_session.created_at,
+        updated_at=new_session.updated_at,
+        last_message_at=new_session.last_message_at,
+        message_count=new_session.message_count,
+        last_message_preview=new_session.last_message_preview,
+        messages=[ChatMessageResponse.from_orm(user_message)]
+    )
+
+    async def events():
+        # Held before the session id reaches the client, so its first /chat queues behind this turn
+        async with session_locks.hold(new_session.id):
+            yield "session", session_response
+            cache_scope = response_cache.scope_key(agent_manager.tool_scope(current_user.id), [])
+            async for item in stream_turn(new_session.id, session_data.initial_message, [], agent_executor, llm_instance, formatter_llm, cache_scope):
+                yield item
+
+    return StreamingResponse(_sse_stream(events()), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@router.post("/chat/stream")
+async def send_message_stream(
+    message_data: MessageRequest,
+    current_user: deps.UserDep,
+    agent_manager: deps.AgentManagerDep,
+    llm_instance: deps.LLMDep,
+    formatter_llm: deps.FormatterLLMDep
+):
+    """Sends a message to an existing chat session and streams the AI response as Server-Sent Events."""
+    await _check_session_owner(message_data.session_id, current_user)
+
+    agent_executor = await agent_manager.get_agent(current_user)
+    if not agent_executor:
+         raise HTTPException(status_code=500, detail="Failed to initialize AI agent.")
+
+    async def events():
+        # Hold the session for the whole turn so a concurrent send queues behind it
+        try:
+            async with session_locks.hold(message_data.session_id):
+                async with AsyncSessionLocal() as turn_db:
+                    lc_history = await memory.load_history(turn_db, message_data.session_id)
+                    user_message = await chat_crud.add_user_message_to_session(
+                        turn_db, message_data.session_id, message_data.content
+                    )
+                yield "user_message", ChatMessageResponse.from_orm(user_message)
+                cache_scope = response_cache.scope_key(agent_manager.tool_scope(current_user.id), lc_history)
+                async for item in stream_turn(message_data.session_id, message_data.content, lc_history, agent_executor, llm_instance, formatter_llm, cache_scope):
+                    yield item
+        except SessionBusyError as e:
+            yield "error", {"detail": str(e)}
+
+    return StreamingResponse(_sse_stream(events()), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@router.websocket("/ws")
+async def chat_websocket(websocket: WebSocket, token: str = Query(...)):
+    """Streams chat turns over a WebSocket.
+
+    Browsers cannot set headers on WebSocket requests, so the bearer token is passed as a query parameter.
+    Each client frame is ``{"content": str, "session_id": optional str}``; every server frame is
+    ``{"event": str, "data": ...}`` using the same event names as the SSE endpoints.
+    """
+    agent_manager = websocket.app.state.agent_manager
+    llm_instance = websocket.app.state.llm_instance
+    formatter_llm = getattr(websocket.app.state, "formatter_llm", llm_instance)
+    async with AsyncSessionLocal() as db:
+        try:
+            current_user = await get_current_user(db, token)
+        except HTTPException:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+
+    await websocket.accept()
+    try:
+        while True:
+            payload = await websocket.receive_json()
+            content = payload.get("content")
+            session_id = payload.get("session_id")
+            if not content:
+                await websocket.send_json({"event": "error", "data": {"detail": "Message content is required."}})
+                continue
+
+            if not session_id:
+                async with AsyncSessionLocal() as db:
+                    session, user_message = await chat_crud.create_chat_session(db, current_user.id, content)
+                session_id = session.id
+                await websocket.send_json({"event": "session", "data": jsonable_encoder({"id": session.id, "title": session.title})})
+                await _ws_turn(websocket, session_id, content, [], user_message, current_user, agent_manager, llm_instance, formatter_llm)
+                continue
+
+            async with AsyncSessionLocal() as db:
+                session = await chat_crud.get_chat_session(db, session_id)
+            if not session or session.user_id != current_user.id:
+                await websocket.send_json({"event": "error", "data": {"detail": "Chat session not found."}})
+                continue
+
+            try:
+                async with session_locks.hold(session_id):
+                    async with AsyncSessionLocal() as db:
+                        lc_history = await memory.load_history(db, session_id)
+                        user_message = await chat_crud.add_user_message_to_session(db, session_id, content)
+                    await _ws_turn(websocket, session_id, content, lc_history, user_message, current_user, agent_manager, llm_instance, formatter_llm)
+            except SessionBusyError as e:
+                await websocket.send_json({"event": "error", "data": {"detail": str(e)}})
+    except WebSocketDisconnect:
+        return
+
+def _decode_cursor(cursor: Optional[str], decode: Callable[[str], Any] = chat_crud.decode_cursor) -> Any:
+    if cursor is None:
+        return None
+    try:
+        return decode(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+async def _ws_turn(
+    websocket: WebSocket,
+    session_id: str,
+    content: str,
+    lc_history: List[BaseMessage],
+    user_message: Any,
+    current_user: UserPrincipal,
+    agent_manager: AgentManager,
+    llm_instance: ChatOpenAI,
+    formatter_llm: ChatOpenAI
+):
+    agent_executor = await agent_manager.get_agent(current_user)
+    if not agent_executor:
+        await websocket.send_json({"event": "error", "data": {"detail": "Failed to initialize AI agent."}})
+        return
+
+    await websocket.send_json({"event": "user_message", "data": jsonable_encoder(ChatMessageResponse.from_orm(user_message))})
+    cache_scope = response_cache.scope_key(agent_manager.tool_scope(current_user.id), lc_history)
+    # aclosing: a failed send (client gone) closes the turn right away, which stops the agent and saves the partial answer
+    async with aclosing(stream_turn(session_id, content, lc_history, agent_executor, llm_instance, formatter_llm, cache_scope)) as events:
+        async for event, data in events:
+            await websocket.send_json({"event": event, "data": jsonable_encoder(data)})
+
+@router.post("/jobs", response_model=JobResponse, status_code=202)
+async def create_job(job_data: JobCreate, db: deps.SessionDep, current_user: deps.UserDep):
+    """Queues a message as a background job, for turns that may run longer than an HTTP request should.
+
+    Poll ``GET /jobs/{job_id}`` or subscribe to ``GET /jobs/{job_id}/events``; the finished turn is
+    persisted to the session like any other.
+    """
+    session = await chat_crud.get_chat_session(db, job_data.session_id)
     if not session or session.user_id != current_user.id:
         raise HTTPException(status_code=404, detail="Chat session not found.")
-        
-    messages = await chat_crud.get_chat_messages(db, session_id)
-    
-    return ChatSessionResponse(
-        id=session.id,
-        user_id=session.user_id,
-        title=session.title,
-        created_at=session.created_at,
-        updated_at=session.updated_at,
-        messages=[ChatMessageResponse.from_orm(m) for m in messages]
-    )
+    if not job_runner.started:
+        raise HTTPException(status_code=503, detail="Background jobs are not available.")
+    try:
+        job = await job_runner.submit(current_user.id, job_data.session_id, job_data.content, job_data.priority)
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
+    return JobResponse.from_orm(job)
+
+async def _get_user_job(job_id: str, current_user: UserPrincipal) -> Job:
+    job = await job_runner.get(job_id)
+    if job is None or job.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, current_user: deps.UserDep):
+    """Returns a background job's status and, once it has succeeded, its result."""
+    return JobResponse.from_orm(await _get_user_job(job_id, current_user))
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, current_user: deps.UserDep):
+    """Streams a background job's progress as Server-Sent Events, starting with the events so far."""
+    await _get_user_job(job_id, current_user)
+    return StreamingResponse(_sse_stream(job_runner.subscribe(job_id)), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@router.delete("/jobs/{job_id}", response_model=JobResponse)
+async def cancel_job(job_id: str, current_user: deps.UserDep):
+    """Cancels a queued job or stops a running one; a stopped turn keeps its partial answer.
+
+    A job running in another process comes back still "running" with ``cancel_requested`` set until its worker stops it.
+    """
+    await _get_user_job(job_id, current_user)
+    return JobResponse.from_orm(await job_runner.cancel(job_id))
 
 @router.get("/user/", response_model=SessionListResponse)
-async def list_user_sessions(db: deps.SessionDep, current_user: deps.UserDep):
-    """Lists all chat sessions for a specific user."""
-    sessions = await chat_crud.get_user_sessions(db, current_user.id)
+async def list_user_sessions(
+    db: deps.SessionDep,
+    current_user: deps.UserDep,
+    limit: int = Query(config.SESSION_PAGE_SIZE, ge=1, le=config.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
+    """Lists the user's chat sessions, most recently active first, one page at a time."""
+    session_cursor = _decode_cursor(cursor, chat_crud.decode_session_cursor)
+    sessions, has_more = await chat_crud.get_user_sessions(db, current_user.id, limit, session_cursor)
     return SessionListResponse(
+        next_cursor=chat_crud.encode_session_cursor(sessions[-1]) if has_more and sessions else None,
         sessions=[
             ChatSessionResponse(
                 id=s.id,
@@ -134,11 +443,51 @@ async def list_user_sessions(db: deps.SessionDep, current_user: deps.UserDep):
                 title=s.title,
                 created_at=s.created_at,
                 updated_at=s.updated_at,
+                last_message_at=s.last_message_at,
+                message_count=s.message_count,
+                last_message_preview=s.last_message_preview,
                 messages=[]
             ) for s in sessions
         ]
     )
 
+@router.get("/{session_id}", response_model=ChatSessionResponse)
+async def get_session(
+    session_id: str,
+    db: deps.SessionDep,
+    current_user: deps.UserDep,
+    limit: int = Query(config.MESSAGE_PAGE_SIZE, ge=1, le=config.MAX_PAGE_SIZE),
+    before: Optional[str] = None,
+    after: Optional[str] = None
+):
+    """Retrieves a chat session with one page of its messages (the latest ones unless a cursor is given)."""
+    if before is not None and after is not None:
+        raise HTTPException(status_code=400, detail="Pass either 'before' or 'after', not both.")
+    session = await chat_crud.get_chat_session(db, session_id)
+    if not session or session.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Chat session not found.")
+
+    before_id, after_id = _decode_cursor(before), _decode_cursor(after)
+    if not all(isinstance(anchor, int) for anchor in (before_id, after_id) if anchor is not None):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    messages, has_older, has_newer = await chat_crud.get_chat_messages_page(
+        db, session_id, limit, before=before_id, after=after_id
+    )
+
+    return ChatSessionResponse(
+        id=session.id,
+        user_id=session.user_id,
+        title=session.title,
+        created_at=session.created_at,
+        updated_at=session.updated_at,
+        last_message_at=session.last_message_at,
+        message_count=session.message_count,
+        last_message_preview=session.last_message_preview,
+        messages=[ChatMessageResponse.from_orm(m) for m in messages],
+        older_cursor=chat_crud.encode_cursor(messages[0].id) if has_older and messages else None,
+        newer_cursor=chat_crud.encode_cursor(messages[-1].id) if has_newer and messages else None
+    )
+
 @router.delete("/{session_id}", status_code=204)
 async def delete_session(session_id: str, db: deps.SessionDep, current_user: deps.UserDep):
     """Deletes a specific chat session and all its messages."""
@@ -0,0 +1,29 @@
+from fastapi import APIRouter
+from services.response_cache import response_cache
+from services.mcp_pool import mcp_pool
+from services.principal_cache import principal_cache
+from services.idempotency import idempotency_store
+from services.session_locks import session_locks
+from services.jobs import job_runner
+from services.llm import llm_guard
+from services.embedding_cache import embedding_cache
+from api import deps
+
+router = APIRouter()
+
+@router.get("/stats")
+async def read_stats(current_user: deps.UserDep, agent_manager: deps.AgentManagerDep):
+    """
+    Cache and connection-pool counters (hit ratio, saved latency, agent build latency).
+    """
+    return {
+        "agent_manager": agent_manager.stats(),
+        "response_cache": response_cache.stats(),
+        "mcp_pool": mcp_pool.stats(),
+        "principal_cache": principal_cache.stats(),
+        "idempotency": idempotency_store.stats(),
+        "session_locks": session_locks.stats(),
+        "jobs": job_runner.stats(),
+        "llm": llm_guard.stats(),
+        "embedding_cache": embedding_cache.stats(),
+    }
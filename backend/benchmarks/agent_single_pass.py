@@ -0,0 +1,54 @@
+"""Regression benchmark: one chat turn must run the agent executor exactly once.
+
+Run from the backend directory with ``python -m benchmarks.agent_single_pass``.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from typing import List
+from langchain_core.messages import AIMessage # type: ignore
+from services.agent import create_mcp_agent_executor, get_agent_response
+from benchmarks.fakes import ScriptedChatModel, CountingTool, tool_call_message
+
+
+async def run(turns: int, latency: float) -> int:
+    tool = CountingTool()
+    # One tool-calling step followed by the final answer: two agent LLM calls per turn.
+    llm = ScriptedChatModel(
+        responses=[tool_call_message(tool.name, "ping"), AIMessage(content="pong")],
+        latency=latency,
+    )
+    executor = create_mcp_agent_executor(llm, [tool.as_tool()])
+
+    durations: List[float] = []
+    for _ in range(turns):
+        started = time.perf_counter()
+        _, tool_names, tool_calls = await get_agent_response(executor, "ping", [], llm)
+        durations.append(time.perf_counter() - started)
+        assert tool_names == [tool.name], tool_names
+        assert len(tool_calls) == 1 and tool_calls[0]["output"] == "echo: ping", tool_calls
+
+    expected_llm_calls = 2 * turns
+    ok = llm.calls == expected_llm_calls and tool.calls == turns
+    print(f"turns={turns} agent_llm_calls={llm.calls} (expected {expected_llm_calls}) "
+          f"tool_calls={tool.calls} (expected {turns}) format_calls={llm.format_calls}")
+    print(f"mean turn latency: {sum(durations) / len(durations) * 1000:.1f} ms "
+          f"(fake LLM latency {latency * 1000:.0f} ms per call)")
+    if not ok:
+        print("❌ Agent executor ran more than once per turn.")
+        return 1
+    print("✅ Agent executor ran exactly once per turn.")
+    return 0
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Check that each chat turn runs the agent only once.")
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated LLM latency in seconds.")
+    args = parser.parse_args(argv)
+    return asyncio.run(run(args.turns, args.latency))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
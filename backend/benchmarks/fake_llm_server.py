@@ -0,0 +1,184 @@
+"""Local stand-in for an OpenAI-compatible chat completions API (the part of OpenRouter the backend uses).
+
+Run with ``python -m benchmarks.fake_llm_server --port 8766`` and set
+``OPENROUTER_BASE_URL=http://127.0.0.1:8766/v1``. Every request waits ``--latency`` seconds before the
+first token and then emits tokens at ``--tokens-per-second``. Agent requests that offer the
+``--tool`` tool call it on ``--tool-call-rate`` of turns; structured-output requests get a valid
+``LLMOutputBlock``.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+from fastapi import FastAPI, Request # type: ignore
+from fastapi.responses import JSONResponse, StreamingResponse # type: ignore
+
+WORDS = ("the", "agent", "answered", "with", "a", "short", "benchmark", "reply", "about", "your", "question")
+
+
+def _last_user_text(messages: List[Dict[str, Any]]) -> str:
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            content = message.get("content")
+            if isinstance(content, list):
+                return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+            return content or ""
+    return ""
+
+
+def _sample_arguments(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Fills the required arguments of a tool schema with placeholder values."""
+    samples = {"string": "benchmark", "integer": 1, "number": 1.0, "boolean": True, "array": [], "object": {}}
+    properties = schema.get("properties") or {}
+    required = schema.get("required") or list(properties)
+    return {name: samples.get(properties.get(name, {}).get("type"), "benchmark") for name in required}
+
+
+def _output_block(query: str, text: str) -> Dict[str, Any]:
+    return {"blocks": [{"block_type": "text", "text": text}], "query": query}
+
+
+class FakeCompletions:
+    def __init__(self, latency: float, tokens_per_second: float, answer_tokens: int, tool: str, tool_call_rate: float, seed: int):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+        self.tool = tool
+        self.tool_call_rate = tool_call_rate
+        self._random = random.Random(seed)
+        self.requests = 0
+
+    def plan(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Decides what the reply contains: ``{"content": str}`` or ``{"tool_call": (name, arguments)}``."""
+        messages = body.get("messages") or []
+        query = _last_user_text(messages)
+        answer = " ".join(WORDS[i % len(WORDS)] for i in range(self.answer_tokens))
+
+        # Structured output through response_format (json_schema) or a forced function call
+        response_format = body.get("response_format") or {}
+        if response_format.get("type") in ("json_schema", "json_object"):
+            return {"content": json.dumps(_output_block(query, answer))}
+        tool_choice = body.get("tool_choice")
+        if isinstance(tool_choice, dict) and tool_choice.get("type") == "function":
+            return {"tool_call": (tool_choice["function"]["name"], _output_block(query, answer))}
+
+        # Agent turn: call the benchmark tool once, then answer from its result
+        tools = {tool["function"]["name"]: tool["function"] for tool in body.get("tools") or [] if tool.get("type") == "function"}
+        after_tool = bool(messages) and messages[-1].get("role") == "tool"
+        if self.tool in tools and not after_tool and self._random.random() < self.tool_call_rate:
+            return {"tool_call": (self.tool, _sample_arguments(tools[self.tool].get("parameters") or {}))}
+        return {"content": answer}
+
+    async def _pace(self, tokens: int):
+        if self.tokens_per_second > 0:
+            await asyncio.sleep(tokens / self.tokens_per_second)
+
+    def _usage(self, body: Dict[str, Any], completion_tokens: int) -> Dict[str, int]:
+        prompt_tokens = len(json.dumps(body.get("messages") or [])) // 4
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+    async def complete(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        self.requests += 1
+        plan = self.plan(body)
+        await asyncio.sleep(self.latency)
+        message: Dict[str, Any] = {"role": "assistant", "content": plan.get("content")}
+        completion_tokens = len((plan.get("content") or "").split())
+        finish_reason = "stop"
+        if "tool_call" in plan:
+            name, arguments = plan["tool_call"]
+            message["tool_calls"] = [{"id": f"call_{uuid.uuid4().hex[:12]}", "type": "function", "function": {"name": name, "arguments": json.dumps(arguments)}}]
+            completion_tokens = len(json.dumps(arguments)) // 4
+            finish_reason = "tool_calls"
+        await self._pace(completion_tokens)
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": self._usage(body, completion_tokens),
+        }
+
+    async def stream(self, body: Dict[str, Any]):
+        self.requests += 1
+        plan = self.plan(body)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None, **extra: Any) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "fake"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                **extra,
+            }
+            return f"data: {json.dumps(payload)}\n\n"
+
+        await asyncio.sleep(self.latency)
+        yield chunk({"role": "assistant", "content": ""})
+        completion_tokens = 0
+        if "tool_call" in plan:
+            name, arguments = plan["tool_call"]
+            yield chunk({"tool_calls": [{"index": 0, "id": f"call_{uuid.uuid4().hex[:12]}", "type": "function", "function": {"name": name, "arguments": json.dumps(arguments)}}]})
+            completion_tokens = len(json.dumps(arguments)) // 4
+            finish_reason = "tool_calls"
+        else:
+            for i, word in enumerate(plan["content"].split(" ")):
+                await self._pace(1)
+                yield chunk({"content": word if i == 0 else f" {word}"})
+                completion_tokens += 1
+            finish_reason = "stop"
+        yield chunk({}, finish_reason)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            payload = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                       "model": body.get("model", "fake"), "choices": [], "usage": self._usage(body, completion_tokens)}
+            yield f"data: {json.dumps(payload)}\n\n"
+        yield "data: [DONE]\n\n"
+
+
+def build_app(completions: FakeCompletions) -> FastAPI:
+    app = FastAPI(title="Fake OpenAI-compatible LLM")
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        if body.get("stream"):
+            return StreamingResponse(completions.stream(body), media_type="text/event-stream")
+        return JSONResponse(await completions.complete(body))
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "fake", "object": "model"}]}
+
+    @app.get("/stats")
+    async def stats():
+        return {"requests": completions.requests}
+
+    return app
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Run a stand-in OpenAI-compatible chat completions server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds before the first token of every reply.")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="Generation speed after the first token (0 = instant).")
+    parser.add_argument("--answer-tokens", type=int, default=40, help="Words in every plain-text answer.")
+    parser.add_argument("--tool", default="echo", help="Tool the agent is asked to call when the request offers it.")
+    parser.add_argument("--tool-call-rate", type=float, default=0.5, help="Fraction of agent turns that call --tool first.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    import uvicorn # type: ignore
+    completions = FakeCompletions(args.latency, args.tokens_per_second, args.answer_tokens, args.tool, args.tool_call_rate, args.seed)
+    uvicorn.run(build_app(completions), host=args.host, port=args.port, log_level="warning")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,44 @@
+"""Local stand-in MCP server (streamable HTTP) for exercising the MCP connection pool and benchmarks.
+
+Run with ``python -m benchmarks.fake_mcp_server --port 8765`` and point a user's MCP config at
+``{"bench": {"transport": "streamable_http", "url": "http://127.0.0.1:8765/mcp"}}``.
+"""
+import argparse
+import asyncio
+import sys
+from typing import List
+from mcp.server.fastmcp import FastMCP # type: ignore
+
+
+def build_server(host: str, port: int, latency: float) -> FastMCP:
+    server = FastMCP("bench", host=host, port=port)
+
+    @server.tool()
+    async def echo(text: str) -> str:
+        """Returns the given text unchanged."""
+        if latency:
+            await asyncio.sleep(latency)
+        return text
+
+    @server.tool()
+    async def word_count(text: str) -> int:
+        """Counts the words in the given text."""
+        if latency:
+            await asyncio.sleep(latency)
+        return len(text.split())
+
+    return server
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Run a stand-in MCP server over streamable HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to sleep in every tool call.")
+    args = parser.parse_args(argv)
+    build_server(args.host, args.port, args.latency).run(transport="streamable-http")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,90 @@
+"""In-process stand-ins for the upstream services used by the agent benchmarks."""
+import asyncio
+import json
+from typing import Any, AsyncIterator, List, Optional
+from langchain_core.callbacks import CallbackManagerForLLMRun, AsyncCallbackManagerForLLMRun # type: ignore
+from langchain_core.language_models.chat_models import BaseChatModel # type: ignore
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage # type: ignore
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult # type: ignore
+from langchain_core.runnables import RunnableLambda # type: ignore
+from langchain.tools import Tool # type: ignore
+from core.schemas import LLMOutputBlock, TextBlock
+
+
+def tool_call_message(tool_name: str, query: str, call_id: str = "call_0") -> AIMessage:
+    """An assistant message asking the agent to call ``tool_name`` with a single string argument."""
+    return AIMessage(
+        content="",
+        tool_calls=[{"name": tool_name, "args": {"__arg1": query}, "id": call_id}],
+        additional_kwargs={
+            "tool_calls": [{
+                "id": call_id,
+                "type": "function",
+                "function": {"name": tool_name, "arguments": f'{{"__arg1": "{query}"}}'},
+            }]
+        },
+    )
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Chat model that replays a fixed list of responses and counts every call."""
+
+    responses: List[AIMessage]
+    latency: float = 0.0
+    calls: int = 0
+    format_calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        message = self.responses[self.calls % len(self.responses)]
+        self.calls += 1
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._generate(messages, stop=stop, **kwargs)
+
+    def with_structured_output(self, schema: Any, **kwargs: Any):
+        async def _format(prompt: Any) -> LLMOutputBlock:
+            self.format_calls += 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return LLMOutputBlock(blocks=[TextBlock(text=str(prompt)[-200:])], query="")
+        return RunnableLambda(_format)
+
+
+class StreamingScriptedChatModel(ScriptedChatModel):
+    """``ScriptedChatModel`` that streams each response as one chunk, so it emits ``on_chat_model_stream`` events."""
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        message = (await self._agenerate(messages, stop=stop, **kwargs)).generations[0].message
+        chunk = ChatGenerationChunk(message=AIMessageChunk(
+            content=message.content,
+            additional_kwargs=message.additional_kwargs,
+            tool_call_chunks=[
+                {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": index}
+                for index, call in enumerate(message.tool_calls)
+            ],
+        ))
+        if run_manager:
+            await run_manager.on_llm_new_token(message.content, chunk=chunk)
+        yield chunk
+
+
+class CountingTool:
+    """Wraps a trivial echo tool and counts how often the agent executes it."""
+
+    def __init__(self, name: str = "echo"):
+        self.name = name
+        self.calls = 0
+
+    def _run(self, query: str) -> str:
+        self.calls += 1
+        return f"echo: {query}"
+
+    def as_tool(self) -> Tool:
+        return Tool(name=self.name, func=self._run, description="Echoes the query back.")
@@ -0,0 +1,380 @@
+"""End-to-end load benchmark for the API.
+
+Boots ``main:app`` under uvicorn against local stand-ins: the fake OpenAI-compatible LLM
+(``benchmarks.fake_llm_server``), the fake MCP server (``benchmarks.fake_mcp_server``) and an
+embedded Chroma in a temporary directory, with a fresh SQLite database. It then drives the
+register, login, create-session, chat and list workloads phase by phase at the given concurrency
+and reports p50/p95/p99 latency, throughput and server RSS for each endpoint.
+
+Run from the backend directory::
+
+    python -m benchmarks.run --users 50 --concurrency 10 --turns 3
+    python -m benchmarks.run --save-baseline         # store the results as the baseline
+    python -m benchmarks.run --compare               # exit 1 when p95 or throughput regress
+
+The baseline is machine specific; record it on the machine that runs the comparison.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import httpx # type: ignore
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE_PATH = os.path.join(BACKEND_DIR, "benchmarks", "baseline.json")
+
+
+@dataclass
+class PhaseResult:
+    name: str
+    latencies: List[float] = field(default_factory=list)
+    errors: int = 0
+    wall_seconds: float = 0.0
+    rss_peak_mb: float = 0.0
+    rss_end_mb: float = 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        ordered = sorted(self.latencies)
+        return {
+            "requests": len(ordered) + self.errors,
+            "errors": self.errors,
+            "p50_ms": percentile(ordered, 50) * 1000,
+            "p95_ms": percentile(ordered, 95) * 1000,
+            "p99_ms": percentile(ordered, 99) * 1000,
+            "throughput_rps": len(ordered) / self.wall_seconds if self.wall_seconds else 0.0,
+            "rss_peak_mb": self.rss_peak_mb,
+            "rss_end_mb": self.rss_end_mb,
+        }
+
+
+def percentile(ordered: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def read_rss_mb(pid: int) -> float:
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_for_port(port: int, process: subprocess.Popen, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Process {process.args} exited with code {process.returncode}.")
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f"Nothing listening on port {port} after {timeout:.0f}s.")
+
+
+class Services:
+    """Starts the stand-in upstreams and the API as subprocesses and stops them on exit."""
+
+    def __init__(self, args: argparse.Namespace, workdir: str):
+        self.args = args
+        self.workdir = workdir
+        self.llm_port = free_port()
+        self.mcp_port = free_port()
+        self.api_port = free_port()
+        self.processes: List[subprocess.Popen] = []
+        self.api: Optional[subprocess.Popen] = None
+
+    def _spawn(self, argv: List[str], cwd: str, env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+        log = open(os.path.join(self.workdir, f"{argv[2].split('.')[-1]}.log"), "w")
+        process = subprocess.Popen(argv, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+        self.processes.append(process)
+        return process
+
+    async def start(self):
+        args = self.args
+        llm = self._spawn([
+            sys.executable, "-m", "benchmarks.fake_llm_server", "--port", str(self.llm_port),
+            "--latency", str(args.llm_latency), "--tokens-per-second", str(args.tokens_per_second),
+            "--answer-tokens", str(args.answer_tokens), "--tool-call-rate", str(args.tool_call_rate),
+        ], cwd=BACKEND_DIR)
+        mcp = self._spawn([
+            sys.executable, "-m", "benchmarks.fake_mcp_server", "--port", str(self.mcp_port),
+            "--latency", str(args.mcp_latency),
+        ], cwd=BACKEND_DIR)
+        await wait_for_port(self.llm_port, llm, timeout=30)
+        await wait_for_port(self.mcp_port, mcp, timeout=30)
+
+        # The API runs in the temp directory so the embedded Chroma, SQLite file and caches stay isolated
+        env = {
+            **os.environ,
+            "PYTHONPATH": BACKEND_DIR,
+            "ENV": "local",
+            "DATABASE_URL": f"sqlite+aiosqlite:///{os.path.join(self.workdir, 'bench.db')}",
+            "OPENROUTER_API_KEY": "benchmark",
+            "OPENROUTER_BASE_URL": f"http://127.0.0.1:{self.llm_port}/v1",
+            "MCP_SCHEMA_CACHE_DIR": os.path.join(self.workdir, "mcp_cache"),
+            "RAG_VERSIONS_PATH": os.path.join(self.workdir, "rag_versions.json"),
+            "EMBEDDING_CACHE_PATH": os.path.join(self.workdir, "embedding_cache.sqlite3"),
+            "EMBEDDING_WARMUP": "true" if args.embedding_warmup else "false",
+            "RESPONSE_CACHE_ENABLED": "true" if args.response_cache else "false",
+        }
+        self.api = self._spawn([
+            sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(self.api_port),
+            "--log-level", "warning",
+        ], cwd=self.workdir, env=env)
+        await wait_for_port(self.api_port, self.api, timeout=args.startup_timeout)
+
+    def stop(self):
+        for process in reversed(self.processes):
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def mcp_config(self) -> Dict[str, Any]:
+        # A placeholder Authorization header marks the server as configured for setup_tools
+        return {"bench": {
+            "transport": "streamable_http",
+            "url": f"http://127.0.0.1:{self.mcp_port}/mcp",
+            "headers": {"Authorization": "Bearer benchmark"},
+        }}
+
+
+@dataclass
+class VirtualUser:
+    username: str
+    password: str
+    token: Optional[str] = None
+    session_id: Optional[str] = None
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.token}"}
+
+
+async def run_phase(name: str, jobs: List[Callable[[], Awaitable[httpx.Response]]], concurrency: int, pid: int) -> PhaseResult:
+    result = PhaseResult(name)
+    semaphore = asyncio.Semaphore(concurrency)
+    sampling = True
+
+    async def sample_rss():
+        while sampling:
+            result.rss_peak_mb = max(result.rss_peak_mb, read_rss_mb(pid))
+            await asyncio.sleep(0.1)
+
+    async def timed(job: Callable[[], Awaitable[httpx.Response]]):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await job()
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                result.latencies.append(time.perf_counter() - started)
+            else:
+                result.errors += 1
+
+    sampler = asyncio.create_task(sample_rss())
+    started = time.perf_counter()
+    await asyncio.gather(*(timed(job) for job in jobs))
+    result.wall_seconds = time.perf_counter() - started
+    sampling = False
+    await sampler
+    result.rss_end_mb = read_rss_mb(pid)
+    result.rss_peak_mb = max(result.rss_peak_mb, result.rss_end_mb)
+    return result
+
+
+async def drive(client: httpx.AsyncClient, services: Services, args: argparse.Namespace) -> List[PhaseResult]:
+    run_id = uuid.uuid4().hex[:8]
+    users = [VirtualUser(f"bench-{run_id}-{i}", "benchmark-password") for i in range(args.users)]
+    pid = services.api.pid
+    results: List[PhaseResult] = []
+
+    def register(user: VirtualUser):
+        return lambda: client.post("/auth/register", json={"username": user.username, "password": user.password})
+
+    def login(user: VirtualUser):
+        async def _login():
+            response = await client.post("/auth/login", data={"username": user.username, "password": user.password})
+            if response.status_code == 200:
+                user.token = response.json()["access_token"]
+            return response
+        return _login
+
+    def update_mcp_config(user: VirtualUser):
+        return lambda: client.put("/users/me/mcp-config", json=services.mcp_config(), headers=user.headers)
+
+    def create_session(user: VirtualUser):
+        async def _create():
+            response = await client.post("/sessions/", json={"initial_message": "Hello, what can you do?"}, headers=user.headers)
+            if response.status_code == 201:
+                user.session_id = response.json()["id"]
+            return response
+        return _create
+
+    def chat(user: VirtualUser, turn: int):
+        return lambda: client.post("/sessions/chat", json={"session_id": user.session_id, "content": f"Question {turn}: echo this back"}, headers=user.headers)
+
+    def list_sessions(user: VirtualUser):
+        return lambda: client.get("/sessions/user/", headers=user.headers)
+
+    results.append(await run_phase("register", [register(u) for u in users], args.concurrency, pid))
+    results.append(await run_phase("login", [login(u) for u in users], args.concurrency, pid))
+    users = [u for u in users if u.token]
+    results.append(await run_phase("update_mcp_config", [update_mcp_config(u) for u in users], args.concurrency, pid))
+    results.append(await run_phase("create_session", [create_session(u) for u in users], args.concurrency, pid))
+    users = [u for u in users if u.session_id]
+    # Turns of one user run one after another, like a real conversation; users run concurrently
+    chat_result = PhaseResult("chat")
+    for turn in range(args.turns):
+        turn_result = await run_phase("chat", [chat(u, turn) for u in users], args.concurrency, pid)
+        chat_result.latencies.extend(turn_result.latencies)
+        chat_result.errors += turn_result.errors
+        chat_result.wall_seconds += turn_result.wall_seconds
+        chat_result.rss_peak_mb = max(chat_result.rss_peak_mb, turn_result.rss_peak_mb)
+        chat_result.rss_end_mb = turn_result.rss_end_mb
+    results.append(chat_result)
+    results.append(await run_phase("list_sessions", [list_sessions(u) for u in users], args.concurrency, pid))
+    return results
+
+
+def print_report(summaries: Dict[str, Dict[str, Any]], baseline: Optional[Dict[str, Dict[str, Any]]]):
+    header = f"{'endpoint':<18}{'reqs':>6}{'errs':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}{'rss MB':>9}"
+    if baseline:
+        header += f"{'p95 Δ':>9}{'req/s Δ':>9}"
+    print(header)
+    for name, s in summaries.items():
+        line = (f"{name:<18}{s['requests']:>6}{s['errors']:>6}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}"
+                f"{s['p99_ms']:>10.1f}{s['throughput_rps']:>9.1f}{s['rss_peak_mb']:>9.1f}")
+        if baseline and name in baseline:
+            line += f"{_change(baseline[name]['p95_ms'], s['p95_ms']):>9}{_change(baseline[name]['throughput_rps'], s['throughput_rps']):>9}"
+        print(line)
+
+
+def _change(before: float, after: float) -> str:
+    return f"{(after - before) / before * 100:+.0f}%" if before else "n/a"
+
+
+def find_regressions(summaries: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], tolerance: float) -> List[str]:
+    regressions = []
+    for name, s in summaries.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if base["p95_ms"] and s["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base['p95_ms']:.1f} -> {s['p95_ms']:.1f} ms")
+        if base["throughput_rps"] and s["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base['throughput_rps']:.1f} -> {s['throughput_rps']:.1f} req/s")
+        if s["errors"] > base["errors"]:
+            regressions.append(f"{name}: errors {base['errors']} -> {s['errors']}")
+    return regressions
+
+
+async def run(args: argparse.Namespace) -> int:
+    with tempfile.TemporaryDirectory(prefix="agent-bench-") as workdir:
+        services = Services(args, workdir)
+        try:
+            await services.start()
+            print(f"🚀 API up on port {services.api_port} (RSS {read_rss_mb(services.api.pid):.1f} MB); "
+                  f"{args.users} users, concurrency {args.concurrency}, {args.turns} chat turns each.")
+            timeout = httpx.Timeout(args.request_timeout)
+            limits = httpx.Limits(max_connections=args.concurrency * 2)
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{services.api_port}/api/v1", timeout=timeout, limits=limits) as client:
+                results = await drive(client, services, args)
+        except Exception:
+            print(f"❌ Benchmark failed; service logs are in {workdir} until exit:")
+            for log_name in sorted(os.listdir(workdir)):
+                if log_name.endswith(".log"):
+                    with open(os.path.join(workdir, log_name), "r") as f:
+                        print(f"--- {log_name} ---\n{f.read()[-4000:]}")
+            raise
+        finally:
+            services.stop()
+
+    summaries = {result.name: result.summary() for result in results}
+    baseline = None
+    if args.compare and os.path.exists(args.baseline):
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f).get("results")
+    print_report(summaries, baseline)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": platform.platform(),
+        "python": platform.python_version(),
+        "parameters": {key: value for key, value in vars(args).items() if key not in ("save_baseline", "compare", "baseline", "output")},
+        "results": summaries,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Baseline saved to {args.baseline}.")
+
+    if args.compare:
+        if baseline is None:
+            print(f"⚠️ No baseline at {args.baseline}; run with --save-baseline first.")
+            return 1
+        regressions = find_regressions(summaries, baseline, args.tolerance)
+        if regressions:
+            print("❌ Regressions against the baseline:\n  " + "\n  ".join(regressions))
+            return 1
+        print("✅ No regressions against the baseline.")
+    return 0
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Load-test the API against local LLM, MCP and Chroma stand-ins.")
+    parser.add_argument("--users", type=int, default=20, help="Virtual users; each registers, logs in and opens one session.")
+    parser.add_argument("--concurrency", type=int, default=10, help="Requests in flight at once.")
+    parser.add_argument("--turns", type=int, default=3, help="Chat turns per user after the first message.")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Fake LLM time to first token in seconds.")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="Fake LLM generation speed.")
+    parser.add_argument("--answer-tokens", type=int, default=40)
+    parser.add_argument("--tool-call-rate", type=float, default=0.5, help="Fraction of turns that call the fake MCP echo tool.")
+    parser.add_argument("--mcp-latency", type=float, default=0.02, help="Fake MCP tool latency in seconds.")
+    parser.add_argument("--embedding-warmup", action="store_true", help="Load the embedding model at startup.")
+    parser.add_argument("--response-cache", action="store_true", help="Enable the semantic response cache.")
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--request-timeout", type=float, default=120.0)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH, help="Baseline file to save or compare against.")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the baseline.")
+    parser.add_argument("--compare", action="store_true", help="Compare against the baseline and exit 1 on regressions.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative p95/throughput change before a regression.")
+    parser.add_argument("--output", help="Also write the full report to this JSON file.")
+    args = parser.parse_args(argv)
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -1,3 +1,4 @@
+import json
 import os
 from dotenv import load_dotenv
 
@@ -10,6 +11,26 @@ ENV = os.getenv("ENV", "development")
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL")
 LLM_MODEL_NAME = "x-ai/grok-4.1-fast:free"
+LLM_STREAMING = os.getenv("LLM_STREAMING", "true").lower() == "true"
+FORMATTER_MODEL_NAME = os.getenv("FORMATTER_MODEL_NAME") # Optional cheaper model for the structured-output call
+
+# --- LLM Resilience ---
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3")) # Per model, for 429s, 5xx, timeouts and connection errors
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "20"))
+LLM_FALLBACK_MODELS = [model.strip() for model in os.getenv("LLM_FALLBACK_MODELS", "").split(",") if model.strip()] # Tried in order
+LLM_RATE_LIMIT_RPS = float(os.getenv("LLM_RATE_LIMIT_RPS", "0")) # Calls per second for the whole process; 0 = unlimited
+LLM_RATE_LIMIT_BURST = int(os.getenv("LLM_RATE_LIMIT_BURST", "20"))
+LLM_USER_RATE_LIMIT_RPS = float(os.getenv("LLM_USER_RATE_LIMIT_RPS", "0")) # Calls per second per user; 0 = unlimited
+LLM_USER_RATE_LIMIT_BURST = int(os.getenv("LLM_USER_RATE_LIMIT_BURST", "10"))
+LLM_USER_BUCKETS_MAX = int(os.getenv("LLM_USER_BUCKETS_MAX", "10000"))
+LLM_RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv("LLM_RATE_LIMIT_MAX_WAIT_SECONDS", "10")) # Longer waits fail fast with 503
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32")) # Upper bound of the adaptive concurrency limit
+LLM_MIN_CONCURRENCY = int(os.getenv("LLM_MIN_CONCURRENCY", "2"))
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true" # Hedges cost extra tokens
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95")) # Hedge calls (streams: their first chunk) slower than this latency quantile
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
 
 # --- MCP Server Configuration ---
 MCP_SERVERS = {
@@ -22,6 +43,12 @@ MCP_SERVERS = {
     }
 }
 
+# --- MCP Connection Pool ---
+MCP_SCHEMA_CACHE_DIR = os.getenv("MCP_SCHEMA_CACHE_DIR", "./.mcp_cache")
+MCP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("MCP_CONNECT_TIMEOUT_SECONDS", "15"))
+MCP_KEEPALIVE_SECONDS = float(os.getenv("MCP_KEEPALIVE_SECONDS", "30"))
+MCP_RECONNECT_MAX_BACKOFF_SECONDS = float(os.getenv("MCP_RECONNECT_MAX_BACKOFF_SECONDS", "60"))
+
 # --- Database Configuration ---
 if ENV == "local":
     DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./local.db")
@@ -32,17 +59,106 @@ else:
 CHROMA_HOST = os.getenv("CHROMA_HOST", "localhost")
 CHROMA_PORT = os.getenv("CHROMA_PORT", "8001")
 CHROMA_PERSIST_DIRECTORY = "./chroma_db" if ENV == "local" else None
+CHROMA_HEALTH_TTL_SECONDS = float(os.getenv("CHROMA_HEALTH_TTL_SECONDS", "30"))
+
+# --- Vector Store ---
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "chroma").lower() # "chroma" or "mmap" (in-process, no server)
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "vector_index"))
+VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float32").lower() # "float32" or "int8" (4x smaller, slightly less exact)
+VECTOR_HNSW_MIN_SIZE = int(os.getenv("VECTOR_HNSW_MIN_SIZE", "50000")) # Namespaces this large get an HNSW index (needs hnswlib)
+VECTOR_HNSW_EF_SEARCH = int(os.getenv("VECTOR_HNSW_EF_SEARCH", "64"))
+INGEST_MANIFEST_DIR = os.getenv("INGEST_MANIFEST_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "ingest_manifests")) # Per-source chunk manifests for incremental ingestion
+
+# --- Embedding Configuration ---
+EMBEDDING_WARMUP = os.getenv("EMBEDDING_WARMUP", "true").lower() == "true"
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))
+EMBEDDING_MAX_BATCH_SIZE = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "32"))
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true" # On-disk cache shared with ingestion
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "embedding_cache.sqlite3"))
+EMBEDDING_CACHE_MAX_MB = float(os.getenv("EMBEDDING_CACHE_MAX_MB", "512"))
+
+# --- RAG Retrieval ---
+# "search": one RAG_search tool returning ranked passages from every source. "per_source": a RAG_<source>
+# tool per source that answers with its own LLM call (the original behaviour)
+RAG_TOOL_MODE = os.getenv("RAG_TOOL_MODE", "search").lower()
+RAG_SEARCH_K = int(os.getenv("RAG_SEARCH_K", "8")) # Passages returned after merging
+RAG_SEARCH_K_PER_NAMESPACE = int(os.getenv("RAG_SEARCH_K_PER_NAMESPACE", "6"))
+RAG_MMR_ENABLED = os.getenv("RAG_MMR_ENABLED", "false").lower() == "true" # Re-rank for diversity (re-embeds the candidates)
+RAG_MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.5")) # 1 = relevance only, 0 = diversity only
+RAG_CONTEXT_MAX_CHARS = int(os.getenv("RAG_CONTEXT_MAX_CHARS", "8000"))
 
 # --- Security/Authentication --- 
 SECRET_KEY = os.getenv("SECRET_KEY", "a_very_secret_key_that_should_be_changed")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 3000
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12")) # Existing hashes with another cost are rehashed on login
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64")) # Queued + running hashes before 503s
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "30")) # Bounds staleness across worker processes
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "10000"))
 
 
 SQLALCHEMY_ECHO = os.getenv("SQLALCHEMY_ECHO", "false").lower() == "true"
 
 # --- Agent Configuration ---
+AGENT_VERBOSE = os.getenv("AGENT_VERBOSE", "false").lower() == "true"
 AGENT_CACHE_SIZE = int(os.getenv("AGENT_CACHE_SIZE", "100")) # Default to 100 users
+AGENT_CACHE_TTL_SECONDS = float(os.getenv("AGENT_CACHE_TTL_SECONDS", "3600")) # Rebuild agents (and re-list MCP tools) at least hourly
+AGENT_CACHE_IDLE_SECONDS = float(os.getenv("AGENT_CACHE_IDLE_SECONDS", "900"))
+AGENT_REFRESH_AHEAD_SECONDS = float(os.getenv("AGENT_REFRESH_AHEAD_SECONDS", "120")) # Background rebuild window before TTL expiry
+AGENT_CACHE_SWEEP_SECONDS = float(os.getenv("AGENT_CACHE_SWEEP_SECONDS", "60"))
+AGENT_CLOSE_GRACE_SECONDS = float(os.getenv("AGENT_CLOSE_GRACE_SECONDS", "30")) # Let in-flight turns finish before closing MCP clients
+AGENT_MAX_ITERATIONS = int(os.getenv("AGENT_MAX_ITERATIONS", "10")) # Agent steps (LLM call + tool calls) per turn
+AGENT_MAX_EXECUTION_SECONDS = float(os.getenv("AGENT_MAX_EXECUTION_SECONDS", "120")) # Checked between steps; the agent then answers with what it has
+AGENT_MAX_PARALLEL_TOOLS = int(os.getenv("AGENT_MAX_PARALLEL_TOOLS", "4")) # Tool calls of one turn running at once
+AGENT_TOOL_TIMEOUT_SECONDS = float(os.getenv("AGENT_TOOL_TIMEOUT_SECONDS", "60"))
+AGENT_TOOL_TIMEOUTS = json.loads(os.getenv("AGENT_TOOL_TIMEOUTS", "{}")) # Per-tool overrides by name pattern, e.g. {"RAG_*": 20}
+AGENT_TOOL_THREADS = int(os.getenv("AGENT_TOOL_THREADS", "8")) # Threads for tools that only have a sync implementation
+
+# "auto": format locally unless the answer is chart-worthy, "format": always call the formatter LLM,
+# "direct": the agent returns LLMOutputBlock content itself through a final_answer tool
+AGENT_OUTPUT_MODE = os.getenv("AGENT_OUTPUT_MODE", "auto").lower()
+FORMAT_NUMBER_THRESHOLD = int(os.getenv("FORMAT_NUMBER_THRESHOLD", "8")) # Numbers in an answer before it is treated as chart-worthy
+
+# --- Semantic Response Cache ---
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "86400"))
+RESPONSE_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("RESPONSE_CACHE_SIMILARITY_THRESHOLD", "0.92"))
+RAG_VERSIONS_PATH = os.getenv("RAG_VERSIONS_PATH", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "rag_versions.json"))
+
+# --- Conversation Memory Configuration ---
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "3000")) # Verbatim history tokens sent to the agent
+MEMORY_RECENT_TOKENS = int(os.getenv("MEMORY_RECENT_TOKENS", "1500")) # Tokens kept verbatim when older turns are summarized
+MEMORY_MAX_TAIL_MESSAGES = int(os.getenv("MEMORY_MAX_TAIL_MESSAGES", "50"))
+MEMORY_SUMMARY_BATCH_MESSAGES = int(os.getenv("MEMORY_SUMMARY_BATCH_MESSAGES", "40")) # Messages folded per summarization call
+MEMORY_SUMMARIES_ENABLED = os.getenv("MEMORY_SUMMARIES_ENABLED", "true").lower() == "true"
+
+# --- Chat Turn Coordination ---
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400")) # How long Idempotency-Key results are replayed
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+SESSION_MAX_QUEUED_TURNS = int(os.getenv("SESSION_MAX_QUEUED_TURNS", "4")) # Turns waiting behind the running one before 429s
+TURN_TIMEOUT_SECONDS = float(os.getenv("TURN_TIMEOUT_SECONDS", "180")) # Hard wall-clock cap; the turn is cancelled and kept as a partial answer
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", "1")) # How often a non-streaming turn checks that its client is still connected
+
+# --- Background Jobs ---
+# "memory": in-process queue, lost on restart. "sql": the chat_jobs table in DATABASE_URL, which
+# survives restarts and lets several app processes share one queue
+JOB_QUEUE_BACKEND = os.getenv("JOB_QUEUE_BACKEND", "memory").lower()
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2")) # Background turns running at once per process
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "100")) # Queued jobs before submissions get 429s
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2")) # How often idle workers look for jobs submitted elsewhere
+JOB_STALE_SWEEP_SECONDS = float(os.getenv("JOB_STALE_SWEEP_SECONDS", "60")) # How often a runner requeues jobs of dead processes
+JOB_TIMEOUT_SECONDS = float(os.getenv("JOB_TIMEOUT_SECONDS", "1800")) # Wall-clock budget of a background turn
+JOB_MAX_ITERATIONS = int(os.getenv("JOB_MAX_ITERATIONS", "40"))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", "86400")) # Finished jobs kept by the memory backend
+JOB_EVENTS_RETENTION_SECONDS = float(os.getenv("JOB_EVENTS_RETENTION_SECONDS", "300")) # Progress events replayable after a job ends
+
+# --- Pagination ---
+MESSAGE_PAGE_SIZE = int(os.getenv("MESSAGE_PAGE_SIZE", "50")) # Latest messages returned when opening a session
+SESSION_PAGE_SIZE = int(os.getenv("SESSION_PAGE_SIZE", "20"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "200"))
+SESSION_PREVIEW_CHARS = int(os.getenv("SESSION_PREVIEW_CHARS", "120"))
 
 # --- Default User MCP Config ---
 DEFAULT_MCP_CONFIG = {
@@ -1,4 +1,5 @@
 import os
+from sqlalchemy import inspect, text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
 from core.config import DATABASE_URL, SQLALCHEMY_ECHO
@@ -20,6 +21,28 @@ AsyncSessionLocal = async_sessionmaker(
     expire_on_commit=False
 )
 
+# --- Schema Maintenance ---
+def ensure_columns(sync_conn):
+    """Adds model columns missing from existing tables as plain nullable columns (no data is migrated)."""
+    inspector = inspect(sync_conn)
+    existing_tables = set(inspector.get_table_names())
+    quote = sync_conn.dialect.identifier_preparer.quote
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        present = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in present:
+                column_type = column.type.compile(dialect=sync_conn.dialect)
+                sync_conn.execute(text(f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column_type}"))
+                print(f"✅ Added column {table.name}.{column.name}.")
+
+def ensure_indexes(sync_conn):
+    """Creates declared indexes missing from existing tables (``create_all`` only indexes new tables)."""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
 # --- Dependency ---
 # Dependency function to get an async database session
 async def get_db_session():
@@ -0,0 +1,139 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+from uuid import UUID
+import time
+from prometheus_client import Counter, Histogram, REGISTRY # type: ignore
+from prometheus_client.core import GaugeMetricFamily # type: ignore
+from langchain_core.callbacks import AsyncCallbackHandler # type: ignore
+from langchain_core.outputs import LLMResult # type: ignore
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+HTTP_REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+STAGE_LATENCY = Histogram(
+    "request_stage_duration_seconds", "Latency of request stages (auth, history_load, agent_build, format, persist, ...).",
+    ["stage"], buckets=LATENCY_BUCKETS
+)
+LLM_CALL_LATENCY = Histogram(
+    "llm_call_duration_seconds", "Latency of individual LLM calls.",
+    ["model"], buckets=LATENCY_BUCKETS
+)
+# Labelled by kind only: tool names come from users' own MCP configs and would make the series count unbounded
+TOOL_CALL_LATENCY = Histogram(
+    "tool_call_duration_seconds", "Latency of individual tool calls by kind (rag or mcp).",
+    ["kind"], buckets=LATENCY_BUCKETS
+)
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens reported by the LLM provider.", ["model", "type"])
+UPSTREAM_ERRORS = Counter("upstream_errors_total", "Errors returned by upstream services.", ["upstream"])
+LLM_RETRIES = Counter("llm_retries_total", "LLM call retries by failure reason.", ["reason"])
+LLM_FALLBACKS = Counter("llm_fallbacks_total", "LLM calls moved on to a fallback model.", ["model"])
+LLM_HEDGES = Counter("llm_hedged_requests_total", "Hedged LLM requests sent, won by the hedge, and skipped for lack of rate or concurrency room.", ["outcome"])
+LLM_LIMITER_WAIT = Histogram("llm_limiter_wait_seconds", "Time LLM calls waited for the rate and concurrency limits.", buckets=LATENCY_BUCKETS)
+
+# Stages recorded for the current request, as (stage, seconds); None outside a traced request
+_request_trace: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_trace", default=None)
+
+def start_trace() -> List[Tuple[str, float]]:
+    """Starts collecting spans for the current request and returns the list they are appended to."""
+    trace: List[Tuple[str, float]] = []
+    _request_trace.set(trace)
+    return trace
+
+def record_span(stage: str, seconds: float):
+    STAGE_LATENCY.labels(stage=stage).observe(seconds)
+    trace = _request_trace.get()
+    if trace is not None:
+        trace.append((stage, seconds))
+
+@contextmanager
+def span(stage: str):
+    """Times a block of code as a request stage."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(stage, time.perf_counter() - started)
+
+def tool_kind(tool_name: str) -> str:
+    return "rag" if tool_name.startswith("RAG_") else "mcp"
+
+class MetricsCallbackHandler(AsyncCallbackHandler):
+    """Records latency, token usage and errors of every LLM and tool call LangChain makes."""
+
+    def __init__(self):
+        self._llm_starts: Dict[UUID, Tuple[float, str]] = {}
+        self._tool_starts: Dict[UUID, Tuple[float, str]] = {}
+
+    def _start_llm(self, serialized: Optional[Dict[str, Any]], run_id: UUID, kwargs: Dict[str, Any]):
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model") or params.get("model_name") or (serialized or {}).get("name") or "unknown"
+        self._llm_starts[run_id] = (time.perf_counter(), model)
+
+    async def on_chat_model_start(self, serialized: Dict[str, Any], messages: Any, *, run_id: UUID, **kwargs: Any):
+        self._start_llm(serialized, run_id, kwargs)
+
+    async def on_llm_start(self, serialized: Dict[str, Any], prompts: Any, *, run_id: UUID, **kwargs: Any):
+        self._start_llm(serialized, run_id, kwargs)
+
+    async def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any):
+        started, model = self._llm_starts.pop(run_id, (None, "unknown"))
+        if started is not None:
+            elapsed = time.perf_counter() - started
+            LLM_CALL_LATENCY.labels(model=model).observe(elapsed)
+            record_span("llm", elapsed)
+
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+        if not usage:
+            # Streaming responses report usage on the message instead of llm_output
+            for generations in response.generations:
+                for generation in generations:
+                    metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    prompt_tokens += metadata.get("input_tokens", 0)
+                    completion_tokens += metadata.get("output_tokens", 0)
+        if prompt_tokens:
+            LLM_TOKENS.labels(model=model, type="prompt").inc(prompt_tokens)
+        if completion_tokens:
+            LLM_TOKENS.labels(model=model, type="completion").inc(completion_tokens)
+
+    async def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._llm_starts.pop(run_id, None)
+        UPSTREAM_ERRORS.labels(upstream="llm").inc()
+
+    async def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any):
+        self._tool_starts[run_id] = (time.perf_counter(), (serialized or {}).get("name") or "unknown")
+
+    async def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any):
+        started, name = self._tool_starts.pop(run_id, (None, "unknown"))
+        if started is not None:
+            elapsed = time.perf_counter() - started
+            kind = tool_kind(name)
+            TOOL_CALL_LATENCY.labels(kind=kind).observe(elapsed)
+            record_span(f"tool_{kind}", elapsed)
+
+    async def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        _, name = self._tool_starts.pop(run_id, (None, "unknown"))
+        UPSTREAM_ERRORS.labels(upstream=tool_kind(name)).inc()
+
+class _StatsCollector:
+    """Exports the numeric values of a ``stats()`` dict as Prometheus gauges."""
+
+    def __init__(self, prefix: str, stats: Callable[[], Dict[str, Any]]):
+        self._prefix = prefix
+        self._stats = stats
+
+    def collect(self):
+        for key, value in self._stats().items():
+            if isinstance(value, (int, float)):
+                yield GaugeMetricFamily(f"{self._prefix}_{key}", f"{self._prefix} {key.replace('_', ' ')}", value=value)
+
+def register_stats(prefix: str, stats: Callable[[], Dict[str, Any]]):
+    REGISTRY.register(_StatsCollector(prefix, stats))
+
+# Global instance
+metrics_callback = MetricsCallbackHandler()
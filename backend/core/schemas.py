@@ -1,5 +1,6 @@
-from pydantic import BaseModel, Field # type: ignore
-from typing import Optional, List, Dict, Any, Union, Literal
+from pydantic import BaseModel, Field, field_serializer, field_validator # type: ignore
+from typing import Optional, List, Dict, Any, Union, Literal, Mapping
+from types import MappingProxyType
 from datetime import datetime
 
 class UserCreate(BaseModel):
@@ -27,6 +28,42 @@ class UserSchema(BaseModel):
     class Config:
         from_attributes = True
 
+def _freeze(value: Any) -> Any:
+    """Read-only deep copy of JSON-like data: dicts become MappingProxyType, lists become tuples."""
+    if isinstance(value, Mapping):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+def thaw_config(value: Any) -> Any:
+    """Plain, mutable deep copy of a frozen config (e.g. ``UserPrincipal.mcp_config``)."""
+    if isinstance(value, Mapping):
+        return {key: thaw_config(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw_config(item) for item in value]
+    return value
+
+class UserPrincipal(UserSchema):
+    """Immutable snapshot of the authenticated user, shared between requests by the principal cache.
+
+    ``frozen`` only stops field reassignment, so ``mcp_config`` is also stored read-only all the way
+    down; use ``thaw_config`` for a copy that can be changed or handed to libraries.
+    """
+
+    class Config:
+        from_attributes = True
+        frozen = True
+
+    @field_validator("mcp_config")
+    @classmethod
+    def _freeze_mcp_config(cls, value: Optional[Dict[str, Any]]) -> Optional[Mapping[str, Any]]:
+        return _freeze(value) if value is not None else None
+
+    @field_serializer("mcp_config")
+    def _serialize_mcp_config(self, value: Optional[Mapping[str, Any]]) -> Optional[Dict[str, Any]]:
+        return thaw_config(value) if value is not None else None
+
 class TextBlock(BaseModel):
     block_type: Literal["text"] = Field("text", description="Markdown text block best for general information.")
     text: str = Field(..., description="The markdown text content.")
@@ -79,7 +116,12 @@ class ChatSessionResponse(BaseModel):
     title: str
     created_at: datetime
     updated_at: Optional[datetime] = None
+    last_message_at: Optional[datetime] = None
+    message_count: Optional[int] = None
+    last_message_preview: Optional[str] = None
     messages: List[ChatMessageResponse] = Field(..., description="List of messages in the session.")
+    older_cursor: Optional[str] = Field(None, description="Pass as `before` to load older messages; null when there are none.")
+    newer_cursor: Optional[str] = Field(None, description="Pass as `after` to load newer messages; null when there are none.")
 
     class Config:
         from_attributes = True
@@ -92,6 +134,29 @@ class MessageResponse(BaseModel):
     tool_names_used: List[str] = Field(default=[], description="List of tools utilized by the agent.")
     tool_calls: List[ToolCall] = Field(default=[], description="Detailed list of tool calls.")
 
+class JobCreate(BaseModel):
+    """Pydantic model for queueing a message as a background job."""
+    session_id: str = Field(..., description="The ID of the session to which the message is being sent.")
+    content: str = Field(..., description="The content of the message.")
+    priority: int = Field(5, ge=0, le=9, description="0 runs first; jobs of equal priority run in submission order.")
+
+class JobResponse(BaseModel):
+    """Pydantic model for the state of a background job."""
+    id: str
+    session_id: str
+    status: Literal["queued", "running", "succeeded", "failed", "cancelled", "timed_out"]
+    priority: int
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Optional[MessageResponse] = Field(None, description="The finished turn, once the job has succeeded.")
+    error: Optional[str] = None
+    cancel_requested: bool = Field(False, description="A cancel was accepted for the running job; its worker stops it shortly.")
+
+    class Config:
+        from_attributes = True
+
 class SessionListResponse(BaseModel):
     """Pydantic model for listing multiple chat sessions."""
     sessions: List[ChatSessionResponse]
+    next_cursor: Optional[str] = Field(None, description="Pass as `cursor` to load the next page; null on the last page.")
@@ -1,9 +1,49 @@
+from typing import Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 from passlib.context import CryptContext
+from core import config
+from core.metrics import span
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes made with a different cost than BCRYPT_ROUNDS are flagged by needs_update and rehashed on login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=config.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=config.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=config.BCRYPT_ROUNDS,
+)
+
+class PasswordHashBusyError(Exception):
+    """Raised when too many password hash operations are already queued."""
+
+# bcrypt releases the GIL, so a small thread pool keeps hashing off the event loop without blocking it
+_hash_pool = ThreadPoolExecutor(max_workers=config.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_pending = 0
+
+async def _run_in_pool(fn, *args):
+    global _pending
+    if _pending >= config.PASSWORD_HASH_MAX_PENDING:
+        raise PasswordHashBusyError("Too many password hash operations in progress.")
+    _pending += 1
+    try:
+        with span("password_hash"):
+            return await asyncio.get_running_loop().run_in_executor(_hash_pool, fn, *args)
+    finally:
+        _pending -= 1
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
+
+async def averify_and_update(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verifies a password in the hash pool; also returns a new hash when the stored one uses an outdated cost."""
+    return await _run_in_pool(pwd_context.verify_and_update, plain_password, hashed_password)
+
+async def aget_password_hash(password: str) -> str:
+    return await _run_in_pool(pwd_context.hash, password)
+
+def shutdown_hash_pool():
+    _hash_pool.shutdown(wait=False, cancel_futures=True)
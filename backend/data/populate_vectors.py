@@ -1,9 +1,11 @@
 import argparse
 import sys
 import os
+import hashlib
 import json
 import socket
-from typing import List, Dict, Any, Optional, Tuple
+import time
+from typing import List, Dict, Any, Optional, Set, Tuple
 
 from bs4 import BeautifulSoup # type: ignore
 from langchain_community.document_loaders import (
@@ -13,21 +15,30 @@ from langchain_community.document_loaders import (
     RecursiveUrlLoader, # type: ignore
 )
 from langchain_chroma import Chroma # type: ignore
-from langchain_huggingface import HuggingFaceEmbeddings # type: ignore
 from langchain.schema.document import Document # type: ignore
 from langchain_text_splitters import RecursiveCharacterTextSplitter # type: ignore
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.vector_index import MmapVectorIndex # noqa: E402
+from services.embeddings import embedding_engine, EmbeddingEngine # noqa: E402
+# Same settings as the API, so ingestion writes where the API reads
+from core.config import ( # noqa: E402
+    RAG_VERSIONS_PATH,
+    VECTOR_STORE_BACKEND,
+    VECTOR_INDEX_DIR,
+    VECTOR_INDEX_DTYPE,
+    VECTOR_HNSW_MIN_SIZE,
+    INGEST_MANIFEST_DIR,
+)
+
 
-EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 SOURCES_PATH = os.path.join(os.path.dirname(__file__), "sources.json")
+ID_PAGE_SIZE = 1000 # IDs per request when listing, checking or deleting chunks
 
 
-def get_embedding_function():
-    return HuggingFaceEmbeddings(
-        model_name=EMBEDDING_MODEL_NAME,
-        model_kwargs={'device': 'cpu'},
-        encode_kwargs={'normalize_embeddings': True}
-    )
+def get_embedding_function() -> EmbeddingEngine:
+    # The API's engine: same model, and it reads and fills the shared on-disk embedding cache
+    return embedding_engine
 
 
 def _is_chroma_available() -> bool:
@@ -145,41 +156,137 @@ def split_documents(documents: List[Document]) -> List[Document]:
 
 
 def calculate_chunk_ids(chunks: List[Document]) -> List[Document]:
-    last_page_id: str | None = None
-    current_chunk_index = 0
+    """Gives every chunk a content-addressed ID, ``source:page:<hash of the text>``, and drops exact duplicates.
+
+    Editing a chunk changes its ID (so it gets a fresh embedding) while untouched chunks keep theirs even
+    when text before them on the page shifts, which is what lets re-ingestion only touch what changed.
+    """
+    unique: Dict[str, Document] = {}
     for chunk in chunks:
         source = chunk.metadata.get("source")
         page = chunk.metadata.get("page")
-        current_page_id = f"{source}:{page}"
-        if current_page_id == last_page_id:
-            current_chunk_index += 1
-        else:
-            current_chunk_index = 0
-        chunk_id = f"{current_page_id}:{current_chunk_index}"
-        last_page_id = current_page_id
+        digest = hashlib.sha256(chunk.page_content.encode("utf-8")).hexdigest()[:16]
+        chunk_id = f"{source}:{page}:{digest}"
         chunk.metadata["id"] = chunk_id
-    return chunks
-
-
-def add_to_chroma(chunks: List[Document], collection_name: str) -> Tuple[int, int]:
-    db = _get_chroma_client(collection_name=collection_name)
-    chunks_with_ids = calculate_chunk_ids(chunks)
-    existing_items = db.get(include=[])
-    existing_ids = set(existing_items.get("ids", []))
-    new_chunks: List[Document] = [chunk for chunk in chunks_with_ids if chunk.metadata.get("id") not in existing_ids]
-    added = 0
-    if new_chunks:
-        batch_size = 1000
-        for i in range(0, len(new_chunks), batch_size):
-            batch = new_chunks[i:i + batch_size]
-            new_chunk_ids = [chunk.metadata["id"] for chunk in batch]
-            db.add_documents(batch, ids=new_chunk_ids)
-            added += len(batch)
-    return len(existing_ids), added
-
-
-def populate_source(resource_name: str) -> int:
-    if not _is_chroma_available():
+        unique.setdefault(chunk_id, chunk)
+    return list(unique.values())
+
+
+class ChromaChunkStore:
+    def __init__(self, collection_name: str):
+        self.db = _get_chroma_client(collection_name=collection_name)
+
+    def all_ids(self) -> Set[str]:
+        ids: Set[str] = set()
+        offset = 0
+        while True:
+            page = self.db.get(include=[], limit=ID_PAGE_SIZE, offset=offset).get("ids", [])
+            ids.update(page)
+            if len(page) < ID_PAGE_SIZE:
+                return ids
+            offset += ID_PAGE_SIZE
+
+    def missing(self, ids: List[str]) -> List[str]:
+        missing: List[str] = []
+        for start in range(0, len(ids), ID_PAGE_SIZE):
+            page = ids[start:start + ID_PAGE_SIZE]
+            found = set(self.db.get(ids=page, include=[]).get("ids", []))
+            missing.extend(chunk_id for chunk_id in page if chunk_id not in found)
+        return missing
+
+    def apply(self, new_chunks: List[Document], stale_ids: List[str]):
+        for start in range(0, len(new_chunks), ID_PAGE_SIZE):
+            batch = new_chunks[start:start + ID_PAGE_SIZE]
+            self.db.add_documents(batch, ids=[chunk.metadata["id"] for chunk in batch])
+        for start in range(0, len(stale_ids), ID_PAGE_SIZE):
+            self.db.delete(ids=stale_ids[start:start + ID_PAGE_SIZE])
+
+
+class MmapChunkStore:
+    def __init__(self, collection_name: str):
+        self.index = MmapVectorIndex(VECTOR_INDEX_DIR, collection_name)
+
+    def all_ids(self) -> Set[str]:
+        return set(self.index.ids())
+
+    def missing(self, ids: List[str]) -> List[str]:
+        existing = self.all_ids()
+        return [chunk_id for chunk_id in ids if chunk_id not in existing]
+
+    def apply(self, new_chunks: List[Document], stale_ids: List[str]):
+        if not new_chunks and not stale_ids:
+            return
+        texts = [chunk.page_content for chunk in new_chunks]
+        embeddings = get_embedding_function().embed_documents(texts) if texts else []
+        self.index.add(
+            [chunk.metadata["id"] for chunk in new_chunks],
+            texts,
+            [chunk.metadata for chunk in new_chunks],
+            embeddings,
+            delete_ids=stale_ids,
+            dtype=VECTOR_INDEX_DTYPE,
+            hnsw_min_size=VECTOR_HNSW_MIN_SIZE,
+        )
+
+
+def _manifest_path(resource_name: str, backend: str) -> str:
+    return os.path.join(INGEST_MANIFEST_DIR, backend, f"{resource_name}.json")
+
+
+def read_ingest_manifest(resource_name: str, backend: str) -> Optional[Set[str]]:
+    """Chunk IDs stored by the last successful ingestion of a source, or None when it was never recorded."""
+    try:
+        with open(_manifest_path(resource_name, backend), 'r') as f:
+            return set(json.load(f).get("chunk_ids", []))
+    except (OSError, ValueError):
+        return None
+
+
+def write_ingest_manifest(resource_name: str, backend: str, chunk_ids: List[str]):
+    path = _manifest_path(resource_name, backend)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({"updated_at": time.time(), "chunk_ids": sorted(chunk_ids)}, f)
+    os.replace(tmp_path, path)
+
+
+def sync_chunks(chunks: List[Document], resource_name: str, backend: str) -> Tuple[int, int, int]:
+    """Brings a source's namespace in line with its current chunks; returns (unchanged, added, deleted).
+
+    Every current chunk ID is checked against the store in batches and only the missing ones are embedded
+    and stored, so chunks lost from a wiped, restored or half-written store come back on the next run.
+    IDs that disappeared since the source's manifest from the last run are deleted. Without a manifest
+    (first run, or after switching ID schemes) the store's own IDs are listed page by page instead.
+    """
+    by_id = {chunk.metadata["id"]: chunk for chunk in calculate_chunk_ids(chunks)}
+    store = MmapChunkStore(resource_name) if backend == "mmap" else ChromaChunkStore(resource_name)
+    previous = read_ingest_manifest(resource_name, backend)
+    if previous is None:
+        previous = store.all_ids()
+    new_ids = store.missing(list(by_id))
+    stale_ids = [chunk_id for chunk_id in previous if chunk_id not in by_id]
+    store.apply([by_id[chunk_id] for chunk_id in new_ids], stale_ids)
+    write_ingest_manifest(resource_name, backend, list(by_id))
+    return len(by_id) - len(new_ids), len(new_ids), len(stale_ids)
+
+
+def bump_rag_version(resource_name: str):
+    """Records that a namespace was re-ingested so the API's response cache drops answers built from it."""
+    try:
+        with open(RAG_VERSIONS_PATH, 'r') as f:
+            versions = json.load(f)
+    except (OSError, ValueError):
+        versions = {}
+    versions[resource_name] = time.time()
+    tmp_path = f"{RAG_VERSIONS_PATH}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(versions, f)
+    os.replace(tmp_path, RAG_VERSIONS_PATH)
+
+
+def populate_source(resource_name: str, backend: str = VECTOR_STORE_BACKEND) -> int:
+    if backend == "chroma" and not _is_chroma_available():
         print("⚠️ Chroma server is not reachable, skipping vector database population.")
         return 1
     documents = load_documents_for_source(resource_name)
@@ -187,22 +294,26 @@ def populate_source(resource_name: str) -> int:
         print(f"No documents found for RAG population for source '{resource_name}'.")
         return 2
     chunks = split_documents(documents)
-    existing, added = add_to_chroma(chunks, collection_name=resource_name)
-    print(f"[{resource_name}] Chroma existing docs: {existing}, newly added: {added}")
+    unchanged, added, deleted = sync_chunks(chunks, resource_name, backend)
+    print(f"[{resource_name}] {backend} unchanged chunks: {unchanged}, added: {added}, deleted: {deleted}")
+    if added or deleted:
+        bump_rag_version(resource_name)
     return 0
 
 
 def main(argv: List[str]) -> int:
-    parser = argparse.ArgumentParser(description="Populate Chroma collections by resource name.")
+    parser = argparse.ArgumentParser(description="Populate vector store namespaces by resource name.")
     parser.add_argument("resource_name", nargs="?", help="Name of the resource to populate. If omitted, populates all.")
+    parser.add_argument("--backend", choices=("chroma", "mmap"), default=VECTOR_STORE_BACKEND,
+                        help="Chroma server, or the in-process memory-mapped index in VECTOR_INDEX_DIR.")
     args = parser.parse_args(argv)
 
-    if not _is_chroma_available():
+    if args.backend == "chroma" and not _is_chroma_available():
         print("⚠️ Chroma server is not reachable, skipping vector database population.")
         return 1
 
     if args.resource_name:
-        return populate_source(args.resource_name)
+        return populate_source(args.resource_name, args.backend)
 
     sources = list_sources()
     if not sources:
@@ -213,7 +324,7 @@ def main(argv: List[str]) -> int:
     for s in sources:
         rn = s.get("resource_name")
         if rn:
-            code = populate_source(rn)
+            code = populate_source(rn, args.backend)
             if code != 0:
                 overall_code = code
     return overall_code
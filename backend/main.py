@@ -1,12 +1,29 @@
-from fastapi import FastAPI # type: ignore
+from fastapi import FastAPI, Request, Response # type: ignore
+from fastapi.responses import JSONResponse # type: ignore
 from contextlib import asynccontextmanager
 from core import config
-from core.database import Base, engine
+from core.database import Base, engine, ensure_columns, ensure_indexes
 from api.v1.api import api_router
-from services.llm import initialize_llm
+from services.llm import initialize_llm, llm_guard, LLMUnavailableError
 from services.tools import setup_tools
 from services.agent import create_mcp_agent_executor
+from services.embeddings import embedding_engine
+from services.embedding_cache import embedding_cache
+from services.mcp_pool import mcp_pool
+from services import chat as chat_crud
+from services.response_cache import response_cache
+from core.security import shutdown_hash_pool
+from services.principal_cache import principal_cache
+from services.idempotency import idempotency_store
+from services.session_locks import session_locks
+from services.jobs import job_runner
+from services.turns import run_chat_job
+from core.metrics import HTTP_REQUEST_LATENCY, start_trace, register_stats
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST # type: ignore
+import asyncio
+import functools
 import os
+import time
 from fastapi.middleware.cors import CORSMiddleware # type: ignore
 import logging
 
@@ -15,12 +32,23 @@ async def lifespan(app: FastAPI):
     """Initializes LLM, tools, and the agent executor when the application starts."""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(ensure_columns)
+        await conn.run_sync(ensure_indexes)
+        await chat_crud.backfill_session_updated_at(conn)
+
+    if config.EMBEDDING_WARMUP:
+        try:
+            await asyncio.to_thread(embedding_engine.warmup)
+            print("✅ Embedding model warmed up.")
+        except Exception as e:
+            logging.error(f"❌ Error warming up embedding model: {e}")
 
     try:
         llm_instance = initialize_llm(
             config.OPENROUTER_API_KEY, 
             config.OPENROUTER_BASE_URL, 
-            config.LLM_MODEL_NAME
+            config.LLM_MODEL_NAME,
+            streaming=config.LLM_STREAMING
         )
     except ValueError as e:
         logging.error(f"❌ Error initializing LLM: {e}")
@@ -30,15 +58,33 @@ async def lifespan(app: FastAPI):
 
     if llm_instance:
         app.state.llm_instance = llm_instance
+        app.state.formatter_llm = llm_instance
+        if config.FORMATTER_MODEL_NAME:
+            formatter_llm = initialize_llm(
+                config.OPENROUTER_API_KEY,
+                config.OPENROUTER_BASE_URL,
+                config.FORMATTER_MODEL_NAME,
+                streaming=False
+            )
+            app.state.formatter_llm = formatter_llm or llm_instance
         # Initialize AgentManager with LLM
         from services.agent_manager import agent_manager
         agent_manager.set_llm(llm_instance)
+        agent_manager.start()
         app.state.agent_manager = agent_manager
         print("✅ AgentManager initialized.")
+        job_runner.start(functools.partial(run_chat_job, app))
+        print(f"✅ Background job workers started ({config.JOB_WORKERS}, {config.JOB_QUEUE_BACKEND} queue).")
     else:
         print("❌ AgentManager not initialized due to LLM initialization failure.")
     yield
 
+    await job_runner.aclose()
+    if llm_instance:
+        await app.state.agent_manager.aclose()
+    await mcp_pool.aclose()
+    shutdown_hash_pool()
+
 app = FastAPI(
     title="Persistent LangChain MCP Agent API",
     description="A service for managing stateful chat sessions with a tool-using LangChain agent.",
@@ -61,8 +107,46 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Times each request and its stages; exposes them in a Server-Timing header and the access log."""
+    trace = start_trace()
+    started = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - started
+
+    # Label by route template, not raw path, to keep the metric's cardinality bounded
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    HTTP_REQUEST_LATENCY.labels(method=request.method, route=route, status=response.status_code).observe(elapsed)
+    # Streaming responses keep running after this point, so their trace only covers the setup stages
+    timings = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in trace]
+    response.headers["Server-Timing"] = ", ".join(timings + [f"total;dur={elapsed * 1000:.1f}"])
+    if trace:
+        logging.info(f"{request.method} {route} {response.status_code} {elapsed * 1000:.1f}ms " + " ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in trace))
+    return response
+
+@app.exception_handler(LLMUnavailableError)
+async def llm_unavailable_handler(request: Request, exc: LLMUnavailableError):
+    """The provider kept failing (or this process is over its LLM rate limit): tell the client when to retry."""
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": str(max(1, round(exc.retry_after)))})
+
 app.include_router(api_router, prefix="/api/v1")
 
+register_stats("agent_cache", lambda: app.state.agent_manager.stats() if hasattr(app.state, "agent_manager") else {})
+register_stats("response_cache", response_cache.stats)
+register_stats("mcp_pool", mcp_pool.stats)
+register_stats("principal_cache", principal_cache.stats)
+register_stats("idempotency", idempotency_store.stats)
+register_stats("session_locks", session_locks.stats)
+register_stats("jobs", job_runner.stats)
+register_stats("llm_guard", llm_guard.stats)
+register_stats("embedding_cache", embedding_cache.stats)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
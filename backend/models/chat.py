@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, JSON, DateTime, ForeignKey, Text # type: ignore
+from sqlalchemy import Column, Integer, String, JSON, DateTime, ForeignKey, Text, Index # type: ignore
 from sqlalchemy.sql import func # type: ignore
 from core.database import Base
 
@@ -9,7 +9,16 @@ class ChatSession(Base):
     user_id = Column(Integer, ForeignKey("users.id"), index=True)
     title = Column(String, index=True, default="New Chat")
     created_at = Column(DateTime, server_default=func.now())
-    updated_at = Column(DateTime, onupdate=func.now())
+    # Last activity; the client-side default also covers databases created before the server default existed
+    updated_at = Column(DateTime, default=func.now(), server_default=func.now(), onupdate=func.now())
+    # Denormalized activity, maintained by services.chat.save_turn; message_count is NULL until backfilled
+    last_message_at = Column(DateTime, default=func.now(), nullable=True) # New sessions start with their first message
+    message_count = Column(Integer, nullable=True)
+    last_message_preview = Column(String, nullable=True)
+
+    # Fetch server-generated columns with RETURNING on flush instead of a refresh per object
+    __mapper_args__ = {"eager_defaults": True}
+    __table_args__ = (Index("ix_chat_sessions_user_activity", "user_id", "updated_at", "id"),)
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
@@ -22,3 +31,6 @@ class ChatMessage(Base):
     tool_calls = Column(JSON, nullable=True) # Store detailed tool calls (name, input, output)
     content = Column(JSON) # Store message content as JSON
     created_at = Column(DateTime, server_default=func.now())
+
+    __mapper_args__ = {"eager_defaults": True}
+    __table_args__ = (Index("ix_chat_messages_session_created", "chat_session_id", "created_at", "id"),)
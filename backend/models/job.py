@@ -0,0 +1,23 @@
+from sqlalchemy import Boolean, Column, Integer, String, JSON, DateTime, Text, Index # type: ignore
+from core.database import Base
+
+class ChatJob(Base):
+    """A chat turn queued for background execution (used by the ``sql`` job queue backend)."""
+    __tablename__ = "chat_jobs"
+
+    id = Column(String, primary_key=True)
+    user_id = Column(Integer, index=True)
+    chat_session_id = Column(String, index=True) # No foreign key: the job record outlives a deleted session
+    content = Column(Text)
+    priority = Column(Integer, default=5) # Lower runs first
+    status = Column(String, default="queued") # queued, running, succeeded, failed, cancelled or timed_out
+    result = Column(JSON, nullable=True) # MessageResponse of a finished turn
+    error = Column(Text, nullable=True)
+    user_message_id = Column(Integer, nullable=True) # Saved by the first run, so a requeued job does not add it again
+    cancel_requested = Column(Boolean, nullable=True) # Set on a running job; the process running it stops the turn
+    created_at = Column(DateTime)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    # Workers claim the oldest job of the best priority among queued ones
+    __table_args__ = (Index("ix_chat_jobs_claim", "status", "priority", "created_at"),)
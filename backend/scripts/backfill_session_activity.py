@@ -0,0 +1,35 @@
+"""Backfills the denormalized activity columns of chat sessions (message count, last message time, preview).
+
+Run from the backend directory with ``python -m scripts.backfill_session_activity``. The API adds the
+columns at startup; sessions created before then have a NULL ``message_count`` until this has run.
+"""
+import argparse
+import asyncio
+import sys
+from typing import List
+from core.database import Base, engine, AsyncSessionLocal, ensure_columns, ensure_indexes
+from services import chat as chat_crud
+
+
+async def run(batch_size: int, recompute: bool) -> int:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(ensure_columns)
+        await conn.run_sync(ensure_indexes)
+    async with AsyncSessionLocal() as db:
+        updated = await chat_crud.backfill_session_activity(db, batch_size=batch_size, recompute=recompute)
+    await engine.dispose()
+    print(f"✅ Backfilled activity for {updated} sessions.")
+    return 0
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Backfill message counts, last activity and previews of chat sessions.")
+    parser.add_argument("--batch-size", type=int, default=500, help="Sessions updated per transaction.")
+    parser.add_argument("--recompute", action="store_true", help="Also recompute sessions that already have counts.")
+    args = parser.parse_args(argv)
+    return asyncio.run(run(args.batch_size, args.recompute))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
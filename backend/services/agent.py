@@ -1,120 +1,413 @@
-from typing import List, Any, Optional, Tuple
+from typing import List, Any, Optional, Tuple, AsyncIterator, Dict, Union, Callable
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from fnmatch import fnmatch
+from pydantic import BaseModel, Field # type: ignore
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.tools import StructuredTool # type: ignore
 from langchain_openai import ChatOpenAI
 from langchain.agents import create_openai_tools_agent, AgentExecutor
+from langchain.agents.agent import RunnableMultiActionAgent # type: ignore
+from langchain_core.agents import AgentAction, AgentFinish, AgentStep # type: ignore
 from langchain_core.messages import AIMessage, HumanMessage, BaseMessage
-from core.schemas import LLMOutputBlock
+from core.schemas import LLMOutputBlock, TextBlock, ReactBlock
+from core import config
+from core.metrics import metrics_callback, span
+from services.response_cache import response_cache
+from services.llm import LLMUnavailableError
+import asyncio
+import contextvars
+import functools
+import json
 import logging
+import re
+import time
 
-def create_mcp_agent_executor(llm_instance: ChatOpenAI, tools_list: List[Any]) -> Optional[AgentExecutor]:
-    """Creates and returns an agent executor."""
+SYSTEM_PROMPT = "You are an AI assistant. Maintain conversation context using the provided chat history."
+FINAL_ANSWER_TOOL_NAME = "final_answer"
+EARLY_STOPPED_KEY = "early_stopped" # Set in the executor's output when the turn ran out of iterations or time
+
+class FinalAnswerInput(BaseModel):
+    blocks: List[Union[TextBlock, ReactBlock]] = Field(..., description="List of content blocks that make up the answer shown to the user.")
+
+def _final_answer(blocks: List[Any]) -> str:
+    return json.dumps({"blocks": [block.model_dump() if isinstance(block, BaseModel) else block for block in blocks]})
+
+def _final_answer_tool() -> StructuredTool:
+    """Tool the agent calls to return its answer directly as content blocks (``direct`` output mode)."""
+    return StructuredTool.from_function(
+        func=_final_answer,
+        name=FINAL_ANSWER_TOOL_NAME,
+        description="Send the final answer to the user as a list of content blocks. Always finish your turn by calling this tool.",
+        args_schema=FinalAnswerInput,
+        return_direct=True,
+    )
+
+# Limits how many tool calls of the current turn run at once; set per turn by the response functions below
+_tool_slots: ContextVar[Optional[asyncio.Semaphore]] = ContextVar("tool_slots", default=None)
+_tool_thread_pool = ThreadPoolExecutor(max_workers=config.AGENT_TOOL_THREADS, thread_name_prefix="agent-tool")
+
+def tool_timeout(tool_name: str) -> float:
+    """Seconds a tool call may take: the first matching ``AGENT_TOOL_TIMEOUTS`` pattern, else the default."""
+    for pattern, seconds in config.AGENT_TOOL_TIMEOUTS.items():
+        if fnmatch(tool_name, pattern):
+            return float(seconds)
+    return config.AGENT_TOOL_TIMEOUT_SECONDS
+
+class ToolTimeoutError(Exception):
+    """A tool call took longer than its ``tool_timeout``."""
+
+    def __init__(self, tool_name: str, timeout: float):
+        super().__init__(f"The tool '{tool_name}' did not respond within {timeout:g} seconds.")
+        self.tool_name = tool_name
+        self.timeout = timeout
+
+def _in_tool_pool(func: Callable[..., Any]) -> Callable[..., Any]:
+    async def _acall(*args: Any, **kwargs: Any) -> Any:
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(_tool_thread_pool, functools.partial(context.run, func, *args, **kwargs))
+    return _acall
+
+def _with_timeout(coroutine: Callable[..., Any], tool_name: str) -> Callable[..., Any]:
+    # The timeout fires inside the tool run, so the tool reports it through on_tool_error like any other failure
+    @functools.wraps(coroutine)
+    async def _acall(*args: Any, **kwargs: Any) -> Any:
+        timeout = tool_timeout(tool_name)
+        try:
+            return await asyncio.wait_for(coroutine(*args, **kwargs), timeout)
+        except asyncio.TimeoutError:
+            raise ToolTimeoutError(tool_name, timeout) from None
+    return _acall
+
+def _async_tools(tools_list: List[Any]) -> List[Any]:
+    """Gives each tool a coroutine that enforces its timeout, running sync-only tools on the agent tool thread pool.
+
+    Tools are shared between agents (pooled MCP tools), so changed tools are copies.
+    """
+    tools = []
+    for tool in tools_list:
+        coroutine = getattr(tool, "coroutine", None)
+        func = getattr(tool, "func", None)
+        if coroutine is None and func is not None:
+            coroutine = _in_tool_pool(func)
+        if coroutine is not None:
+            tool = tool.model_copy(update={"coroutine": _with_timeout(coroutine, tool.name)})
+        tools.append(tool)
+    return tools
+
+class ParallelAgentExecutor(AgentExecutor):
+    """AgentExecutor whose tool calls are capped per turn and time out one by one.
+
+    The async executor already runs all tool calls of a step together (``asyncio.gather``, results in
+    call order), so a step takes as long as its slowest call. This bounds how many of them run at once
+    (``AGENT_MAX_PARALLEL_TOOLS``) and turns a call that exceeds ``tool_timeout`` into an observation
+    the agent can react to, cancelling the call, instead of stalling the turn.
+    """
+
+    async def _aperform_agent_action(self, name_to_tool_map: Dict[str, Any], color_mapping: Dict[str, str], agent_action: AgentAction, run_manager: Any = None) -> AgentStep:
+        slots = _tool_slots.get()
+        if slots is None:
+            return await self._aperform_with_timeout(name_to_tool_map, color_mapping, agent_action, run_manager)
+        async with slots:
+            return await self._aperform_with_timeout(name_to_tool_map, color_mapping, agent_action, run_manager)
+
+    async def _aperform_with_timeout(self, name_to_tool_map: Dict[str, Any], color_mapping: Dict[str, str], agent_action: AgentAction, run_manager: Any = None) -> AgentStep:
+        try:
+            return await super()._aperform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+        except ToolTimeoutError as e:
+            # The tool run already ended with on_tool_error (metrics, stream events); the agent sees the timeout
+            logging.warning(f"⚠️ Tool '{e.tool_name}' timed out after {e.timeout:g}s.")
+            return AgentStep(action=agent_action, observation=str(e))
+
+class EarlyStopMarkingAgent(RunnableMultiActionAgent):
+    """Agent whose stopped response (iteration or time budget used up) is flagged with ``EARLY_STOPPED_KEY``."""
+
+    def return_stopped_response(self, early_stopping_method: str, intermediate_steps: List[Tuple[AgentAction, str]], **kwargs: Any) -> AgentFinish:
+        finish = super().return_stopped_response(early_stopping_method, intermediate_steps, **kwargs)
+        return AgentFinish({**finish.return_values, EARLY_STOPPED_KEY: True}, finish.log)
+
+def _start_turn():
+    """Gives the current turn its own tool-call concurrency cap."""
+    _tool_slots.set(asyncio.Semaphore(config.AGENT_MAX_PARALLEL_TOOLS))
+
+def create_mcp_agent_executor(
+    llm_instance: ChatOpenAI,
+    tools_list: List[Any],
+    output_mode: str = config.AGENT_OUTPUT_MODE,
+    max_iterations: Optional[int] = config.AGENT_MAX_ITERATIONS,
+    max_execution_time: Optional[float] = config.AGENT_MAX_EXECUTION_SECONDS
+) -> Optional[AgentExecutor]:
+    """Creates and returns an agent executor.
+
+    In ``direct`` output mode the agent gets a ``final_answer`` tool and returns its answer as
+    content blocks itself, so no separate formatting call is needed. ``max_iterations`` and
+    ``max_execution_time`` budget each turn; when one runs out the agent stops with what it has.
+    """
     if not llm_instance:
         return None
-        
+
+    system_prompt = SYSTEM_PROMPT
+    if output_mode == "direct":
+        tools_list = tools_list + [_final_answer_tool()]
+        # Escape braces: the formatting guidance contains literal code and CSS
+        format_guidance = OUTPUT_FORMAT_PROMPT.replace("{", "{{").replace("}", "}}")
+        system_prompt = f"{SYSTEM_PROMPT} {format_guidance} When you are done, call the `{FINAL_ANSWER_TOOL_NAME}` tool with your answer."
+
     prompt = ChatPromptTemplate.from_messages(
         [
-            ("system", "You are an AI assistant. Maintain conversation context using the provided chat history."),
+            ("system", system_prompt),
             MessagesPlaceholder(variable_name="chat_history"),
             ("human", "{input}"),
             MessagesPlaceholder(variable_name="agent_scratchpad"),
         ]
     )
 
-    agent = create_openai_tools_agent(llm=llm_instance, tools=tools_list, prompt=prompt)
-    executor = AgentExecutor(agent=agent, tools=tools_list, verbose=True)
-    executor = executor.with_config({"run_name": "Jarvis"})
+    tools_list = _async_tools(tools_list)
+    agent = EarlyStopMarkingAgent(runnable=create_openai_tools_agent(llm=llm_instance, tools=tools_list, prompt=prompt))
+    executor = ParallelAgentExecutor(
+        agent=agent,
+        tools=tools_list,
+        verbose=config.AGENT_VERBOSE,
+        max_iterations=max_iterations,
+        max_execution_time=max_execution_time,
+        early_stopping_method="force"
+    )
+    executor = executor.with_config({"run_name": "Jarvis", "callbacks": [metrics_callback]})
     print("✅ Agent Executor created successfully.")
     return executor
 
-async def get_agent_response(agent_executor: AgentExecutor, user_input: str, chat_history: List[BaseMessage], llm_instance: ChatOpenAI) -> Tuple[LLMOutputBlock, List[str], List[dict]]:
-    """Gets a response from the agent and returns the text, tool names used, and detailed tool calls."""
+def with_budget(agent_executor: AgentExecutor, max_iterations: Optional[int], max_execution_time: Optional[float]) -> AgentExecutor:
+    """Returns a copy of a (cached) executor with another per-turn budget; tools and MCP connections are shared."""
+    budget = {"max_iterations": max_iterations, "max_execution_time": max_execution_time}
+    bound = getattr(agent_executor, "bound", None) # Executors come wrapped by with_config
+    if bound is None:
+        return agent_executor.model_copy(update=budget)
+    return bound.model_copy(update=budget).with_config(agent_executor.config)
+
+OUTPUT_FORMAT_PROMPT = "You are an AI assistant. " \
+    "Your responses should be structured as an array of content blocks, which can be either plain text or React components. " \
+    "When presenting data analysis, statistics, or any information that can be visually represented, automatically generate a React component to render a suitable chart or graph (e.g., histogram, bar chart, line chart). " \
+    "For React components, ensure the `code` field of the `ReactBlock` contains a string representing a default export of a React functional component. For example: '''export default function MyComponent() { return <div>Hello</div>; }'''. " \
+    "Always provide some introductory and concluding text around any React components to make the conversation flow naturally. " \
+    "Also, it should be compatible with this theme :root {font-family: system-ui, Avenir, Helvetica, Arial, sans-serif; line-height: 1.5; font-weight: 400; color-scheme: light dark; color: rgba(255, 255, 255, 0.87); background-color: #242424; font-synthesis: none; }"
+
+@dataclass
+class TurnProgress:
+    """What a turn has produced so far, so a cancelled turn can still be recorded."""
+    text: str = ""
+    tool_names_used: List[str] = field(default_factory=list)
+    tool_calls: List[dict] = field(default_factory=list)
+    status: str = "cancelled" # Why the turn stopped early: "cancelled" (client left) or "timed_out"
+    early_stopped: bool = False # The agent used up its iteration or time budget and returned what it had
+
+def partial_output(user_input: str, progress: TurnProgress) -> LLMOutputBlock:
+    """Output block for a turn that did not complete: the text streamed so far plus a note."""
+    note = "_The response was stopped because it took too long._" if progress.status == "timed_out" else "_The response was cancelled._"
+    text = f"{progress.text}\n\n{note}" if progress.text else note
+    return LLMOutputBlock(blocks=[TextBlock(text=text)], query=user_input)
+
+def _tool_call_record(action: Any, observation: Any) -> dict:
+    """Builds the persisted tool call entry for a completed agent step."""
+    tool_input = action.tool_input if isinstance(action.tool_input, dict) else {"input": action.tool_input}
+    return {
+        "name": action.tool,
+        "input": tool_input,
+        "output": str(observation)
+    }
+
+_MARKDOWN_TABLE = re.compile(r"^\s*\|.*\|\s*$\n^\s*\|?\s*:?-{3,}", re.MULTILINE)
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:[.,]\d+)?%?")
+_CHART_REQUEST = re.compile(r"\b(chart|graph|plot|histogram|visuali[sz]e|diagram)\b", re.IGNORECASE)
+
+def needs_rich_formatting(user_input: str, response_text: str) -> bool:
+    """Heuristic for answers worth a React chart: tables, number-heavy text or an explicit chart request."""
+    return bool(
+        _CHART_REQUEST.search(user_input)
+        or _MARKDOWN_TABLE.search(response_text)
+        or len(_NUMBER.findall(response_text)) >= config.FORMAT_NUMBER_THRESHOLD
+    )
+
+def _parse_final_answer(user_input: str, response_text: str) -> Optional[LLMOutputBlock]:
+    try:
+        data = json.loads(response_text)
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or "blocks" not in data:
+        return None
+    try:
+        return LLMOutputBlock(blocks=data["blocks"], query=user_input)
+    except ValueError:
+        return None
+
+async def format_agent_output(llm_instance: ChatOpenAI, response_text: str) -> LLMOutputBlock:
+    """Converts the agent's final answer into structured content blocks."""
+    structured_llm = llm_instance.with_structured_output(LLMOutputBlock)
+    with span("format"):
+        return await structured_llm.ainvoke(OUTPUT_FORMAT_PROMPT + response_text)
+
+async def build_output_block(llm_instance: ChatOpenAI, user_input: str, response_text: str, output_mode: str = config.AGENT_OUTPUT_MODE) -> LLMOutputBlock:
+    """Turns the agent's final answer into an ``LLMOutputBlock``, calling the formatter LLM only when needed.
+
+    ``format`` always calls the formatter. ``auto`` and ``direct`` wrap plain answers in a local
+    ``TextBlock`` and only call the formatter for chart-worthy answers. ``direct`` uses the blocks the
+    agent returned through the ``final_answer`` tool as they are.
+    """
+    if output_mode == "direct":
+        direct_output = _parse_final_answer(user_input, response_text)
+        if direct_output is not None:
+            return direct_output
+    if output_mode in ("auto", "direct") and not needs_rich_formatting(user_input, response_text):
+        return LLMOutputBlock(blocks=[TextBlock(text=response_text)], query=user_input)
+    return await format_agent_output(llm_instance, response_text)
+
+async def _cache_lookup(cache_scope: Optional[str], user_input: str):
+    """Returns (query embedding, cached turn); both None when caching is off for this turn."""
+    if not cache_scope:
+        return None, None
+    embedding = await response_cache.embed(user_input)
+    if embedding is None:
+        return None, None
+    return embedding, response_cache.lookup(cache_scope, embedding)
+
+async def get_agent_response(agent_executor: AgentExecutor, user_input: str, chat_history: List[BaseMessage], llm_instance: ChatOpenAI, cache_scope: Optional[str] = None, progress: Optional[TurnProgress] = None) -> Tuple[LLMOutputBlock, List[str], List[dict]]:
+    """Gets a response from the agent and returns the text, tool names used, and detailed tool calls.
+
+    The executor is streamed exactly once: ``actions`` chunks carry the tool names,
+    ``steps`` chunks carry (action, observation) pairs and ``output`` carries the final answer.
+    ``llm_instance`` is only used to format the answer (see ``build_output_block``).
+    With a ``cache_scope`` (see ``SemanticResponseCache.scope_key``) similar earlier answers are reused.
+    Tool calls are collected into ``progress`` as they complete, so they survive a cancellation.
+    """
+    cache_embedding, cached = await _cache_lookup(cache_scope, user_input)
+    if cached:
+        return cached.to_response(user_input)
+
+    started = time.perf_counter()
+    _start_turn()
     agent_input = {"input": user_input, "chat_history": chat_history}
+    progress = progress if progress is not None else TurnProgress()
     response_parts = ""
-    tool_names_used = []
-    tool_calls = []
-    
+    tool_names_used = progress.tool_names_used
+    tool_calls = progress.tool_calls
+    failed = False
+
     try:
         async for chunk in agent_executor.astream(agent_input):
             if "actions" in chunk:
                 for action in chunk["actions"]:
-                    tool_names_used.append(action.tool)
-                    tool_calls.append({
-                        "name": action.tool,
-                        "input": action.tool_input,
-                        "output": None # Output is captured in steps, but for now we capture input
-                    })
-            
+                    if action.tool != FINAL_ANSWER_TOOL_NAME:
+                        tool_names_used.append(action.tool)
+
             if "steps" in chunk:
                 for step in chunk["steps"]:
-                    # step is a tuple (AgentAction, str) where str is the observation/output
-                    action = step.action
-                    observation = step.observation
-                    # Find the matching tool call to update output, or append new if missed
-                    # Since steps come after actions, we can try to match or just append complete calls
-                    # Simpler approach: construct tool_calls from steps which have both input and output
-                    pass
+                    if step.action.tool != FINAL_ANSWER_TOOL_NAME:
+                        tool_calls.append(_tool_call_record(step.action, step.observation))
 
             if "output" in chunk:
                 response_parts += chunk["output"]
+                progress.early_stopped = progress.early_stopped or bool(chunk.get(EARLY_STOPPED_KEY))
 
+    except LLMUnavailableError:
+        raise # Retries and fallbacks are exhausted; the endpoint reports it instead of storing an apology
     except Exception as e:
         print(f"💥 Agent Execution Error: {e}")
         response_parts = f"I apologize, the AI agent encountered an error. {e}"
-    
-    # Re-process to get complete tool calls from intermediate_steps if available in the final result
-    # But astream yields chunks. 
-    # Let's rely on 'steps' chunk which contains (action, observation)
-    
-    # Refined logic for tool_calls
-    final_tool_calls = []
-    try:
-        # We need to run it again or capture differently? 
-        # astream yields:
-        # 1. actions: [AgentAction]
-        # 2. steps: [(AgentAction, str)] -> This has the output!
-        # 3. output: str
-        
-        # Let's reset and capture from steps for full details
-        pass
-    except:
-        pass
-
-    # Let's rewrite the loop to be cleaner
-    tool_names_used = []
-    tool_calls_list = []
+        failed = True
+
+    structured_response = await build_output_block(llm_instance, user_input, response_parts)
+    unique_tool_names = list(dict.fromkeys(tool_names_used))
+
+    # Failed and budget-truncated answers are not worth serving to the next similar question
+    if cache_embedding is not None and not failed and not progress.early_stopped:
+        response_cache.store(cache_scope, cache_embedding, structured_response, unique_tool_names, tool_calls, time.perf_counter() - started)
+
+    return structured_response, unique_tool_names, tool_calls
+
+async def stream_agent_response(agent_executor: AgentExecutor, user_input: str, chat_history: List[BaseMessage], llm_instance: ChatOpenAI, cache_scope: Optional[str] = None, progress: Optional[TurnProgress] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Runs the agent once and yields progress events as they happen.
+
+    Yields ``tool_start``, ``tool_end`` and ``token`` events while the agent runs, and a
+    single ``final`` event carrying the structured output, tool names and tool calls.
+    Tokens come only from the agent's own model, not from models running inside tools. When a step
+    whose tokens were already sent turns into a tool call, ``step_reset`` tells the client to drop them.
+    Streamed text of the current step and tool calls are also collected into ``progress``. Closing the generator
+    stops the agent run, including in-flight LLM and tool calls.
+    """
+    cache_embedding, cached = await _cache_lookup(cache_scope, user_input)
+    if cached:
+        output, cached_tool_names, cached_tool_calls = cached.to_response(user_input)
+        yield {"event": "final", "data": {"output": output, "tool_names_used": cached_tool_names, "tool_calls": cached_tool_calls, "cached": True}}
+        return
+
+    started = time.perf_counter()
+    _start_turn()
+    agent_input = {"input": user_input, "chat_history": chat_history}
+    progress = progress if progress is not None else TurnProgress()
+    response_parts = ""
+    tool_names_used = progress.tool_names_used
+    tool_calls = progress.tool_calls
+    failed = False
+    pending_tools: Dict[str, dict] = {}
 
     try:
-        async for chunk in agent_executor.astream(agent_input):
-            if "actions" in chunk:
-                for action in chunk["actions"]:
-                    tool_names_used.append(action.tool)
-            
-            if "steps" in chunk:
-                for step in chunk["steps"]:
-                    action = step.action
-                    observation = step.observation
-                    tool_calls_list.append({
-                        "name": action.tool,
-                        "input": action.tool_input,
-                        "output": str(observation)
-                    })
+        # aclosing: an abandoned stream must cancel the run that astream_events drives in the background
+        async with aclosing(agent_executor.astream_events(agent_input, version="v2")) as events:
+            async for event in events:
+                kind = event["event"]
+                if kind in ("on_tool_start", "on_tool_end", "on_tool_error") and event["name"] == FINAL_ANSWER_TOOL_NAME:
+                    continue
+                if kind == "on_tool_start":
+                    if progress.text:
+                        # The step ended in a tool call, so its text was not the answer
+                        yield {"event": "step_reset", "data": {"discarded": progress.text}}
+                        progress.text = ""
+                    tool_input = event["data"].get("input")
+                    pending_tools[event["run_id"]] = {
+                        "name": event["name"],
+                        "input": tool_input if isinstance(tool_input, dict) else {"input": tool_input},
+                    }
+                    tool_names_used.append(event["name"])
+                    yield {"event": "tool_start", "data": {"run_id": event["run_id"], **pending_tools[event["run_id"]]}}
+                elif kind in ("on_tool_end", "on_tool_error"):
+                    call = pending_tools.pop(event["run_id"], {"name": event["name"], "input": {}})
+                    call["output"] = str(event["data"].get("output" if kind == "on_tool_end" else "error"))
+                    tool_calls.append(call)
+                    yield {"event": "tool_end", "data": {"run_id": event["run_id"], **call}}
+                elif kind == "on_chat_model_stream":
+                    if any(parent_id in pending_tools for parent_id in event.get("parent_ids", [])):
+                        continue # A model called inside a tool, not the agent's answer
+                    delta = event["data"]["chunk"].content
+                    if isinstance(delta, str) and delta:
+                        progress.text += delta
+                        yield {"event": "token", "data": {"text": delta}}
+                elif kind == "on_chain_end" and not event.get("parent_ids"):
+                    output = event["data"].get("output") or {}
+                    if isinstance(output, dict) and "output" in output:
+                        response_parts += output["output"]
+                        progress.early_stopped = progress.early_stopped or bool(output.get(EARLY_STOPPED_KEY))
 
-            if "output" in chunk:
-                response_parts += chunk["output"]
-                
+    except LLMUnavailableError:
+        raise # Retries and fallbacks are exhausted; the endpoint reports it instead of storing an apology
     except Exception as e:
         print(f"💥 Agent Execution Error: {e}")
         response_parts = f"I apologize, the AI agent encountered an error. {e}"
+        failed = True
 
-    structured_llm = llm_instance.with_structured_output(LLMOutputBlock)
-    pro = "You are an AI assistant. " \
-    "Your responses should be structured as an array of content blocks, which can be either plain text or React components. " \
-    "When presenting data analysis, statistics, or any information that can be visually represented, automatically generate a React component to render a suitable chart or graph (e.g., histogram, bar chart, line chart). " \
-    "For React components, ensure the `code` field of the `ReactBlock` contains a string representing a default export of a React functional component. For example: '''export default function MyComponent() { return <div>Hello</div>; }'''. " \
-    "Always provide some introductory and concluding text around any React components to make the conversation flow naturally. " \
-    "Also, it should be compatible with this theme :root {font-family: system-ui, Avenir, Helvetica, Arial, sans-serif; line-height: 1.5; font-weight: 400; color-scheme: light dark; color: rgba(255, 255, 255, 0.87); background-color: #242424; font-synthesis: none; }"
-    
-    structured_response = await structured_llm.ainvoke(pro + response_parts)
-    unique_tool_names = list(set(tool_names_used))
+    structured_response = await build_output_block(llm_instance, user_input, response_parts)
+    unique_tool_names = list(dict.fromkeys(tool_names_used))
+
+    # Failed and budget-truncated answers are not worth serving to the next similar question
+    if cache_embedding is not None and not failed and not progress.early_stopped:
+        response_cache.store(cache_scope, cache_embedding, structured_response, unique_tool_names, tool_calls, time.perf_counter() - started)
 
-    return structured_response, unique_tool_names, tool_calls_list
\ No newline at end of file
+    yield {
+        "event": "final",
+        "data": {
+            "output": structured_response,
+            "tool_names_used": unique_tool_names,
+            "tool_calls": tool_calls,
+            "cached": False,
+        },
+    }
@@ -1,65 +1,236 @@
-from typing import Dict, Optional, Any
+from typing import Dict, Optional, Any, Set, Tuple
 from collections import OrderedDict
+from contextlib import AsyncExitStack
+from dataclasses import dataclass
 from langchain.agents import AgentExecutor
 from langchain_openai import ChatOpenAI
 from services.agent import create_mcp_agent_executor
 from services.tools import setup_tools
-from core.schemas import UserSchema
+from core.schemas import UserSchema, thaw_config
 from core import config
+from core.metrics import span
+import asyncio
+import hashlib
+import json
 import logging
+import time
+
+def mcp_config_hash(mcp_config: Dict[str, Any]) -> str:
+    """Stable hash of a user's MCP config, used to detect config changes."""
+    return hashlib.sha256(json.dumps(mcp_config, sort_keys=True, default=str).encode()).hexdigest()
+
+@dataclass
+class _AgentEntry:
+    executor: AgentExecutor
+    config_hash: str
+    exit_stack: AsyncExitStack # Owns the MCP connections opened for this agent
+    tool_names: Tuple[str, ...]
+    created_at: float
+    last_used: float
+    refreshing: bool = False
 
 class AgentManager:
-    def __init__(self, cache_size: int = config.AGENT_CACHE_SIZE):
-        self._agent_cache: OrderedDict[int, AgentExecutor] = OrderedDict()
+    def __init__(
+        self,
+        cache_size: int = config.AGENT_CACHE_SIZE,
+        ttl_seconds: float = config.AGENT_CACHE_TTL_SECONDS,
+        idle_seconds: float = config.AGENT_CACHE_IDLE_SECONDS,
+        refresh_ahead_seconds: float = config.AGENT_REFRESH_AHEAD_SECONDS
+    ):
+        self._agent_cache: OrderedDict[int, _AgentEntry] = OrderedDict()
         self._cache_size = cache_size
+        self._ttl = ttl_seconds
+        self._idle_ttl = idle_seconds
+        self._refresh_ahead = refresh_ahead_seconds
+        self._inflight: Dict[Tuple[int, str], asyncio.Task] = {}
+        self._background_tasks: Set[asyncio.Task] = set()
+        self._sweeper: Optional[asyncio.Task] = None
+        self._counters: Dict[str, float] = {
+            "hits": 0,
+            "misses": 0,
+            "builds": 0,
+            "build_failures": 0,
+            "refreshes": 0,
+            "evictions": 0,
+            "build_seconds_total": 0.0,
+            "build_seconds_max": 0.0,
+        }
         self.llm: Optional[ChatOpenAI] = None
 
     def set_llm(self, llm: ChatOpenAI):
         """Sets the LLM instance to be used for creating agents."""
         self.llm = llm
 
+    def start(self):
+        """Starts the background sweeper that evicts expired and idle agents."""
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_forever())
+
+    async def aclose(self):
+        """Stops the sweeper and closes every cached agent's MCP connections."""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        entries = list(self._agent_cache.values())
+        self._agent_cache.clear()
+        for entry in entries:
+            await self._close_entry(entry)
+
+    def stats(self) -> Dict[str, float]:
+        """Returns cache hit/miss counters and agent build latency figures."""
+        lookups = self._counters["hits"] + self._counters["misses"]
+        return {
+            **self._counters,
+            "size": len(self._agent_cache),
+            "inflight_builds": len(self._inflight),
+            "hit_ratio": self._counters["hits"] / lookups if lookups else 0.0,
+            "build_seconds_avg": self._counters["build_seconds_total"] / self._counters["builds"] if self._counters["builds"] else 0.0,
+        }
+
     async def get_agent(self, user: UserSchema) -> Optional[AgentExecutor]:
         """
         Retrieves an agent for the given user.
-        If cached, returns the cached agent.
-        If not, creates a new one, caches it, and returns it.
+        If cached and still fresh, returns the cached agent (refreshing it in the background shortly before expiry).
+        If not, builds a new one; concurrent requests for the same user and config share a single build.
         """
         if not self.llm:
             logging.error("LLM instance not set in AgentManager.")
             return None
 
         user_id = user.id
+        # Use user's MCP config or default if not present
+        # A plain copy: the principal's config is read-only and shared, tools need ordinary dicts
+        mcp_config = thaw_config(user.mcp_config) if user.mcp_config else config.DEFAULT_MCP_CONFIG
+        config_hash = mcp_config_hash(mcp_config)
+        now = time.monotonic()
 
         # Check cache
-        if user_id in self._agent_cache:
+        entry = self._agent_cache.get(user_id)
+        if entry and entry.config_hash == config_hash and not self._is_expired(entry, now):
             # Move to end to show it was recently used
             self._agent_cache.move_to_end(user_id)
-            return self._agent_cache[user_id]
+            entry.last_used = now
+            self._counters["hits"] += 1
+            if not entry.refreshing and now - entry.created_at >= self._ttl - self._refresh_ahead:
+                entry.refreshing = True
+                self._counters["refreshes"] += 1
+                self._spawn(self._refresh(entry, user_id, mcp_config, config_hash))
+            return entry.executor
 
-        # Cache miss - create new agent
-        logging.info(f"Creating new agent for user {user_id}")
-        
-        # Use user's MCP config or default if not present
-        mcp_config = user.mcp_config if user.mcp_config else config.DEFAULT_MCP_CONFIG
-        
-        tools = await setup_tools(self.llm, mcp_config)
-        agent_executor = create_mcp_agent_executor(self.llm, tools)
-
-        if agent_executor:
-            self._agent_cache[user_id] = agent_executor
-            
-            # Enforce cache size
-            if len(self._agent_cache) > self._cache_size:
-                removed_id, _ = self._agent_cache.popitem(last=False) # Remove first (LRU)
-                logging.info(f"Evicted agent for user {removed_id} from cache.")
-        
-        return agent_executor
+        # Cache miss, expired entry or changed config - build a new agent
+        self._counters["misses"] += 1
+        if entry:
+            self._evict(user_id)
+        return await self._build_shared(user_id, mcp_config, config_hash)
+
+    def tool_scope(self, user_id: int) -> Optional[str]:
+        """Identifies the cached agent's MCP config and tool set, for scoping cached responses."""
+        entry = self._agent_cache.get(user_id)
+        if entry is None:
+            return None
+        return hashlib.sha256(json.dumps([entry.config_hash, entry.tool_names]).encode()).hexdigest()
 
     def clear_user_agent(self, user_id: int):
         """Removes a user's agent from the cache. Call this when config updates."""
         if user_id in self._agent_cache:
-            del self._agent_cache[user_id]
+            self._evict(user_id)
             logging.info(f"Cleared agent cache for user {user_id}")
 
+    def _is_expired(self, entry: _AgentEntry, now: float) -> bool:
+        return now - entry.created_at >= self._ttl or now - entry.last_used >= self._idle_ttl
+
+    async def _refresh(self, entry: _AgentEntry, user_id: int, mcp_config: Dict[str, Any], config_hash: str):
+        """Rebuilds an entry ahead of its expiry; a failed build leaves it refreshable again on the next hit."""
+        try:
+            await self._build_shared(user_id, mcp_config, config_hash)
+        finally:
+            entry.refreshing = False
+
+    async def _build_shared(self, user_id: int, mcp_config: Dict[str, Any], config_hash: str) -> Optional[AgentExecutor]:
+        key = (user_id, config_hash)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._build(user_id, mcp_config, config_hash))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shield so one cancelled caller does not abort the build the others are waiting on
+        return await asyncio.shield(task)
+
+    async def _build(self, user_id: int, mcp_config: Dict[str, Any], config_hash: str) -> Optional[AgentExecutor]:
+        logging.info(f"Creating new agent for user {user_id}")
+        started = time.perf_counter()
+        exit_stack = AsyncExitStack()
+        try:
+            with span("agent_build"):
+                tools = await setup_tools(self.llm, mcp_config, exit_stack=exit_stack)
+            tool_names = tuple(sorted(tool.name for tool in tools))
+            agent_executor = create_mcp_agent_executor(self.llm, tools)
+        except Exception as e:
+            logging.error(f"❌ Error creating agent for user {user_id}: {e}")
+            agent_executor = None
+
+        if not agent_executor:
+            self._counters["build_failures"] += 1
+            await exit_stack.aclose()
+            return None
+
+        elapsed = time.perf_counter() - started
+        self._counters["builds"] += 1
+        self._counters["build_seconds_total"] += elapsed
+        self._counters["build_seconds_max"] = max(self._counters["build_seconds_max"], elapsed)
+
+        now = time.monotonic()
+        previous = self._agent_cache.pop(user_id, None)
+        self._agent_cache[user_id] = _AgentEntry(
+            executor=agent_executor,
+            config_hash=config_hash,
+            exit_stack=exit_stack,
+            tool_names=tool_names,
+            created_at=now,
+            last_used=now,
+        )
+        if previous:
+            self._retire(previous)
+
+        # Enforce cache size
+        while len(self._agent_cache) > self._cache_size:
+            removed_id, removed = self._agent_cache.popitem(last=False) # Remove first (LRU)
+            self._counters["evictions"] += 1
+            self._retire(removed)
+            logging.info(f"Evicted agent for user {removed_id} from cache.")
+
+        return agent_executor
+
+    def _evict(self, user_id: int):
+        entry = self._agent_cache.pop(user_id, None)
+        if entry:
+            self._counters["evictions"] += 1
+            self._retire(entry)
+
+    def _retire(self, entry: _AgentEntry):
+        # Turns that already hold this executor may still be calling its tools, so close after a grace period
+        self._spawn(self._close_entry(entry, delay=config.AGENT_CLOSE_GRACE_SECONDS))
+
+    async def _close_entry(self, entry: _AgentEntry, delay: float = 0):
+        if delay:
+            await asyncio.sleep(delay)
+        try:
+            await entry.exit_stack.aclose()
+        except Exception as e:
+            logging.error(f"❌ Error closing agent MCP connections: {e}")
+
+    async def _sweep_forever(self):
+        while True:
+            await asyncio.sleep(config.AGENT_CACHE_SWEEP_SECONDS)
+            now = time.monotonic()
+            for user_id in [uid for uid, entry in self._agent_cache.items() if self._is_expired(entry, now)]:
+                self._evict(user_id)
+                logging.info(f"Evicted expired agent for user {user_id}.")
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
 # Global instance
 agent_manager = AgentManager()
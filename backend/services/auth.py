@@ -6,12 +6,13 @@ from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 from core.database import get_db_session
 from services import user as user_crud
-from models.user import User
-from core.schemas import TokenData
+from core.schemas import TokenData, UserPrincipal
+from core.metrics import span
+from services.principal_cache import principal_cache
+from services.llm import llm_user
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
 from core.config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
-from core.security import verify_password
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -23,7 +24,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(db: AsyncSession = Depends(get_db_session), token: str = Depends(oauth2_scheme)) -> User:
+async def get_current_user(db: AsyncSession = Depends(get_db_session), token: str = Depends(oauth2_scheme)) -> UserPrincipal:
+    """Resolves the bearer token to the user, from the principal cache when possible."""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -37,7 +39,13 @@ async def get_current_user(db: AsyncSession = Depends(get_db_session), token: st
         token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    user = await user_crud.get_user_by_username(db, username=token_data.username)
-    if user is None:
-        raise credentials_exception
-    return user
+    principal = principal_cache.get(token_data.username)
+    if principal is None:
+        with span("auth"):
+            user = await user_crud.get_user_by_username(db, username=token_data.username)
+        if user is None:
+            raise credentials_exception
+        principal = principal_cache.put(token_data.username, user)
+    # LLM calls made for this request (including its streams and tasks) count against this user's rate limit
+    llm_user.set(principal.id)
+    return principal
@@ -1,73 +1,245 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy import or_, update, func, tuple_, literal
+from sqlalchemy.ext.asyncio import AsyncConnection
 from models.chat import ChatSession, ChatMessage
 from uuid import uuid4
-from typing import List
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
 from core.schemas import LLMOutputBlock
+from core.metrics import span
+from core import config
+from services.message_converter import message_text
 
-async def create_chat_session(db: AsyncSession, user_id: int, initial_message: str):
+def _encode_payload(payload: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+def _decode_payload(cursor: str) -> dict:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor.") from e
+    if not isinstance(payload, dict):
+        raise ValueError("Invalid cursor.")
+    return payload
+
+def encode_cursor(row_id: Any) -> str:
+    """Opaque message page cursor; it names the last row of a page and the query re-reads that row's sort key."""
+    return _encode_payload({"id": row_id})
+
+def decode_cursor(cursor: str) -> Any:
+    """Returns the row id inside a cursor; raises ``ValueError`` for malformed cursors."""
+    try:
+        return _decode_payload(cursor)["id"]
+    except KeyError as e:
+        raise ValueError("Invalid cursor.") from e
+
+def encode_session_cursor(session: ChatSession) -> str:
+    """Opaque session page cursor carrying the full sort key ``(updated_at, id)`` of the page's last session.
+
+    ``updated_at`` changes whenever a session gets a message, so re-reading it from the anchor row
+    (as message cursors do with the immutable ``created_at``) would move the page boundary.
+    """
+    return _encode_payload({"updated_at": session.updated_at.isoformat(), "id": session.id})
+
+def decode_session_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Returns ``(updated_at, id)`` from a session cursor; raises ``ValueError`` for malformed cursors."""
+    payload = _decode_payload(cursor)
+    updated_at, session_id = payload.get("updated_at"), payload.get("id")
+    if not isinstance(updated_at, str) or not isinstance(session_id, str):
+        raise ValueError("Invalid cursor.")
+    return datetime.fromisoformat(updated_at), session_id
+
+def new_chat_session(user_id: int, initial_message: str) -> Tuple[ChatSession, ChatMessage]:
+    """Builds (without persisting) a new session and its first user message."""
     session_id = str(uuid4())
     initial_title = initial_message[:30] + "..."
-    
     new_session = ChatSession(id=session_id, user_id=user_id, title=initial_title)
-    db.add(new_session)
-    await db.commit()
-    await db.refresh(new_session)
-    
-    user_message = ChatMessage(
-        chat_session_id=session_id,
-        role="user",
-        content={"text": initial_message}
-    )
-    db.add(user_message)
-    await db.commit()
-    await db.refresh(user_message)
-    
-    return new_session, user_message
+    return new_session, new_user_message(session_id, initial_message)
 
-async def add_ai_message_to_session(db: AsyncSession, session_id: str, ai_response_content: LLMOutputBlock, tools_used: List[str] = None, tool_calls: List[dict] = None):
-    """Adds an AI message to a session, optionally including tools used."""
-    ai_message = ChatMessage(
+def new_user_message(session_id: str, content: str) -> ChatMessage:
+    return ChatMessage(chat_session_id=session_id, role="user", content={"text": content})
+
+def new_ai_message(session_id: str, ai_response_content: LLMOutputBlock, tools_used: List[str] = None, tool_calls: List[dict] = None, status: Optional[str] = None) -> ChatMessage:
+    """Builds (without persisting) an AI message; ``status`` marks turns that did not complete (e.g. "cancelled")."""
+    content = ai_response_content.model_dump()
+    if status:
+        content["status"] = status
+    return ChatMessage(
         chat_session_id=session_id,
         role="ai",
-        content=ai_response_content.model_dump(),
+        content=content,
         tool_used=", ".join(tools_used) if tools_used else None,
         tool_calls=tool_calls
     )
-    db.add(ai_message)
-    await db.commit()
-    await db.refresh(ai_message)
+
+def message_preview(message: ChatMessage) -> str:
+    text = " ".join(message_text(message).split())
+    return text if len(text) <= config.SESSION_PREVIEW_CHARS else text[:config.SESSION_PREVIEW_CHARS - 1] + "…"
+
+async def save_turn(db: AsyncSession, *records: Any, touch_session_id: Optional[str] = None):
+    """Writes the records staged for one chat turn in a single transaction.
+
+    Ids and server defaults come back through INSERT ... RETURNING (``eager_defaults``), so the
+    records can be returned to the client without a refresh. The session's activity columns
+    (``updated_at``, ``last_message_at``, ``message_count``, preview) are maintained in the same
+    transaction: directly on a staged new session, or with one UPDATE of ``touch_session_id``.
+    """
+    messages = [record for record in records if isinstance(record, ChatMessage) and not record.is_summary]
+    new_session = next((record for record in records if isinstance(record, ChatSession)), None)
+    with span("persist"):
+        db.add_all(records)
+        if new_session is not None:
+            # last_message_at comes from the column default, fetched back with the insert
+            new_session.message_count = len(messages)
+            if messages:
+                new_session.last_message_preview = message_preview(messages[-1])
+        elif touch_session_id:
+            values = {"updated_at": func.now()}
+            if messages:
+                # A NULL count stays NULL (NULL + n) so the backfill still recognizes the session
+                values.update(
+                    last_message_at=func.now(),
+                    message_count=ChatSession.message_count + len(messages),
+                    last_message_preview=message_preview(messages[-1]),
+                )
+            await db.execute(
+                update(ChatSession)
+                .where(ChatSession.id == touch_session_id)
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+        await db.commit()
+
+async def create_chat_session(db: AsyncSession, user_id: int, initial_message: str):
+    new_session, user_message = new_chat_session(user_id, initial_message)
+    await save_turn(db, new_session, user_message)
+    return new_session, user_message
+
+async def add_ai_message_to_session(db: AsyncSession, session_id: str, ai_response_content: LLMOutputBlock, tools_used: List[str] = None, tool_calls: List[dict] = None):
+    """Adds an AI message to a session, optionally including tools used."""
+    ai_message = new_ai_message(session_id, ai_response_content, tools_used, tool_calls)
+    await save_turn(db, ai_message, touch_session_id=session_id)
     return ai_message
 
 async def get_chat_session(db: AsyncSession, session_id: str):
     result = await db.execute(select(ChatSession).filter(ChatSession.id == session_id))
     return result.scalars().first()
 
+async def get_chat_message(db: AsyncSession, session_id: str, message_id: int) -> Optional[ChatMessage]:
+    result = await db.execute(
+        select(ChatMessage).filter(ChatMessage.id == message_id, ChatMessage.chat_session_id == session_id)
+    )
+    return result.scalars().first()
+
 async def get_chat_messages(db: AsyncSession, session_id: str):
     result = await db.execute(
         select(ChatMessage)
-        .filter(ChatMessage.chat_session_id == session_id)
-        .order_by(ChatMessage.created_at)
+        .filter(
+            ChatMessage.chat_session_id == session_id,
+            or_(ChatMessage.is_summary == 0, ChatMessage.is_summary.is_(None))
+        )
+        # Messages written in one transaction share created_at on Postgres, so break ties by id
+        .order_by(ChatMessage.created_at, ChatMessage.id)
     )
     return result.scalars().all()
 
-async def get_user_sessions(db: AsyncSession, user_id: int):
+async def get_chat_messages_page(
+    db: AsyncSession,
+    session_id: str,
+    limit: int,
+    before: Optional[int] = None,
+    after: Optional[int] = None
+) -> Tuple[List[ChatMessage], bool, bool]:
+    """Returns one page of messages in chronological order, plus whether older and newer messages exist.
+
+    Keyset pagination on ``(created_at, id)``: without ``before``/``after`` the page is the latest
+    ``limit`` messages (tail first); ``before``/``after`` are message ids bounding the page.
+    """
+    sort_key = tuple_(ChatMessage.created_at, ChatMessage.id)
+    query = select(ChatMessage).filter(
+        ChatMessage.chat_session_id == session_id,
+        or_(ChatMessage.is_summary == 0, ChatMessage.is_summary.is_(None))
+    )
+    anchor_id = after if after is not None else before
+    if anchor_id is not None:
+        # Compare against the stored timestamp so the cursor never round-trips a datetime through Python
+        anchor_created_at = (
+            select(ChatMessage.created_at)
+            .filter(ChatMessage.id == anchor_id, ChatMessage.chat_session_id == session_id)
+            .scalar_subquery()
+        )
+        anchor = tuple_(anchor_created_at, anchor_id)
+        query = query.filter(sort_key > anchor if after is not None else sort_key < anchor)
+
+    if after is not None:
+        result = await db.execute(query.order_by(ChatMessage.created_at, ChatMessage.id).limit(limit + 1))
+        messages = list(result.scalars().all())
+        has_newer = len(messages) > limit
+        return messages[:limit], True, has_newer
+
+    result = await db.execute(query.order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc()).limit(limit + 1))
+    messages = list(result.scalars().all())
+    has_older = len(messages) > limit
+    messages = messages[:limit]
+    messages.reverse()
+    return messages, has_older, before is not None
+
+async def get_user_sessions(
+    db: AsyncSession,
+    user_id: int,
+    limit: int,
+    cursor: Optional[Tuple[datetime, str]] = None
+) -> Tuple[List[ChatSession], bool]:
+    """Returns a page of the user's sessions, most recently active first, and whether more follow.
+
+    ``cursor`` is the decoded ``(updated_at, id)`` of the last session of the previous page.
+    """
+    query = select(ChatSession).filter(ChatSession.user_id == user_id)
+    if cursor is not None:
+        anchor_updated_at, anchor_id = cursor
+        if db.bind.dialect.name == "sqlite":
+            # SQLite compares the stored text; updated_at is always written as CURRENT_TIMESTAMP (see
+            # backfill_session_updated_at), so bind the anchor in that format rather than as a DateTime,
+            # which would add a fraction. The raw column keeps ix_chat_sessions_user_activity usable.
+            anchor = literal(anchor_updated_at.isoformat(sep=" "))
+        else:
+            anchor = literal(anchor_updated_at, ChatSession.updated_at.type)
+        query = query.filter(tuple_(ChatSession.updated_at, ChatSession.id) < tuple_(anchor, anchor_id))
     result = await db.execute(
-        select(ChatSession)
-        .filter(ChatSession.user_id == user_id)
-        .order_by(ChatSession.updated_at.asc())
+        query.order_by(ChatSession.updated_at.desc(), ChatSession.id.desc()).limit(limit + 1)
     )
-    return result.scalars().all()
+    sessions = list(result.scalars().all())
+    return sessions[:limit], len(sessions) > limit
 
-async def add_user_message_to_session(db: AsyncSession, session_id: str, content: str):
-    user_message = ChatMessage(
-        chat_session_id=session_id,
-        role="user",
-        content={"text": content}
+async def backfill_session_updated_at(conn: AsyncConnection):
+    """Sets ``updated_at`` on sessions created before it was maintained (last message time, else creation time).
+
+    On SQLite it also rewrites values stored in another text format (e.g. with a fraction) to the
+    ``CURRENT_TIMESTAMP`` one, so session listings can compare and sort the raw column.
+    """
+    last_message_at = (
+        select(func.max(ChatMessage.created_at))
+        .where(ChatMessage.chat_session_id == ChatSession.id)
+        .scalar_subquery()
     )
-    db.add(user_message)
-    await db.commit()
-    await db.refresh(user_message)
+    await conn.execute(
+        update(ChatSession)
+        .where(ChatSession.updated_at.is_(None))
+        .values(updated_at=func.coalesce(last_message_at, ChatSession.created_at))
+    )
+    if conn.dialect.name == "sqlite":
+        await conn.execute(
+            update(ChatSession)
+            .where(ChatSession.updated_at != func.datetime(ChatSession.updated_at))
+            .values(updated_at=func.datetime(ChatSession.updated_at))
+        )
+
+async def add_user_message_to_session(db: AsyncSession, session_id: str, content: str):
+    user_message = new_user_message(session_id, content)
+    await save_turn(db, user_message, touch_session_id=session_id)
     return user_message
 
 async def delete_chat_session(db: AsyncSession, session_id: str):
@@ -82,3 +254,52 @@ async def delete_chat_session(db: AsyncSession, session_id: str):
     )
     await db.commit()
     return result.rowcount > 0
+
+async def backfill_session_activity(db: AsyncSession, batch_size: int = 500, recompute: bool = False) -> int:
+    """Fills ``last_message_at``, ``message_count`` and the preview for sessions missing them.
+
+    Works in batches of ``batch_size`` sessions, one transaction each; ``recompute`` also refreshes
+    sessions that already have a count. Returns the number of sessions updated.
+    """
+    not_summary = or_(ChatMessage.is_summary == 0, ChatMessage.is_summary.is_(None))
+    updated = 0
+    last_id = ""
+    while True:
+        query = select(ChatSession.id).filter(ChatSession.id > last_id)
+        if not recompute:
+            query = query.filter(ChatSession.message_count.is_(None))
+        session_ids = (await db.execute(query.order_by(ChatSession.id).limit(batch_size))).scalars().all()
+        if not session_ids:
+            return updated
+        last_id = session_ids[-1]
+
+        stats = {
+            session_id: (count, last_at, last_message_id)
+            for session_id, count, last_at, last_message_id in (await db.execute(
+                select(ChatMessage.chat_session_id, func.count(ChatMessage.id), func.max(ChatMessage.created_at), func.max(ChatMessage.id))
+                .filter(ChatMessage.chat_session_id.in_(session_ids), not_summary)
+                .group_by(ChatMessage.chat_session_id)
+            )).all()
+        }
+        last_messages = {
+            message.id: message
+            for message in (await db.execute(
+                select(ChatMessage).filter(ChatMessage.id.in_([last_message_id for _, _, last_message_id in stats.values()]))
+            )).scalars().all()
+        }
+        for session_id in session_ids:
+            count, last_at, last_message_id = stats.get(session_id, (0, None, None))
+            last_message = last_messages.get(last_message_id)
+            await db.execute(
+                update(ChatSession)
+                .where(ChatSession.id == session_id)
+                .values(
+                    message_count=count,
+                    last_message_at=last_at,
+                    last_message_preview=message_preview(last_message) if last_message is not None else None,
+                    updated_at=func.coalesce(last_at, ChatSession.updated_at, ChatSession.created_at),
+                )
+                .execution_options(synchronize_session=False)
+            )
+        await db.commit()
+        updated += len(session_ids)
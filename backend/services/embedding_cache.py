@@ -0,0 +1,118 @@
+from typing import Dict, Any, List, Optional
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import numpy as np # type: ignore
+from core import config
+
+SQL_BATCH_SIZE = 500 # Keys per IN (...) lookup, below SQLite's host parameter limit
+TOUCH_INTERVAL_SECONDS = 3600 # Hits refresh last_used at most this often, so reads rarely write
+EVICTION_CHECK_EVERY = 1000 # Rows written between size checks
+ROW_OVERHEAD_BYTES = 64 # Key, timestamp and b-tree overhead per row, for the size estimate
+
+class EmbeddingCache:
+    """Content-addressed, on-disk embedding cache shared by the API and ingestion.
+
+    Rows are keyed by the SHA-256 of model name and text and hold the vector as a packed float32 blob.
+    The SQLite file runs in WAL mode, so uvicorn workers and ``populate_vectors.py`` can use it at the
+    same time. Once the estimated size passes ``max_mb`` the least recently used rows are evicted.
+    Errors are logged and treated as misses; the cache never fails an embedding call.
+    """
+
+    def __init__(self, path: str, max_mb: float, enabled: bool = True):
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._written_since_check = EVICTION_CHECK_EVERY # Check the size on the first write
+
+    @staticmethod
+    def key(model_name: str, text: str) -> bytes:
+        return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).digest()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_last_used ON embeddings (last_used)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get_many(self, model_name: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Cached vectors in the order of ``texts``; None for misses."""
+        if not self.enabled or not texts:
+            return [None] * len(texts)
+        keys = [self.key(model_name, text) for text in texts]
+        found: Dict[bytes, bytes] = {}
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                stale = []
+                for start in range(0, len(keys), SQL_BATCH_SIZE):
+                    page = keys[start:start + SQL_BATCH_SIZE]
+                    placeholders = ",".join("?" * len(page))
+                    rows = conn.execute(f"SELECT key, vector, last_used FROM embeddings WHERE key IN ({placeholders})", page)
+                    for key, vector, last_used in rows:
+                        found[key] = vector
+                        if now - last_used > TOUCH_INTERVAL_SECONDS:
+                            stale.append((now, key))
+                if stale:
+                    conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", stale)
+                    conn.commit()
+        except sqlite3.Error as e:
+            logging.warning(f"⚠️ Embedding cache read failed: {e}")
+            return [None] * len(texts)
+
+        vectors = [np.frombuffer(found[key], dtype=np.float32).tolist() if key in found else None for key in keys]
+        hits = sum(1 for vector in vectors if vector is not None)
+        self.hits += hits
+        self.misses += len(vectors) - hits
+        return vectors
+
+    def put_many(self, model_name: str, texts: List[str], vectors: List[List[float]]):
+        if not self.enabled or not texts:
+            return
+        now = time.time()
+        rows = [(self.key(model_name, text), np.asarray(vector, dtype=np.float32).tobytes(), now) for text, vector in zip(texts, vectors)]
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows)
+                conn.commit()
+                self._written_since_check += len(rows)
+                if self._written_since_check >= EVICTION_CHECK_EVERY:
+                    self._evict(conn, len(rows[0][1]))
+        except sqlite3.Error as e:
+            logging.warning(f"⚠️ Embedding cache write failed: {e}")
+
+    def _evict(self, conn: sqlite3.Connection, vector_bytes: int):
+        """Drops the least recently used rows down to 90% of the budget; freed pages are reused by later writes."""
+        self._written_since_check = 0
+        max_rows = max(self.max_bytes // (vector_bytes + ROW_OVERHEAD_BYTES), 1)
+        (count,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        if count <= max_rows:
+            return
+        excess = count - int(max_rows * 0.9)
+        conn.execute("DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (excess,))
+        conn.commit()
+        self.evictions += excess
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+# Global instance
+embedding_cache = EmbeddingCache(config.EMBEDDING_CACHE_PATH, config.EMBEDDING_CACHE_MAX_MB, enabled=config.EMBEDDING_CACHE_ENABLED)
@@ -0,0 +1,111 @@
+from typing import List, Optional, Set, Tuple
+import asyncio
+import threading
+import logging
+from langchain_core.embeddings import Embeddings # type: ignore
+from langchain_huggingface import HuggingFaceEmbeddings # type: ignore
+from core import config
+from services.embedding_cache import embedding_cache, EmbeddingCache
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+class EmbeddingEngine(Embeddings):
+    """Process-wide, lazily loaded sentence-transformers model.
+
+    The model is loaded once behind a lock, so it is safe to share between the event loop
+    and worker threads. Concurrent ``aembed_query`` calls are merged by a micro-batcher into a
+    single ``encode`` call that runs off the event loop. Every path goes through the on-disk
+    ``cache`` first, so only texts never embedded before reach the model.
+    """
+
+    def __init__(
+        self,
+        model_name: str = EMBEDDING_MODEL_NAME,
+        batch_window_ms: float = config.EMBEDDING_BATCH_WINDOW_MS,
+        max_batch_size: int = config.EMBEDDING_MAX_BATCH_SIZE,
+        cache: EmbeddingCache = embedding_cache
+    ):
+        self.model_name = model_name
+        self.cache = cache
+        self._batch_window = batch_window_ms / 1000
+        self._max_batch_size = max_batch_size
+        self._model: Optional[HuggingFaceEmbeddings] = None
+        self._load_lock = threading.Lock()
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._background_tasks: Set[asyncio.Task] = set() # Strong references: the loop only keeps weak ones
+
+    @property
+    def model(self) -> HuggingFaceEmbeddings:
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    logging.info(f"Loading embedding model {self.model_name}")
+                    self._model = HuggingFaceEmbeddings(
+                        model_name=self.model_name,
+                        model_kwargs={'device': 'cpu'},
+                        encode_kwargs={'normalize_embeddings': True}
+                    )
+        return self._model
+
+    def warmup(self):
+        """Loads the weights and runs one encode so the first real query pays no start-up cost."""
+        self.model.embed_query("warmup")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.cache.get_many(self.model_name, texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing:
+            encoded = dict(zip(missing, self.model.embed_documents(missing)))
+            self.cache.put_many(self.model_name, missing, [encoded[text] for text in missing])
+            vectors = [vector if vector is not None else encoded[text] for text, vector in zip(texts, vectors)]
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        # The model encodes queries and documents the same way, so both share cache entries
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Queues the query for the next micro-batch and waits for its embedding."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self._max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self._batch_window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._encode_batch(batch))
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+
+    async def _encode_batch(self, batch: List[Tuple[str, asyncio.Future]]):
+        # Queries whose turn was cancelled while queued are not encoded
+        batch = [(text, future) for text, future in batch if not future.cancelled()]
+        if not batch:
+            return
+        unique_texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            vectors = await self.aembed_documents(unique_texts)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        by_text = dict(zip(unique_texts, vectors))
+        for text, future in batch:
+            if not future.done():
+                future.set_result(by_text[text])
+
+# Global instance
+embedding_engine = EmbeddingEngine()
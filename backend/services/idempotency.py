@@ -0,0 +1,74 @@
+from typing import Any, Awaitable, Callable, Dict, Tuple
+from collections import OrderedDict
+from dataclasses import dataclass
+import asyncio
+import hashlib
+import json
+import time
+from core import config
+
+class IdempotencyKeyReusedError(Exception):
+    """Raised when an idempotency key is sent again with a different request body."""
+
+@dataclass
+class _Entry:
+    fingerprint: str
+    task: asyncio.Task
+    created_at: float
+
+def request_fingerprint(payload: Any) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+class IdempotencyStore:
+    """In-process store of results keyed by ``Idempotency-Key``.
+
+    The first request with a key starts its work as a detached task; retries with the same key and
+    body attach to that task while it runs and replay its result afterwards. Failed runs are
+    forgotten so the client can retry them. Results are kept for ``IDEMPOTENCY_TTL_SECONDS``.
+    """
+
+    def __init__(self, ttl_seconds: float = config.IDEMPOTENCY_TTL_SECONDS, max_entries: int = config.IDEMPOTENCY_MAX_ENTRIES):
+        self._ttl = ttl_seconds
+        self._max_entries = max_entries
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._counters: Dict[str, int] = {"runs": 0, "replays": 0, "attached": 0, "conflicts": 0}
+
+    async def run(self, key: str, fingerprint: str, work: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Returns ``(result, replayed)``; ``replayed`` is True when the result came from an earlier request."""
+        self._expire()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.fingerprint != fingerprint:
+                self._counters["conflicts"] += 1
+                raise IdempotencyKeyReusedError("Idempotency key was already used with a different request.")
+            self._counters["replays" if entry.task.done() else "attached"] += 1
+            return await asyncio.shield(entry.task), True
+
+        task = asyncio.create_task(work())
+        self._entries[key] = _Entry(fingerprint, task, time.monotonic())
+        self._counters["runs"] += 1
+        task.add_done_callback(lambda t: self._forget_failed(key, t))
+        # Shield so a disconnecting client does not cancel work that a retry can still attach to
+        return await asyncio.shield(task), False
+
+    def _forget_failed(self, key: str, task: asyncio.Task):
+        if task.cancelled() or task.exception() is not None:
+            entry = self._entries.get(key)
+            if entry is not None and entry.task is task:
+                del self._entries[key]
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            expired = now - entry.created_at >= self._ttl
+            # Over capacity, drop the oldest finished results, never a run that retries may attach to
+            if not expired and not (len(self._entries) >= self._max_entries and entry.task.done()):
+                break
+            del self._entries[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {**self._counters, "size": len(self._entries)}
+
+# Global instance
+idempotency_store = IdempotencyStore()
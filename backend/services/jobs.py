@@ -0,0 +1,511 @@
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from uuid import uuid4
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from sqlalchemy import select, update, func # type: ignore
+from core import config
+from core.database import AsyncSessionLocal
+from models.job import ChatJob
+
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled", "timed_out")
+
+class JobQueueFullError(Exception):
+    """Raised when ``JOB_MAX_QUEUED`` jobs are already waiting."""
+
+class JobStoppedError(Exception):
+    """Raised by a handler whose work stopped early; the job finishes with ``status`` and the partial ``result``."""
+
+    def __init__(self, status: str, message: str, result: Optional[Dict[str, Any]] = None):
+        super().__init__(message)
+        self.status = status
+        self.result = result
+
+def _utcnow() -> datetime:
+    # Naive UTC, matching the DateTime columns on both SQLite and Postgres
+    return datetime.utcnow()
+
+@dataclass
+class Job:
+    id: str
+    user_id: int
+    session_id: str
+    content: str
+    priority: int = 5 # Lower runs first
+    status: str = "queued"
+    created_at: datetime = field(default_factory=_utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    user_message_id: Optional[int] = None
+    cancel_requested: bool = False
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+class JobQueue(ABC):
+    """Storage and ordering of jobs. Claims go to the lowest priority value, then the oldest job."""
+
+    @abstractmethod
+    async def submit(self, job: Job):
+        ...
+
+    @abstractmethod
+    async def claim(self) -> Optional[Job]:
+        """Marks the next queued job as running and returns it, or None when nothing is queued."""
+
+    @abstractmethod
+    async def finish(self, job: Job):
+        """Stores a job's final status, result and error."""
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[Job]:
+        ...
+
+    async def record_user_message(self, job: Job):
+        """Stores ``job.user_message_id`` once the job's user message is saved."""
+
+    @abstractmethod
+    async def cancel_queued(self, job_id: str) -> bool:
+        """Cancels a job that has not started yet; False if it is already running or finished."""
+
+    @abstractmethod
+    async def request_cancel(self, job_id: str) -> bool:
+        """Flags a running job for its worker to stop; False if it is not running."""
+
+    @abstractmethod
+    async def queued_count(self) -> int:
+        ...
+
+    async def requeue_stale(self, started_before: datetime) -> int:
+        """Puts jobs left running by a process that died back in the queue."""
+        return 0
+
+class MemoryJobQueue(JobQueue):
+    """In-process queue: a heap of queued job ids plus the job records, kept ``JOB_RETENTION_SECONDS``."""
+
+    def __init__(self, retention_seconds: float = config.JOB_RETENTION_SECONDS):
+        self._retention = retention_seconds
+        self._jobs: Dict[str, Job] = {}
+        self._heap: List[Tuple[int, int, str]] = []
+        self._sequence = itertools.count()
+        self._queued = 0
+
+    async def submit(self, job: Job):
+        self._prune()
+        self._jobs[job.id] = job
+        heapq.heappush(self._heap, (job.priority, next(self._sequence), job.id))
+        self._queued += 1
+
+    async def claim(self) -> Optional[Job]:
+        while self._heap:
+            _, _, job_id = heapq.heappop(self._heap)
+            job = self._jobs.get(job_id)
+            if job is None or job.status != "queued": # Cancelled while queued
+                continue
+            self._queued -= 1
+            job.status = "running"
+            job.started_at = _utcnow()
+            return job
+        return None
+
+    async def finish(self, job: Job):
+        self._jobs[job.id] = job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    async def cancel_queued(self, job_id: str) -> bool:
+        job = self._jobs.get(job_id)
+        if job is None or job.status != "queued":
+            return False
+        self._queued -= 1
+        job.status = "cancelled"
+        job.finished_at = _utcnow()
+        return True
+
+    async def request_cancel(self, job_id: str) -> bool:
+        job = self._jobs.get(job_id)
+        if job is None or job.status != "running":
+            return False
+        job.cancel_requested = True
+        return True
+
+    async def queued_count(self) -> int:
+        return self._queued
+
+    def _prune(self):
+        cutoff = _utcnow() - timedelta(seconds=self._retention)
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+class SQLJobQueue(JobQueue):
+    """Queue stored in the ``chat_jobs`` table, shared by every app process using the same database.
+
+    A claim is a conditional UPDATE (``status = 'queued'``), so two workers never run the same job.
+    """
+
+    async def submit(self, job: Job):
+        async with AsyncSessionLocal() as db:
+            db.add(ChatJob(
+                id=job.id,
+                user_id=job.user_id,
+                chat_session_id=job.session_id,
+                content=job.content,
+                priority=job.priority,
+                status=job.status,
+                created_at=job.created_at,
+            ))
+            await db.commit()
+
+    async def claim(self) -> Optional[Job]:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(ChatJob.id)
+                .where(ChatJob.status == "queued")
+                .order_by(ChatJob.priority, ChatJob.created_at, ChatJob.id)
+                .limit(config.JOB_WORKERS + 1)
+            )
+            for job_id in result.scalars().all():
+                claimed = await db.execute(
+                    update(ChatJob)
+                    .where(ChatJob.id == job_id, ChatJob.status == "queued")
+                    .values(status="running", started_at=_utcnow())
+                )
+                await db.commit()
+                if claimed.rowcount == 1:
+                    return await self.get(job_id)
+        return None
+
+    async def finish(self, job: Job):
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(ChatJob)
+                .where(ChatJob.id == job.id)
+                .values(status=job.status, result=job.result, error=job.error, finished_at=job.finished_at)
+            )
+            await db.commit()
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        async with AsyncSessionLocal() as db:
+            row = await db.get(ChatJob, job_id)
+        if row is None:
+            return None
+        return Job(
+            id=row.id,
+            user_id=row.user_id,
+            session_id=row.chat_session_id,
+            content=row.content,
+            priority=row.priority,
+            status=row.status,
+            created_at=row.created_at,
+            started_at=row.started_at,
+            finished_at=row.finished_at,
+            result=row.result,
+            error=row.error,
+            user_message_id=row.user_message_id,
+            cancel_requested=bool(row.cancel_requested),
+        )
+
+    async def record_user_message(self, job: Job):
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(ChatJob).where(ChatJob.id == job.id).values(user_message_id=job.user_message_id))
+            await db.commit()
+
+    async def cancel_queued(self, job_id: str) -> bool:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(ChatJob)
+                .where(ChatJob.id == job_id, ChatJob.status == "queued")
+                .values(status="cancelled", finished_at=_utcnow())
+            )
+            await db.commit()
+        return result.rowcount == 1
+
+    async def request_cancel(self, job_id: str) -> bool:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(ChatJob)
+                .where(ChatJob.id == job_id, ChatJob.status == "running")
+                .values(cancel_requested=True)
+            )
+            await db.commit()
+        return result.rowcount == 1
+
+    async def queued_count(self) -> int:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(func.count()).select_from(ChatJob).where(ChatJob.status == "queued"))
+        return result.scalar_one()
+
+    async def requeue_stale(self, started_before: datetime) -> int:
+        stale = (ChatJob.status == "running", ChatJob.started_at < started_before)
+        async with AsyncSessionLocal() as db:
+            # A stale job someone asked to cancel is finished as cancelled rather than run again
+            await db.execute(
+                update(ChatJob)
+                .where(*stale, ChatJob.cancel_requested.is_(True))
+                .values(status="cancelled", finished_at=_utcnow())
+            )
+            result = await db.execute(
+                update(ChatJob)
+                .where(*stale)
+                .values(status="queued", started_at=None)
+            )
+            await db.commit()
+        return result.rowcount
+
+def create_job_queue(backend: str = config.JOB_QUEUE_BACKEND) -> JobQueue:
+    if backend == "sql":
+        return SQLJobQueue()
+    if backend != "memory":
+        logging.warning(f"⚠️ Unknown JOB_QUEUE_BACKEND '{backend}', using the in-memory queue.")
+    return MemoryJobQueue()
+
+# Runs one job and returns its result; the callback publishes (event, data) progress to subscribers
+JobHandler = Callable[[Job, Callable[[str, Any], None]], Awaitable[Dict[str, Any]]]
+
+class JobRunner:
+    """Bounded pool of worker tasks that drains a ``JobQueue`` in the background.
+
+    Interactive chat requests never go through here, so a backlog of long jobs cannot slow them down;
+    at most ``JOB_WORKERS`` background turns run at once per process. Progress events are kept in this
+    process for subscribers; job status and results live in the queue backend.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        workers: int = config.JOB_WORKERS,
+        max_queued: int = config.JOB_MAX_QUEUED,
+        poll_seconds: float = config.JOB_POLL_SECONDS,
+        sweep_seconds: float = config.JOB_STALE_SWEEP_SECONDS
+    ):
+        self.queue = queue
+        self._workers = workers
+        self._max_queued = max_queued
+        self._poll_seconds = poll_seconds
+        self._sweep_seconds = sweep_seconds
+        self._handler: Optional[JobHandler] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._sweeper: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._running: Dict[str, asyncio.Task] = {}
+        self._events: Dict[str, List[Tuple[str, Any]]] = {}
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._counters: Dict[str, float] = {
+            "submitted": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "timed_out": 0,
+            "requeued": 0,
+            "runs": 0,
+            "wait_seconds_total": 0.0,
+            "run_seconds_total": 0.0,
+        }
+
+    @property
+    def started(self) -> bool:
+        return bool(self._worker_tasks)
+
+    def start(self, handler: JobHandler):
+        """Starts the workers; ``handler`` runs each job."""
+        if self._worker_tasks:
+            return
+        self._handler = handler
+        self._closing = False
+        self._worker_tasks = [asyncio.create_task(self._work()) for _ in range(self._workers)]
+        self._sweeper = asyncio.create_task(self._sweep_stale())
+
+    async def aclose(self):
+        """Stops the workers. Running jobs are interrupted; the sql backend requeues them later."""
+        self._closing = True
+        tasks = self._worker_tasks + ([self._sweeper] if self._sweeper else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._worker_tasks = []
+        self._sweeper = None
+
+    async def submit(self, user_id: int, session_id: str, content: str, priority: int = 5) -> Job:
+        if await self.queue.queued_count() >= self._max_queued:
+            raise JobQueueFullError(f"{self._max_queued} jobs are already queued.")
+        job = Job(id=str(uuid4()), user_id=user_id, session_id=session_id, content=content, priority=priority)
+        await self.queue.submit(job)
+        self._counters["submitted"] += 1
+        self._events[job.id] = []
+        self._publish(job.id, "job_queued", {"job_id": job.id, "priority": job.priority})
+        self._wakeup.set()
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return await self.queue.get(job_id)
+
+    async def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancels a queued job or stops a running one. Returns the job's current state.
+
+        A job running in another process (sql backend) is flagged with ``cancel_requested``; its
+        worker notices within ``poll_seconds`` and stops it.
+        """
+        if await self.queue.cancel_queued(job_id):
+            self._counters["cancelled"] += 1
+            job = await self.queue.get(job_id)
+            self._publish(job_id, "job_finished", {"job_id": job_id, "status": "cancelled"})
+            self._expire_events(job_id)
+            return job
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+        else:
+            await self.queue.request_cancel(job_id)
+        return await self.queue.get(job_id)
+
+    async def subscribe(self, job_id: str) -> AsyncIterator[Tuple[str, Any]]:
+        """Yields the job's progress events so far, then live ones until it finishes.
+
+        Detailed events exist only in the process that runs the job; elsewhere (sql backend) this
+        polls the queue and yields just ``job_finished``.
+        """
+        if job_id not in self._events:
+            job = await self.queue.get(job_id)
+            if job is None or job.finished:
+                yield "job_finished", {"job_id": job_id, "status": job.status if job else "unknown"}
+                return
+        backlog = list(self._events.get(job_id, []))
+        inbox: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, set()).add(inbox)
+        try:
+            for event, data in backlog:
+                yield event, data
+                if event == "job_finished":
+                    return
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(inbox.get(), timeout=self._poll_seconds)
+                except asyncio.TimeoutError:
+                    job = await self.queue.get(job_id)
+                    if job is None or job.finished:
+                        yield "job_finished", {"job_id": job_id, "status": job.status if job else "unknown"}
+                        return
+                    continue
+                yield event, data
+                if event == "job_finished":
+                    return
+        finally:
+            subscribers = self._subscribers.get(job_id)
+            if subscribers is not None:
+                subscribers.discard(inbox)
+                if not subscribers:
+                    del self._subscribers[job_id]
+
+    def stats(self) -> Dict[str, float]:
+        runs = self._counters["runs"]
+        return {
+            **self._counters,
+            "workers": len(self._worker_tasks),
+            "running": len(self._running),
+            "subscribers": sum(len(subscribers) for subscribers in self._subscribers.values()),
+            "run_seconds_avg": self._counters["run_seconds_total"] / runs if runs else 0.0,
+        }
+
+    def _publish(self, job_id: str, event: str, data: Any):
+        log = self._events.get(job_id)
+        if log is not None:
+            log.append((event, data))
+        for inbox in self._subscribers.get(job_id, ()):
+            inbox.put_nowait((event, data))
+
+    def _expire_events(self, job_id: str):
+        asyncio.get_running_loop().call_later(config.JOB_EVENTS_RETENTION_SECONDS, self._events.pop, job_id, None)
+
+    async def _sweep_stale(self):
+        """Requeues jobs left running by a dead process, once every ``sweep_seconds`` rather than on every claim."""
+        while True:
+            try:
+                # A turn cannot outlive the job timeout, so a job running longer was left behind by a dead process
+                requeued = await self.queue.requeue_stale(_utcnow() - timedelta(seconds=config.JOB_TIMEOUT_SECONDS * 2))
+                if requeued:
+                    self._counters["requeued"] += requeued
+                    logging.warning(f"⚠️ Requeued {requeued} interrupted jobs.")
+                    self._wakeup.set()
+            except Exception as e:
+                logging.error(f"❌ Error requeueing interrupted jobs: {e}")
+            await asyncio.sleep(self._sweep_seconds)
+
+    async def _work(self):
+        while True:
+            try:
+                job = await self.queue.claim()
+            except Exception as e:
+                logging.error(f"❌ Error reading the job queue: {e}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self._poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _watch_cancel(self, job_id: str, turn: asyncio.Task):
+        """Stops ``turn`` once another process flags its job with ``cancel_requested``."""
+        while not turn.done():
+            await asyncio.sleep(self._poll_seconds)
+            try:
+                job = await self.queue.get(job_id)
+            except Exception as e:
+                logging.error(f"❌ Error reading job {job_id}: {e}")
+                continue
+            if job is not None and job.cancel_requested:
+                turn.cancel()
+                return
+
+    async def _run(self, job: Job):
+        self._events.setdefault(job.id, [])
+        self._counters["wait_seconds_total"] += (job.started_at - job.created_at).total_seconds()
+        self._publish(job.id, "job_started", {"job_id": job.id})
+        started = time.perf_counter()
+        turn = asyncio.create_task(self._handler(job, lambda event, data: self._publish(job.id, event, data)))
+        self._running[job.id] = turn
+        watcher = asyncio.create_task(self._watch_cancel(job.id, turn))
+        try:
+            job.result = await turn
+            job.status = "succeeded"
+        except asyncio.CancelledError:
+            if self._closing:
+                raise # Shutting down: leave the job running for the sql backend to requeue
+            job.status = "cancelled"
+        except JobStoppedError as e:
+            job.status = e.status
+            job.result = e.result
+            job.error = str(e)
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(getattr(e, "detail", None) or e)
+            logging.error(f"❌ Job {job.id} failed: {job.error}")
+        finally:
+            watcher.cancel()
+            self._running.pop(job.id, None)
+
+        job.finished_at = _utcnow()
+        self._counters[job.status] += 1
+        self._counters["runs"] += 1
+        self._counters["run_seconds_total"] += time.perf_counter() - started
+        try:
+            await self.queue.finish(job)
+        except Exception as e:
+            logging.error(f"❌ Error storing the result of job {job.id}: {e}")
+        self._publish(job.id, "job_finished", {"job_id": job.id, "status": job.status, "error": job.error})
+        self._expire_events(job.id)
+
+# Global instance
+job_runner = JobRunner(create_job_queue())
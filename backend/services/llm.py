@@ -1,20 +1,417 @@
-from typing import Optional
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple, TypeVar
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+import asyncio
+import logging
+import random
+import time
+import openai # type: ignore
 from langchain_openai import ChatOpenAI # type: ignore
+from langchain_core.outputs import ChatGenerationChunk, ChatResult # type: ignore
+from core import config
+from core.metrics import metrics_callback, LLM_RETRIES, LLM_FALLBACKS, LLM_HEDGES, LLM_LIMITER_WAIT
 
-def initialize_llm(api_key: str, base_url: str, model_name: str) -> Optional[ChatOpenAI]:
-    """Initializes and returns a ChatOpenAI instance."""
+T = TypeVar("T")
+
+# User the current LLM calls are made for; set when a request is authenticated and used for per-user rate limits
+llm_user: ContextVar[Optional[int]] = ContextVar("llm_user", default=None)
+
+class LLMUnavailableError(Exception):
+    """Raised when every attempt on every model failed, or the rate limiter could not admit a call in time."""
+
+    def __init__(self, message: str, retry_after: float = 5.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def _classify(error: BaseException) -> Optional[str]:
+    """Names a retryable upstream failure; None for errors a retry will not fix (bad request, auth, ...)."""
+    if isinstance(error, openai.RateLimitError):
+        return "rate_limited"
+    if isinstance(error, openai.APITimeoutError):
+        return "timeout"
+    if isinstance(error, openai.APIConnectionError):
+        return "connection"
+    if isinstance(error, openai.APIStatusError) and (error.status_code >= 500 or error.status_code == 408):
+        return "server_error"
+    return None
+
+def _retry_delay(error: BaseException, attempt: int) -> float:
+    """Exponential backoff with full jitter, never shorter than the upstream's Retry-After."""
+    delay = random.uniform(0, min(config.LLM_RETRY_MAX_SECONDS, config.LLM_RETRY_BASE_SECONDS * 2 ** attempt))
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        retry_after = float(headers.get("retry-after", 0))
+    except (TypeError, ValueError):
+        retry_after = 0.0
+    return max(delay, min(retry_after, config.LLM_RETRY_MAX_SECONDS))
+
+# First "chunk" of a stream that ended without yielding any
+_END = object()
+
+async def _first_chunk(open_stream: Callable[[], AsyncIterator[T]]) -> Tuple[AsyncIterator[T], Any]:
+    """Opens a stream and waits for its first chunk; returns the stream and that chunk (``_END`` if it was empty)."""
+    stream = open_stream().__aiter__()
+    try:
+        return stream, await stream.__anext__()
+    except StopAsyncIteration:
+        return stream, _END
+
+async def _close_stream(opened: Tuple[AsyncIterator[Any], Any]):
+    aclose = getattr(opened[0], "aclose", None)
+    if aclose is not None:
+        await aclose()
+
+class TokenBucket:
+    """Admits ``rate`` calls per second on average, with bursts of up to ``burst``."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Takes a token and returns how long the caller must wait for it (the balance may go negative)."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self):
+        self.tokens += 1
+
+class AdaptiveLimiter:
+    """Caps concurrent upstream calls with an AIMD limit.
+
+    Every success raises the limit by ``1 / limit`` (one per full window) up to ``max_limit``; a 429 or a
+    timeout halves it, down to ``min_limit``. Waiters are admitted in arrival order.
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = 1):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    def try_acquire(self) -> bool:
+        """Takes a slot only if one is free right now, without queueing."""
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return True
+        return False
+
+    async def acquire(self):
+        if self.try_acquire():
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter # _wake reserves the slot before resolving the waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release() # Granted just as we were cancelled: hand the slot on
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def on_success(self):
+        self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self._wake()
+
+    def on_overload(self):
+        self.limit = max(self.min_limit, self.limit / 2)
+
+    def _wake(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+class LatencyWindow:
+    """Latencies of the most recent successful calls (or first chunks of streams), for the hedging deadline."""
+
+    def __init__(self, size: int = 200):
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def quantile(self, q: float, min_samples: int) -> Optional[float]:
+        if len(self._samples) < min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+class LLMGuard:
+    """Rate limiting, adaptive concurrency, retries, hedging and model fallback for upstream LLM calls.
+
+    One instance is shared by every LLM client of the process, so the limits describe what this
+    process sends to the provider. A call first waits for the global and per-user token buckets
+    (``LLM_RATE_LIMIT_*``), then for a concurrency slot. Retryable failures (429, 5xx, timeouts,
+    connection errors) are retried ``LLM_MAX_RETRIES`` times with jittered backoff, then the call moves
+    on to the next model in ``LLM_FALLBACK_MODELS``. With ``LLM_HEDGE_ENABLED`` an attempt slower than
+    the recent p95 gets a backup request; streams are hedged on their time to first chunk.
+    """
+
+    def __init__(self):
+        self._global_bucket = TokenBucket(config.LLM_RATE_LIMIT_RPS, config.LLM_RATE_LIMIT_BURST) if config.LLM_RATE_LIMIT_RPS > 0 else None
+        self._user_buckets: OrderedDict[int, TokenBucket] = OrderedDict()
+        self.limiter = AdaptiveLimiter(config.LLM_MAX_CONCURRENCY, config.LLM_MIN_CONCURRENCY)
+        self.latencies = LatencyWindow()
+        self.first_chunk_latencies = LatencyWindow()
+        self._counters: Dict[str, int] = {"calls": 0, "retries": 0, "fallbacks": 0, "hedges": 0, "hedge_wins": 0, "hedges_skipped": 0, "rejected": 0, "failures": 0}
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            **self._counters,
+            "concurrency_limit": self.limiter.limit,
+            "in_flight": self.limiter.in_flight,
+            "waiting": self.limiter.waiting,
+            "p95_seconds": self.latencies.quantile(0.95, 1) or 0.0,
+            "first_chunk_p95_seconds": self.first_chunk_latencies.quantile(0.95, 1) or 0.0,
+        }
+
+    def _user_bucket(self, user_id: int) -> TokenBucket:
+        bucket = self._user_buckets.get(user_id)
+        if bucket is None:
+            bucket = TokenBucket(config.LLM_USER_RATE_LIMIT_RPS, config.LLM_USER_RATE_LIMIT_BURST)
+            self._user_buckets[user_id] = bucket
+            while len(self._user_buckets) > config.LLM_USER_BUCKETS_MAX:
+                self._user_buckets.popitem(last=False)
+        self._user_buckets.move_to_end(user_id)
+        return bucket
+
+    def _rate_buckets(self) -> List[TokenBucket]:
+        buckets = [self._global_bucket] if self._global_bucket else []
+        user_id = llm_user.get()
+        if user_id is not None and config.LLM_USER_RATE_LIMIT_RPS > 0:
+            buckets.append(self._user_bucket(user_id))
+        return buckets
+
+    async def _admit(self):
+        """Waits for the rate limits and a concurrency slot; pair with ``limiter.release``."""
+        started = time.perf_counter()
+        buckets = self._rate_buckets()
+        waits = [bucket.reserve() for bucket in buckets]
+        wait = max(waits, default=0.0)
+        if wait > config.LLM_RATE_LIMIT_MAX_WAIT_SECONDS:
+            for bucket in buckets:
+                bucket.refund()
+            self._counters["rejected"] += 1
+            raise LLMUnavailableError("Too many requests to the language model; try again shortly.", retry_after=wait)
+        if wait:
+            await asyncio.sleep(wait)
+        await self.limiter.acquire()
+        LLM_LIMITER_WAIT.observe(time.perf_counter() - started)
+
+    def _try_admit(self) -> bool:
+        """Takes a rate token and a concurrency slot only if both are free now; pair a True with ``limiter.release``."""
+        buckets = self._rate_buckets()
+        waits = [bucket.reserve() for bucket in buckets]
+        if max(waits, default=0.0) > 0 or not self.limiter.try_acquire():
+            for bucket in buckets:
+                bucket.refund()
+            return False
+        return True
+
+    def _on_failure(self, error: BaseException, reason: str):
+        if reason in ("rate_limited", "timeout"):
+            self.limiter.on_overload()
+        logging.warning(f"⚠️ LLM call failed ({reason}): {error}")
+
+    async def _timed(self, attempt: Callable[[], Awaitable[T]], latencies: LatencyWindow) -> T:
+        started = time.perf_counter()
+        result = await attempt()
+        latencies.add(time.perf_counter() - started)
+        return result
+
+    async def _hedged(
+        self,
+        attempt: Callable[[], Awaitable[T]],
+        latencies: LatencyWindow,
+        discard: Optional[Callable[[T], Awaitable[None]]] = None,
+    ) -> T:
+        """Starts a second identical attempt when the first is slower than the recent p95 of ``latencies``; the first result wins.
+
+        The backup counts against the rate limits and the concurrency limit like any call, so it is skipped
+        when either has no room right now: a slow upstream is the worst time to add unaccounted load.
+        ``discard`` cleans up a losing result that arrived anyway (e.g. closes an opened stream).
+        """
+        deadline = latencies.quantile(config.LLM_HEDGE_QUANTILE, config.LLM_HEDGE_MIN_SAMPLES)
+        if not config.LLM_HEDGE_ENABLED or deadline is None:
+            return await self._timed(attempt, latencies)
+        primary = asyncio.ensure_future(self._timed(attempt, latencies))
+        tasks = {primary}
+        winner: Optional[asyncio.Future] = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=deadline)
+            if done:
+                winner = primary
+                return primary.result()
+            if not self._try_admit():
+                self._counters["hedges_skipped"] += 1
+                LLM_HEDGES.labels(outcome="skipped").inc()
+                winner = primary
+                return await primary
+            backup = asyncio.ensure_future(self._timed(attempt, latencies))
+            # A done callback, not try/finally: a backup cancelled before it starts never runs its body
+            backup.add_done_callback(lambda _: self.limiter.release())
+            tasks.add(backup)
+            self._counters["hedges"] += 1
+            LLM_HEDGES.labels(outcome="sent").inc()
+            error: Optional[BaseException] = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            self._counters["hedge_wins"] += 1
+                            LLM_HEDGES.labels(outcome="won").inc()
+                        winner = task
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+                if discard and task is not winner and task.done() and not task.cancelled() and task.exception() is None:
+                    await discard(task.result())
+
+    async def call(self, call: Callable[[str], Awaitable[T]], models: List[str]) -> T:
+        """Runs ``call(model)`` under the limits, retrying and falling back across ``models`` in order."""
+        self._counters["calls"] += 1
+        last_error: Optional[BaseException] = None
+        for index, model in enumerate(models):
+            if index:
+                self._counters["fallbacks"] += 1
+                LLM_FALLBACKS.labels(model=model).inc()
+                logging.warning(f"⚠️ Falling back to LLM model '{model}'.")
+            for attempt in range(config.LLM_MAX_RETRIES + 1):
+                await self._admit()
+                try:
+                    result = await self._hedged(lambda: call(model), self.latencies)
+                except Exception as e:
+                    reason = _classify(e)
+                    if reason is None:
+                        raise
+                    self._on_failure(e, reason)
+                    last_error = e
+                else:
+                    self.limiter.on_success()
+                    return result
+                finally:
+                    self.limiter.release()
+                if attempt < config.LLM_MAX_RETRIES:
+                    self._counters["retries"] += 1
+                    LLM_RETRIES.labels(reason=_classify(last_error)).inc()
+                    await asyncio.sleep(_retry_delay(last_error, attempt))
+        self._counters["failures"] += 1
+        raise LLMUnavailableError(f"The language model is unavailable: {last_error}") from last_error
+
+    async def stream(self, open_stream: Callable[[str], AsyncIterator[T]], models: List[str]) -> AsyncIterator[T]:
+        """Streaming counterpart of ``call``. Hedging, retries and fallbacks only happen before the first chunk.
+
+        A hedged stream gets a backup when its first chunk is later than the recent p95 time to first
+        chunk; whichever stream yields first is kept and the other is closed.
+        """
+        self._counters["calls"] += 1
+        last_error: Optional[BaseException] = None
+        for index, model in enumerate(models):
+            if index:
+                self._counters["fallbacks"] += 1
+                LLM_FALLBACKS.labels(model=model).inc()
+                logging.warning(f"⚠️ Falling back to LLM model '{model}'.")
+            for attempt in range(config.LLM_MAX_RETRIES + 1):
+                await self._admit()
+                started = False
+                try:
+                    stream, first = await self._hedged(
+                        lambda: _first_chunk(lambda: open_stream(model)), self.first_chunk_latencies, _close_stream
+                    )
+                    if first is not _END:
+                        started = True
+                        yield first
+                        async for chunk in stream:
+                            yield chunk
+                except Exception as e:
+                    reason = _classify(e)
+                    if reason is None or started:
+                        raise
+                    self._on_failure(e, reason)
+                    last_error = e
+                else:
+                    self.limiter.on_success()
+                    return
+                finally:
+                    self.limiter.release()
+                if attempt < config.LLM_MAX_RETRIES:
+                    self._counters["retries"] += 1
+                    LLM_RETRIES.labels(reason=_classify(last_error)).inc()
+                    await asyncio.sleep(_retry_delay(last_error, attempt))
+        self._counters["failures"] += 1
+        raise LLMUnavailableError(f"The language model is unavailable: {last_error}") from last_error
+
+class ResilientChatOpenAI(ChatOpenAI):
+    """``ChatOpenAI`` whose upstream calls go through ``llm_guard``; ``fallback_models`` are tried in order."""
+
+    fallback_models: List[str] = []
+
+    async def _agenerate(self, messages: List[Any], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if self.streaming:
+            # ChatOpenAI builds streamed results from _astream, which is guarded below
+            return await super()._agenerate(messages, stop, run_manager, **kwargs)
+        generate = super()._agenerate
+        return await llm_guard.call(
+            lambda model: generate(messages, stop, run_manager, model=model, **kwargs),
+            [self.model_name, *self.fallback_models]
+        )
+
+    async def _astream(self, messages: List[Any], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        stream = super()._astream
+        async for chunk in llm_guard.stream(
+            lambda model: stream(messages, stop, run_manager, model=model, **kwargs),
+            [self.model_name, *self.fallback_models]
+        ):
+            yield chunk
+
+def initialize_llm(api_key: str, base_url: str, model_name: str, streaming: bool = True) -> Optional[ChatOpenAI]:
+    """Initializes and returns a ChatOpenAI instance.
+
+    With ``streaming`` enabled the model emits token deltas, which the SSE/WebSocket chat endpoints forward to clients.
+    Calls are rate limited, retried and fall back to ``LLM_FALLBACK_MODELS`` (see ``LLMGuard``); the client's own
+    retries are off so they do not multiply with ours.
+    """
     if not api_key or not base_url:
         raise ValueError("OPENROUTER_API_KEY or OPENROUTER_BASE_URL not set.")
     try:
-        llm_instance = ChatOpenAI(
+        llm_instance = ResilientChatOpenAI(
             model=model_name,
             openai_api_key=api_key,
             openai_api_base=base_url,
             temperature=0,
-            streaming=False
+            streaming=streaming,
+            timeout=config.LLM_TIMEOUT_SECONDS,
+            max_retries=0,
+            fallback_models=[model for model in config.LLM_FALLBACK_MODELS if model != model_name],
+            callbacks=[metrics_callback]
         )
         print("✅ LLM initialized successfully.")
         return llm_instance
     except Exception as e:
         print(f"❌ Error initializing LLM: {e}")
         return None
+
+# Global instance
+llm_guard = LLMGuard()
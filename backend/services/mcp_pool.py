@@ -0,0 +1,229 @@
+from typing import Dict, Any, List, Optional
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import weakref
+from langchain_core.tools import BaseTool, StructuredTool, ToolException # type: ignore
+from langchain_mcp_adapters.client import MultiServerMCPClient # type: ignore
+from core import config
+from core.metrics import UPSTREAM_ERRORS
+
+# Header names that carry credentials
+SECRET_HEADER_HINTS = ("authorization", "token", "key", "secret", "cookie")
+HTTP_TRANSPORTS = ("streamable_http", "sse", "websocket")
+
+def normalize_server_config(server_name: str, details: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns the connection config used both to connect and (hashed) as the pool key.
+
+    Headers are kept as configured, so identical configs (e.g. a public server without credentials) share
+    one connection while credentials make the key (a hash, never stored in plain text) unique to whoever
+    supplied them. Credentials are never dropped: pooling them away would either lose the user's auth or
+    share one user's credentials with everyone else on the server.
+    """
+    normalized = dict(details)
+    normalized["transport"] = (details.get("transport") or "streamable_http").lower()
+    if "url" in normalized:
+        normalized["url"] = str(normalized["url"]).strip()
+    if normalized["transport"] in HTTP_TRANSPORTS:
+        headers = {str(name).lower(): value for name, value in (details.get("headers") or {}).items()}
+        if server_name in config.PUBLIC_MCP_SERVERS and any(hint in name for name in headers for hint in SECRET_HEADER_HINTS):
+            logging.info(f"Public MCP server '{server_name}' is configured with credentials; it gets its own connection.")
+        normalized["headers"] = headers
+    return normalized
+
+def server_config_key(connection: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(connection, sort_keys=True, default=str).encode()).hexdigest()
+
+def _schema_cache_path(key: str) -> str:
+    return os.path.join(config.MCP_SCHEMA_CACHE_DIR, f"{key}.json")
+
+def _read_schema_cache(key: str) -> Optional[List[Dict[str, Any]]]:
+    try:
+        with open(_schema_cache_path(key), "r") as f:
+            specs = json.load(f)
+        return specs if isinstance(specs, list) else None
+    except (OSError, ValueError):
+        return None
+
+def _write_schema_cache(key: str, specs: List[Dict[str, Any]]):
+    os.makedirs(config.MCP_SCHEMA_CACHE_DIR, exist_ok=True)
+    path = _schema_cache_path(key)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(specs, f)
+    os.replace(tmp_path, path)
+
+def _call_result_to_text(result: Any) -> str:
+    texts = [item.text for item in result.content if getattr(item, "type", None) == "text"]
+    text = "\n".join(texts) if texts else str(result.content)
+    if result.isError:
+        raise ToolException(text)
+    return text
+
+class PooledMCPServer:
+    """One long-lived MCP session shared by every agent whose config maps to the same key.
+
+    A background task owns the session: it connects, lists tools, pings every ``MCP_KEEPALIVE_SECONDS``
+    and reconnects with backoff when the session drops. Tools built from the discovered schemas look the
+    session up on every call, so they keep working across reconnects.
+    """
+
+    def __init__(self, key: str, name: str, connection: Dict[str, Any]):
+        self.key = key
+        self.name = name
+        self.connection = connection
+        self.refcount = 0
+        self.tools: List[BaseTool] = []
+        self._specs: List[Dict[str, Any]] = []
+        self._session: Optional[Any] = None
+        self._ready = asyncio.Event()
+        self._reconnect = asyncio.Event()
+        self._runner: Optional[asyncio.Task] = None
+
+    @property
+    def connected(self) -> bool:
+        return self._session is not None
+
+    async def start(self):
+        """Starts the session task; returns once tool schemas are known (from disk or from the server)."""
+        cached_specs = await asyncio.to_thread(_read_schema_cache, self.key)
+        if cached_specs is not None:
+            self._set_specs(cached_specs)
+        self._runner = asyncio.create_task(self._run())
+        if cached_specs is None:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout=config.MCP_CONNECT_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                await self.close()
+                raise ConnectionError(f"Timed out connecting to MCP server '{self.name}'.")
+
+    async def close(self):
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._runner = None
+
+    async def call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> str:
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=config.MCP_CONNECT_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            raise ToolException(f"MCP server '{self.name}' is not reachable.")
+        session = self._session
+        if session is None:
+            raise ToolException(f"MCP server '{self.name}' is reconnecting.")
+        try:
+            result = await session.call_tool(tool_name, arguments)
+        except Exception as e:
+            # The session is probably broken; reconnect in the background and let the agent see the error
+            UPSTREAM_ERRORS.labels(upstream="mcp").inc()
+            self._reconnect.set()
+            raise ToolException(f"MCP call to '{self.name}' failed: {e}")
+        return _call_result_to_text(result)
+
+    def _set_specs(self, specs: List[Dict[str, Any]]):
+        self._specs = specs
+        self.tools = [self._make_tool(spec) for spec in specs]
+
+    def _make_tool(self, spec: Dict[str, Any]) -> BaseTool:
+        tool_name = spec["name"]
+
+        async def _call(**arguments: Any) -> str:
+            return await self.call_tool(tool_name, arguments)
+
+        return StructuredTool(
+            name=tool_name,
+            description=spec.get("description") or "",
+            args_schema=spec.get("inputSchema") or {"type": "object", "properties": {}},
+            coroutine=_call,
+            handle_tool_error=True,
+        )
+
+    async def _refresh_specs(self, session: Any):
+        listed = await session.list_tools()
+        specs = [
+            {"name": tool.name, "description": tool.description, "inputSchema": tool.inputSchema}
+            for tool in listed.tools
+        ]
+        if specs != self._specs:
+            self._set_specs(specs)
+            await asyncio.to_thread(_write_schema_cache, self.key, specs)
+
+    async def _run(self):
+        backoff = 1.0
+        while True:
+            try:
+                client = MultiServerMCPClient({self.name: self.connection})
+                async with client.session(self.name) as session:
+                    await self._refresh_specs(session)
+                    self._session = session
+                    self._reconnect.clear()
+                    self._ready.set()
+                    backoff = 1.0
+                    logging.info(f"MCP session to '{self.name}' established ({len(self._specs)} tools).")
+                    while True:
+                        try:
+                            await asyncio.wait_for(self._reconnect.wait(), timeout=config.MCP_KEEPALIVE_SECONDS)
+                            break
+                        except asyncio.TimeoutError:
+                            await asyncio.wait_for(session.send_ping(), timeout=config.MCP_CONNECT_TIMEOUT_SECONDS)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"⚠️ MCP session to '{self.name}' lost: {e}")
+            finally:
+                self._session = None
+                self._ready.clear()
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, config.MCP_RECONNECT_MAX_BACKOFF_SECONDS)
+
+class MCPConnectionPool:
+    """Deduplicates MCP connections and tool discovery across users by normalized server config."""
+
+    def __init__(self):
+        self._servers: Dict[str, PooledMCPServer] = {}
+        # Weak so a key's lock goes away once no acquire is using it, instead of one per config ever seen
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    async def acquire(self, server_name: str, details: Dict[str, Any]) -> PooledMCPServer:
+        """Returns the shared server for this config, connecting on first use. Pair with ``release``."""
+        connection = normalize_server_config(server_name, details)
+        key = server_config_key(connection)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            server = self._servers.get(key)
+            if server is None:
+                server = PooledMCPServer(key, server_name, connection)
+                await server.start()
+                self._servers[key] = server
+            server.refcount += 1
+            return server
+
+    async def release(self, key: str):
+        server = self._servers.get(key)
+        if server is None:
+            return
+        server.refcount -= 1
+        if server.refcount <= 0:
+            self._servers.pop(key, None)
+            await server.close()
+
+    async def aclose(self):
+        servers = list(self._servers.values())
+        self._servers.clear()
+        for server in servers:
+            await server.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "servers": len(self._servers),
+            "connected": sum(1 for server in self._servers.values() if server.connected),
+            "references": sum(server.refcount for server in self._servers.values()),
+        }
+
+# Global instance
+mcp_pool = MCPConnectionPool()
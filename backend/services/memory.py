@@ -0,0 +1,163 @@
+from typing import List, Optional, Set
+import asyncio
+import logging
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy import or_
+from langchain_core.messages import BaseMessage
+from langchain_core.language_models import BaseChatModel # type: ignore
+from core import config
+from core.database import AsyncSessionLocal
+from core.metrics import span
+from models.chat import ChatMessage
+from services.message_converter import db_messages_to_lc_messages, message_text
+
+SUMMARY_PROMPT = """Progressively summarize the conversation below, extending the previous summary.
+Keep facts, decisions, names, numbers and open questions the assistant may need later. Be concise.
+
+Previous summary:
+{summary}
+
+New lines of conversation:
+{lines}
+
+New summary:"""
+
+# Sessions with a summarization task in flight, and strong references to those tasks
+_summarizing: Set[str] = set()
+_background_tasks: Set[asyncio.Task] = set()
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) used for budgeting history."""
+    return len(text) // 4 + 1
+
+def _not_summary():
+    return or_(ChatMessage.is_summary == 0, ChatMessage.is_summary.is_(None))
+
+async def get_latest_summary(db: AsyncSession, session_id: str) -> Optional[ChatMessage]:
+    result = await db.execute(
+        select(ChatMessage)
+        .filter(ChatMessage.chat_session_id == session_id, ChatMessage.is_summary == 1)
+        .order_by(ChatMessage.id.desc())
+        .limit(1)
+    )
+    return result.scalars().first()
+
+def _covered_until(summary: Optional[ChatMessage]) -> int:
+    if summary is None or not isinstance(summary.content, dict):
+        return 0
+    return summary.content.get("covers_until_id", 0)
+
+async def load_history(db: AsyncSession, session_id: str, before_id: Optional[int] = None) -> List[BaseMessage]:
+    """Loads the prompt history for a session: the latest summary plus the newest messages within the token budget.
+
+    ``before_id`` leaves out that message and everything after it.
+    """
+    with span("history_load"):
+        summary = await get_latest_summary(db, session_id)
+        query = select(ChatMessage).filter(
+            ChatMessage.chat_session_id == session_id, _not_summary(), ChatMessage.id > _covered_until(summary)
+        )
+        if before_id is not None:
+            query = query.filter(ChatMessage.id < before_id)
+        result = await db.execute(
+            query
+            .order_by(ChatMessage.id.desc())
+            .limit(config.MEMORY_MAX_TAIL_MESSAGES)
+        )
+
+    tail: List[ChatMessage] = []
+    used_tokens = 0
+    for rec in result.scalars().all():
+        tokens = estimate_tokens(message_text(rec))
+        if tail and used_tokens + tokens > config.MEMORY_TOKEN_BUDGET:
+            break
+        tail.append(rec)
+        used_tokens += tokens
+    tail.reverse()
+
+    records = [summary] + tail if summary else tail
+    return db_messages_to_lc_messages(records)
+
+async def summarize_session(db: AsyncSession, llm: BaseChatModel, session_id: str) -> Optional[ChatMessage]:
+    """Folds messages older than the recent window into new summary messages once the session exceeds its budget.
+
+    Only the newest ``MEMORY_MAX_TAIL_MESSAGES`` are read to find the recent window. The backlog before it
+    is folded oldest first in chunks of ``MEMORY_SUMMARY_BATCH_MESSAGES``, each committed as its own
+    summary, so a long gap (or earlier failed runs) never loads or prompts the whole backlog at once.
+    """
+    summary = await get_latest_summary(db, session_id)
+    result = await db.execute(
+        select(ChatMessage)
+        .filter(ChatMessage.chat_session_id == session_id, _not_summary(), ChatMessage.id > _covered_until(summary))
+        .order_by(ChatMessage.id.desc())
+        .limit(config.MEMORY_MAX_TAIL_MESSAGES + 1)
+    )
+    newest = result.scalars().all()
+    token_counts = [estimate_tokens(message_text(rec)) for rec in newest]
+    # Past MEMORY_MAX_TAIL_MESSAGES the prompt history already drops messages, so fold regardless of tokens
+    if len(newest) <= config.MEMORY_MAX_TAIL_MESSAGES and sum(token_counts) <= config.MEMORY_TOKEN_BUDGET:
+        return None
+
+    # Keep the most recent turns verbatim and fold everything before them
+    kept = 0
+    recent_tokens = 0
+    while kept < min(len(newest), config.MEMORY_MAX_TAIL_MESSAGES) and recent_tokens + token_counts[kept] <= config.MEMORY_RECENT_TOKENS:
+        recent_tokens += token_counts[kept]
+        kept += 1
+    if kept == len(newest):
+        return None
+    fold_before_id = newest[kept - 1].id if kept else newest[0].id + 1
+
+    while True:
+        result = await db.execute(
+            select(ChatMessage)
+            .filter(
+                ChatMessage.chat_session_id == session_id, _not_summary(),
+                ChatMessage.id > _covered_until(summary), ChatMessage.id < fold_before_id
+            )
+            .order_by(ChatMessage.id)
+            .limit(config.MEMORY_SUMMARY_BATCH_MESSAGES)
+        )
+        to_fold = result.scalars().all()
+        if not to_fold:
+            return summary
+        summary = await _fold(db, llm, session_id, summary, to_fold)
+
+async def _fold(db: AsyncSession, llm: BaseChatModel, session_id: str, summary: Optional[ChatMessage], to_fold: List[ChatMessage]) -> ChatMessage:
+    """Extends ``summary`` with ``to_fold`` and commits the result as the session's latest summary."""
+    lines = "\n".join(f"{rec.role}: {message_text(rec)}" for rec in to_fold)
+    previous = summary.content.get("text", "") if summary else ""
+    response = await llm.ainvoke(SUMMARY_PROMPT.format(summary=previous or "(none)", lines=lines))
+
+    summary_message = ChatMessage(
+        chat_session_id=session_id,
+        role="system",
+        is_summary=1,
+        content={"text": response.content, "covers_until_id": to_fold[-1].id}
+    )
+    db.add(summary_message)
+    await db.commit()
+    logging.info(f"Summarized {len(to_fold)} messages of session {session_id}")
+    return summary_message
+
+async def _summarize_in_background(llm: BaseChatModel, session_id: str):
+    try:
+        async with AsyncSessionLocal() as db:
+            await summarize_session(db, llm, session_id)
+    except Exception as e:
+        logging.error(f"❌ Error summarizing session {session_id}: {e}")
+
+def schedule_summarization(llm: Optional[BaseChatModel], session_id: str):
+    """Starts a background summarization for the session unless one is already running."""
+    if not config.MEMORY_SUMMARIES_ENABLED or llm is None or session_id in _summarizing:
+        return
+    _summarizing.add(session_id)
+    task = asyncio.create_task(_summarize_in_background(llm, session_id))
+    _background_tasks.add(task)
+
+    def _done(t: asyncio.Task):
+        _background_tasks.discard(t)
+        _summarizing.discard(session_id)
+
+    task.add_done_callback(_done)
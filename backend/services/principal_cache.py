@@ -0,0 +1,62 @@
+from typing import Dict, Optional, Tuple
+from collections import OrderedDict
+import time
+from core.schemas import UserPrincipal
+from core import config
+from models.user import User
+
+class PrincipalCache:
+    """Short-lived in-process cache of authenticated users, keyed by token subject (username).
+
+    Entries are immutable snapshots, so handlers can share them without re-querying ``users``. Writes
+    to a user's profile must call ``invalidate_user``; other worker processes pick changes up after
+    ``PRINCIPAL_CACHE_TTL_SECONDS``.
+    """
+
+    def __init__(self, ttl_seconds: float = config.PRINCIPAL_CACHE_TTL_SECONDS, max_entries: int = config.PRINCIPAL_CACHE_MAX_ENTRIES):
+        self._ttl = ttl_seconds
+        self._max_entries = max_entries
+        self._entries: OrderedDict[str, Tuple[UserPrincipal, float]] = OrderedDict()
+        self._counters: Dict[str, int] = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, subject: str) -> Optional[UserPrincipal]:
+        entry = self._entries.get(subject)
+        if entry is None or entry[1] <= time.monotonic():
+            if entry is not None:
+                del self._entries[subject]
+            self._counters["misses"] += 1
+            return None
+        self._entries.move_to_end(subject)
+        self._counters["hits"] += 1
+        return entry[0]
+
+    def put(self, subject: str, user: User) -> UserPrincipal:
+        """Snapshots an ORM user (the principal keeps a read-only copy of its MCP config) and caches it under the subject."""
+        principal = UserPrincipal(
+            id=user.id,
+            username=user.username,
+            mcp_config=user.mcp_config,
+            created_at=user.created_at,
+            updated_at=user.updated_at,
+        )
+        self._entries[subject] = (principal, time.monotonic() + self._ttl)
+        self._entries.move_to_end(subject)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+        return principal
+
+    def invalidate_user(self, user_id: int):
+        for subject in [s for s, (principal, _) in self._entries.items() if principal.id == user_id]:
+            del self._entries[subject]
+            self._counters["invalidations"] += 1
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self._counters["hits"] + self._counters["misses"]
+        return {
+            **self._counters,
+            "size": len(self._entries),
+            "hit_ratio": self._counters["hits"] / lookups if lookups else 0.0,
+        }
+
+# Global instance
+principal_cache = PrincipalCache()
@@ -1,20 +1,26 @@
-from typing import Dict, Any, Optional, List, Tuple
+from typing import Callable, Dict, Any, Optional, List, Tuple
+from dataclasses import dataclass
+from itertools import chain
+import asyncio
+import logging
+import math
 import socket
+import threading
+import time
+import numpy as np # type: ignore
+import chromadb # type: ignore
 from langchain_chroma import Chroma # type: ignore
-from langchain_huggingface import HuggingFaceEmbeddings # type: ignore
+from langchain_core.documents import Document # type: ignore
 from langchain.prompts import ChatPromptTemplate # type: ignore
 from langchain_core.language_models import BaseChatModel # type: ignore
 from core import config
+from core.metrics import span, UPSTREAM_ERRORS
+from services.embeddings import embedding_engine, EmbeddingEngine
+from services.vector_index import MmapVectorIndex
 
-EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
-
-def get_embedding_function():
-    embeddings = HuggingFaceEmbeddings(
-        model_name=EMBEDDING_MODEL_NAME,
-        model_kwargs={'device': 'cpu'},
-        encode_kwargs={'normalize_embeddings': True}
-    )
-    return embeddings
+def get_embedding_function() -> EmbeddingEngine:
+    """Returns the shared embedding engine; the model is loaded once per process."""
+    return embedding_engine
 
 
 PROMPT_TEMPLATE = """
@@ -28,51 +34,280 @@ Answer the question based on the above context: {question}
 """
 
 
+DEFAULT_CHROMA_COLLECTION = "langchain" # langchain_chroma's own default
+
+# Chroma search returns distances (lower is better); these map them to relevance (higher is better) per
+# distance space, the same way LangChain's vector stores do
+CHROMA_RELEVANCE: Dict[str, Callable[[float], float]] = {
+    "l2": lambda distance: 1.0 - distance / math.sqrt(2),
+    "cosine": lambda distance: 1.0 - distance,
+    "ip": lambda distance: 1.0 - distance if distance > 0 else -distance,
+}
+
+_chroma_server_client: Optional[Any] = None
+_chroma_clients: Dict[Optional[str], Chroma] = {}
+_chroma_relevance: Dict[Optional[str], Callable[[float], float]] = {}
+_chroma_clients_lock = threading.Lock()
+_chroma_health: Dict[str, Any] = {"available": False, "checked_at": None}
+_vector_indexes: Dict[str, MmapVectorIndex] = {}
+
+
+def _chroma_port() -> int:
+    return int(config.CHROMA_PORT) if isinstance(config.CHROMA_PORT, str) else config.CHROMA_PORT
+
+
+def _create_chroma_client(collection_name: Optional[str] = None) -> Chroma:
+    global _chroma_server_client
+    # All collections share one underlying chromadb client (HTTP connection pool or local store)
+    if _chroma_server_client is None:
+        if config.ENV == "local" and config.CHROMA_PERSIST_DIRECTORY:
+            _chroma_server_client = chromadb.PersistentClient(path=config.CHROMA_PERSIST_DIRECTORY)
+        else:
+            _chroma_server_client = chromadb.HttpClient(host=config.CHROMA_HOST, port=_chroma_port())
+
+    kwargs: Dict[str, Any] = {
+        "client": _chroma_server_client,
+        "embedding_function": get_embedding_function(),
+    }
+    # Each namespace is its own collection; no namespace means LangChain's default collection
+    kwargs["collection_name"] = collection_name or DEFAULT_CHROMA_COLLECTION
+    client = Chroma(**kwargs) # type: ignore[arg-type]
+    _chroma_relevance[collection_name] = CHROMA_RELEVANCE[_collection_space(kwargs["collection_name"])]
+    return client
+
+def _collection_space(collection_name: str) -> str:
+    """The collection's configured distance space; Chroma's default ``l2`` when it is unset, unknown or unreadable."""
+    try:
+        collection = _chroma_server_client.get_collection(collection_name)
+        space = (collection.metadata or {}).get("hnsw:space")
+        if space is None:
+            # Newer chromadb keeps it in the collection configuration instead of the metadata
+            configuration = getattr(collection, "configuration", None) or {}
+            space = (configuration.get("hnsw") or {}).get("space")
+    except Exception as e:
+        logging.warning(f"⚠️ Could not read the distance space of Chroma collection '{collection_name}': {e}")
+        space = None
+    return space if space in CHROMA_RELEVANCE else "l2"
+
 def _get_chroma_client(collection_name: Optional[str] = None) -> Chroma:
-    # If a collection name is provided, use it to namespace documents
-    if config.ENV == "local" and config.CHROMA_PERSIST_DIRECTORY:
-        kwargs: Dict[str, Any] = {
-            "persist_directory": config.CHROMA_PERSIST_DIRECTORY,
-            "embedding_function": get_embedding_function(),
-        }
-    else:
-        kwargs: Dict[str, Any] = {
-            "host": config.CHROMA_HOST,
-            "port": int(config.CHROMA_PORT) if isinstance(config.CHROMA_PORT, str) else config.CHROMA_PORT,
-            "embedding_function": get_embedding_function(),
-        }
-    
-    if collection_name:
-        kwargs["collection_name"] = collection_name
-    return Chroma(**kwargs) # type: ignore[arg-type]
+    """Returns the pooled Chroma client for a collection, creating it on first use."""
+    client = _chroma_clients.get(collection_name)
+    if client is None:
+        with _chroma_clients_lock:
+            client = _chroma_clients.get(collection_name)
+            if client is None:
+                client = _create_chroma_client(collection_name)
+                _chroma_clients[collection_name] = client
+    return client
+
+async def _aget_chroma_client(collection_name: Optional[str] = None) -> Chroma:
+    client = _chroma_clients.get(collection_name)
+    if client is None:
+        # First use talks to the server (get_or_create_collection), so keep it off the event loop
+        client = await asyncio.to_thread(_get_chroma_client, collection_name)
+    return client
+
+def _get_vector_index(namespace: Optional[str] = None) -> MmapVectorIndex:
+    name = namespace or "default"
+    index = _vector_indexes.get(name)
+    if index is None:
+        # Cheap to create; the matrix is mapped lazily on the first search
+        index = MmapVectorIndex(config.VECTOR_INDEX_DIR, name, get_embedding_function(), config.VECTOR_HNSW_EF_SEARCH)
+        index = _vector_indexes.setdefault(name, index)
+    return index
+
+def _get_vector_store(namespace: Optional[str] = None) -> Any:
+    """Returns the store to search for a namespace: the in-process mmap index or the pooled Chroma client."""
+    if config.VECTOR_STORE_BACKEND == "mmap":
+        return _get_vector_index(namespace)
+    return _get_chroma_client(collection_name=namespace)
+
+async def _aget_vector_store(namespace: Optional[str] = None) -> Any:
+    if config.VECTOR_STORE_BACKEND == "mmap":
+        return _get_vector_index(namespace)
+    return await _aget_chroma_client(collection_name=namespace)
+
+def _uses_chroma_server() -> bool:
+    return config.VECTOR_STORE_BACKEND == "chroma" and config.ENV != "local"
+
+def _health_is_fresh() -> bool:
+    checked_at = _chroma_health["checked_at"]
+    return checked_at is not None and time.monotonic() - checked_at < config.CHROMA_HEALTH_TTL_SECONDS
+
+def _set_chroma_health(available: bool) -> bool:
+    _chroma_health["available"] = available
+    _chroma_health["checked_at"] = time.monotonic()
+    return available
 
 def _is_chroma_available() -> bool:
-    if config.ENV == "local":
+    if not _uses_chroma_server():
         return True
-        
+    if _health_is_fresh():
+        return _chroma_health["available"]
+
     host = config.CHROMA_HOST
-    port = int(config.CHROMA_PORT) if isinstance(config.CHROMA_PORT, str) else config.CHROMA_PORT
+    port = _chroma_port()
     # Try a low-level TCP connect which is robust across versions
     try:
         with socket.create_connection((str(host), int(port)), timeout=2.0):
-            return True
+            return _set_chroma_health(True)
+    except Exception:
+        return _set_chroma_health(False)
+
+async def _ais_chroma_available() -> bool:
+    if not _uses_chroma_server():
+        return True
+    if _health_is_fresh():
+        return _chroma_health["available"]
+
+    try:
+        _, writer = await asyncio.wait_for(
+            asyncio.open_connection(str(config.CHROMA_HOST), _chroma_port()), timeout=2.0
+        )
+        writer.close()
+        await writer.wait_closed()
+        return _set_chroma_health(True)
     except Exception:
-        return False
+        return _set_chroma_health(False)
+
+def _build_rag_prompt(query: str, results: List[Tuple[Document, float]]) -> str:
+    context_text = "\n\n---\n\n".join([doc.page_content for doc, _score in results])
+    prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
+    return prompt_template.format(context=context_text, question=query)
+
+def _search_by_vector(db: Any, embedding: List[float], k: int, namespace: Optional[str] = None) -> List[Tuple[Document, float]]:
+    """Top ``k`` hits as (document, relevance), best first; higher relevance is better on every backend.
+
+    The mmap index already returns cosine similarity. Chroma's ``*_with_relevance_scores`` by-vector search
+    returns raw distances (lower is better), so they are mapped through ``CHROMA_RELEVANCE`` for the
+    namespace's distance space (``1 - d / sqrt(2)`` for the default L2 space).
+    """
+    results = db.similarity_search_by_vector_with_relevance_scores(embedding, k)
+    if isinstance(db, MmapVectorIndex):
+        return results
+    relevance = _chroma_relevance.get(namespace, CHROMA_RELEVANCE["l2"])
+    return [(doc, relevance(distance)) for doc, distance in results]
 
 def query_vector_database(query: str, llm: BaseChatModel, k: int = 4, namespace: Optional[str] = None):
     if not _is_chroma_available():
         return "Vector database is not available.", []
 
     # If a specific namespace/collection is provided, only search there
-    db = _get_chroma_client(collection_name=namespace) if namespace else _get_chroma_client()
-    results = db.similarity_search_with_score(query, k=k)
+    db = _get_vector_store(namespace)
+    try:
+        with span("vector_search"):
+            results = db.similarity_search_with_score(query, k=k)
+    except Exception as e:
+        UPSTREAM_ERRORS.labels(upstream="chroma").inc()
+        _set_chroma_health(False)
+        return f"Vector database query failed: {e}", []
 
-    context_text = "\n\n---\n\n".join([doc.page_content for doc, _score in results])
-    prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
-    prompt = prompt_template.format(context=context_text, question=query)
+    response_text = llm.invoke(_build_rag_prompt(query, results))
+
+    sources = [doc.metadata.get("id", None) for doc, _score in results]
+    return response_text.content, sources
 
-    response_text = llm.invoke(prompt)
+async def aquery_vector_database(query: str, llm: BaseChatModel, k: int = 4, namespace: Optional[str] = None):
+    """Async variant of ``query_vector_database`` that never blocks the event loop."""
+    if not await _ais_chroma_available():
+        return "Vector database is not available.", []
+
+    db = await _aget_vector_store(namespace)
+    with span("embed_query"):
+        embedding = await get_embedding_function().aembed_query(query)
+    try:
+        with span("vector_search"):
+            results = await asyncio.to_thread(_search_by_vector, db, embedding, k, namespace)
+    except Exception as e:
+        UPSTREAM_ERRORS.labels(upstream="chroma").inc()
+        _set_chroma_health(False)
+        return f"Vector database query failed: {e}", []
+
+    response_text = await llm.ainvoke(_build_rag_prompt(query, results))
 
     sources = [doc.metadata.get("id", None) for doc, _score in results]
     return response_text.content, sources
 
+@dataclass
+class RetrievedChunk:
+    namespace: str
+    document: Document
+    score: float # Relevance from _search_by_vector, higher is better; comparable across namespaces of one backend
+
+async def _asearch_namespace(namespace: str, embedding: List[float], k: int) -> Optional[List[RetrievedChunk]]:
+    """Top ``k`` hits of one namespace; None when the search failed."""
+    try:
+        db = await _aget_vector_store(namespace)
+        results = await asyncio.to_thread(_search_by_vector, db, embedding, k, namespace)
+    except Exception as e:
+        UPSTREAM_ERRORS.labels(upstream="chroma").inc()
+        logging.warning(f"⚠️ Vector search in '{namespace}' failed: {e}")
+        return None
+    return [RetrievedChunk(namespace, doc, float(score)) for doc, score in results]
+
+def _dedupe(hits: List[RetrievedChunk]) -> List[RetrievedChunk]:
+    """Keeps the best-scored copy of passages with the same text (sources often overlap)."""
+    seen = set()
+    unique = []
+    for hit in hits:
+        key = " ".join(hit.document.page_content.split())
+        if key not in seen:
+            seen.add(key)
+            unique.append(hit)
+    return unique
+
+async def _mmr_select(query_embedding: List[float], hits: List[RetrievedChunk], k: int, lambda_mult: float) -> List[RetrievedChunk]:
+    """Maximal marginal relevance: picks hits one by one, trading relevance against similarity to those already picked."""
+    vectors = np.asarray(await get_embedding_function().aembed_documents([hit.document.page_content for hit in hits]), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+    query = np.asarray(query_embedding, dtype=np.float32)
+    relevance = vectors @ (query / (np.linalg.norm(query) + 1e-12))
+    selected = [int(np.argmax(relevance))]
+    while len(selected) < min(k, len(hits)):
+        redundancy = (vectors @ vectors[selected].T).max(axis=1)
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        selected.append(int(np.argmax(scores)))
+    return [hits[i] for i in selected]
+
+async def asearch_namespaces(
+    query: str,
+    namespaces: List[str],
+    k: int = config.RAG_SEARCH_K,
+    k_per_namespace: int = config.RAG_SEARCH_K_PER_NAMESPACE,
+    mmr: bool = config.RAG_MMR_ENABLED
+) -> List[RetrievedChunk]:
+    """Searches several namespaces concurrently and returns the merged, de-duplicated hits, best first.
+
+    The query is embedded once for all namespaces. With ``mmr`` the merged candidates are re-ranked
+    for diversity before the top ``k`` are kept.
+    """
+    if not namespaces or not await _ais_chroma_available():
+        return []
+    with span("embed_query"):
+        embedding = await get_embedding_function().aembed_query(query)
+    with span("vector_search"):
+        per_namespace = await asyncio.gather(*[_asearch_namespace(ns, embedding, k_per_namespace) for ns in namespaces])
+    if all(results is None for results in per_namespace):
+        _set_chroma_health(False)
+        return []
+
+    hits = _dedupe(sorted(chain.from_iterable(results or [] for results in per_namespace), key=lambda hit: hit.score, reverse=True))
+    if mmr and len(hits) > k:
+        hits = await _mmr_select(embedding, hits, k, config.RAG_MMR_LAMBDA)
+    return hits[:k]
+
+def format_context(hits: List[RetrievedChunk], max_chars: int = config.RAG_CONTEXT_MAX_CHARS) -> str:
+    """Renders hits as numbered passages for the agent, best first, within a character budget."""
+    if not hits:
+        return "No relevant passages found."
+    passages: List[str] = []
+    used = 0
+    for number, hit in enumerate(hits, start=1):
+        source = hit.document.metadata.get("id") or hit.document.metadata.get("source") or "unknown"
+        passage = f"[{number}] {hit.namespace} | {source} | relevance {hit.score:.2f}\n{hit.document.page_content.strip()}"
+        if passages and used + len(passage) > max_chars:
+            break
+        passages.append(passage)
+        used += len(passage)
+    return "\n\n".join(passages)
@@ -0,0 +1,176 @@
+from typing import Dict, Any, List, Optional, Tuple
+from collections import OrderedDict
+from dataclasses import dataclass
+import hashlib
+import json
+import logging
+import os
+import time
+import numpy as np # type: ignore
+from langchain_core.messages import BaseMessage
+from core.schemas import LLMOutputBlock
+from core import config
+from services.embeddings import embedding_engine
+
+RAG_TOOL_PREFIX = "RAG_"
+RAG_SEARCH_TOOL_NAME = f"{RAG_TOOL_PREFIX}search"
+
+@dataclass
+class CachedTurn:
+    scope: str
+    embedding: np.ndarray
+    output: Dict[str, Any]
+    tool_names_used: List[str]
+    tool_calls: List[dict]
+    namespaces: Dict[str, float] # RAG namespace -> ingestion version the answer was built from
+    latency: float
+    created_at: float
+
+    def to_response(self, user_input: str) -> Tuple[LLMOutputBlock, List[str], List[dict]]:
+        output = LLMOutputBlock(**{**self.output, "query": user_input})
+        return output, list(self.tool_names_used), list(self.tool_calls)
+
+def rag_namespaces(tool_names_used: List[str], tool_calls: List[dict] = (), all_namespaces: List[str] = ()) -> List[str]:
+    """RAG namespaces a turn read: per-source ``RAG_<namespace>`` tools plus the ones ``RAG_search`` was given (all when none)."""
+    namespaces = [
+        name[len(RAG_TOOL_PREFIX):] for name in tool_names_used
+        if name.startswith(RAG_TOOL_PREFIX) and name != RAG_SEARCH_TOOL_NAME
+    ]
+    for call in tool_calls:
+        if call.get("name") == RAG_SEARCH_TOOL_NAME:
+            namespaces.extend((call.get("input") or {}).get("namespaces") or all_namespaces)
+    return list(dict.fromkeys(namespaces))
+
+def read_rag_versions(path: Optional[str] = None) -> Dict[str, float]:
+    """Reads the per-namespace ingestion versions written by ``data/populate_vectors.py``."""
+    try:
+        with open(path or config.RAG_VERSIONS_PATH, "r") as f:
+            versions = json.load(f)
+        return versions if isinstance(versions, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+class SemanticResponseCache:
+    """Opt-in cache of agent answers, looked up by query embedding similarity.
+
+    Entries are scoped (MCP config, tool set and recent history), evicted LRU and by TTL, and dropped
+    when a RAG namespace they used is re-ingested.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = config.RESPONSE_CACHE_ENABLED,
+        max_entries: int = config.RESPONSE_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = config.RESPONSE_CACHE_TTL_SECONDS,
+        threshold: float = config.RESPONSE_CACHE_SIMILARITY_THRESHOLD
+    ):
+        self.enabled = enabled
+        self._max_entries = max_entries
+        self._ttl = ttl_seconds
+        self._threshold = threshold
+        self._entries: OrderedDict[int, CachedTurn] = OrderedDict()
+        self._next_id = 0
+        self._rag_versions: Dict[str, float] = {}
+        self._rag_versions_file: Optional[Tuple[int, int]] = None
+        self._counters: Dict[str, float] = {
+            "hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "invalidations": 0,
+            "saved_latency_seconds": 0.0,
+        }
+
+    def scope_key(self, agent_scope: Optional[str], chat_history: List[BaseMessage]) -> Optional[str]:
+        """Combines the agent scope with the last exchange, so follow-up questions only match in the same context."""
+        if not self.enabled or agent_scope is None:
+            return None
+        recent = [f"{message.type}:{message.content}" for message in chat_history[-2:]]
+        return hashlib.sha256(json.dumps([agent_scope, recent], default=str).encode()).hexdigest()
+
+    async def embed(self, query: str) -> Optional[np.ndarray]:
+        try:
+            return np.asarray(await embedding_engine.aembed_query(query), dtype=np.float32)
+        except Exception as e:
+            logging.error(f"❌ Response cache could not embed query: {e}")
+            return None
+
+    def lookup(self, scope: str, embedding: np.ndarray) -> Optional[CachedTurn]:
+        self._refresh_rag_versions()
+        now = time.monotonic()
+        best_id, best_score = None, self._threshold
+        for entry_id, entry in list(self._entries.items()):
+            if now - entry.created_at >= self._ttl:
+                del self._entries[entry_id]
+                self._counters["evictions"] += 1
+                continue
+            if entry.scope != scope:
+                continue
+            # Embeddings are normalized, so the dot product is the cosine similarity
+            score = float(entry.embedding @ embedding)
+            if score >= best_score:
+                best_id, best_score = entry_id, score
+
+        if best_id is None:
+            self._counters["misses"] += 1
+            return None
+        self._entries.move_to_end(best_id)
+        entry = self._entries[best_id]
+        self._counters["hits"] += 1
+        self._counters["saved_latency_seconds"] += entry.latency
+        return entry
+
+    def store(self, scope: str, embedding: np.ndarray, output: LLMOutputBlock, tool_names_used: List[str], tool_calls: List[dict], latency: float):
+        self._refresh_rag_versions()
+        used = rag_namespaces(tool_names_used, tool_calls, list(self._rag_versions))
+        namespaces = {ns: self._rag_versions.get(ns, 0.0) for ns in used}
+        self._entries[self._next_id] = CachedTurn(
+            scope=scope,
+            embedding=embedding,
+            output=output.model_dump(),
+            tool_names_used=list(tool_names_used),
+            tool_calls=list(tool_calls),
+            namespaces=namespaces,
+            latency=latency,
+            created_at=time.monotonic(),
+        )
+        self._next_id += 1
+        self._counters["stores"] += 1
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self._counters["hits"] + self._counters["misses"]
+        return {
+            **self._counters,
+            "size": len(self._entries),
+            "hit_ratio": self._counters["hits"] / lookups if lookups else 0.0,
+        }
+
+    def _refresh_rag_versions(self):
+        """Invalidates namespaces re-ingested since the last check (one stat() call when nothing changed)."""
+        path = config.RAG_VERSIONS_PATH
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        # populate_vectors.py replaces the file, so the inode changes even if the mtime tick does not
+        version = (stat.st_ino, stat.st_mtime_ns)
+        if version == self._rag_versions_file:
+            return
+        self._rag_versions_file = version
+        versions = read_rag_versions(path)
+        for namespace, version in versions.items():
+            if version != self._rag_versions.get(namespace):
+                stale = [entry_id for entry_id, entry in self._entries.items() if entry.namespaces.get(namespace, version) != version]
+                for entry_id in stale:
+                    del self._entries[entry_id]
+                self._counters["invalidations"] += len(stale)
+        self._rag_versions = versions
+
+# Global instance
+response_cache = SemanticResponseCache()
@@ -0,0 +1,44 @@
+from typing import Dict
+from contextlib import asynccontextmanager
+import asyncio
+from core import config
+
+class SessionBusyError(Exception):
+    """Raised when a session already has the maximum number of turns waiting."""
+
+class SessionLocks:
+    """Serializes chat turns per session, so concurrent sends queue instead of interleaving history.
+
+    Locks live in this process only; with several workers, route a session's requests to one worker
+    (or rely on the idempotency key for retries) to get the same guarantee.
+    """
+
+    def __init__(self, max_queued: int = config.SESSION_MAX_QUEUED_TURNS):
+        self._max_queued = max_queued
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._holders: Dict[str, int] = {} # Running plus waiting turns per session
+
+    @asynccontextmanager
+    async def hold(self, session_id: str):
+        """Waits for the session's earlier turns to finish, then holds the session for this one."""
+        if self._holders.get(session_id, 0) > self._max_queued:
+            raise SessionBusyError(f"Session {session_id} already has {self._max_queued} turns waiting.")
+        lock = self._locks.setdefault(session_id, asyncio.Lock())
+        self._holders[session_id] = self._holders.get(session_id, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._holders[session_id] -= 1
+            if self._holders[session_id] == 0:
+                del self._holders[session_id]
+                del self._locks[session_id]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "active_sessions": len(self._locks),
+            "queued_turns": sum(max(count - 1, 0) for count in self._holders.values()),
+        }
+
+# Global instance
+session_locks = SessionLocks()
@@ -1,14 +1,60 @@
-from typing import List, Any
-from langchain_mcp_adapters.client import MultiServerMCPClient # type: ignore
+from typing import List, Any, Optional
+from contextlib import AsyncExitStack
 from langchain.tools import Tool # type: ignore
+from langchain_core.tools import StructuredTool # type: ignore
+from pydantic import BaseModel, Field # type: ignore
 from core import config
-from services.rag import query_vector_database
+from services.rag import query_vector_database, aquery_vector_database, asearch_namespaces, format_context
+from services.response_cache import RAG_SEARCH_TOOL_NAME
+from services.mcp_pool import mcp_pool
 import json
 import os
 import aiofiles # type: ignore
 
-async def setup_tools(llm: Any, mcp_config: dict = None) -> List[Any]:
-    """Sets up and returns a list of tools, including MCP-based ones and RAG tool."""
+def _make_rag_tool(llm: Any, resource_name: str, description: str) -> Tool:
+    """Builds a RAG tool for one namespace; agents call the coroutine so the search never blocks the event loop."""
+    async def _aquery(query: str) -> str:
+        answer, _sources = await aquery_vector_database(query, llm, namespace=resource_name)
+        return answer
+
+    return Tool(
+        name=f"RAG_{resource_name}",
+        func=lambda query: query_vector_database(query, llm, namespace=resource_name)[0],
+        coroutine=_aquery,
+        description=f"RAG over '{resource_name}'. {description}",
+    )
+
+class RagSearchInput(BaseModel):
+    query: str = Field(..., description="What to look up, phrased as a search query.")
+    namespaces: Optional[List[str]] = Field(None, description="Sources to search; every source when omitted.")
+
+def _make_rag_search_tool(sources: List[dict]) -> StructuredTool:
+    """Builds one retrieval tool over every source.
+
+    It searches the selected namespaces concurrently, merges the hits by score and returns the ranked
+    passages, so the agent answers from raw context instead of a nested LLM answer per source.
+    """
+    names = [src["resource_name"] for src in sources]
+    catalog = "\n".join(f"- {src['resource_name']}: {src.get('resource_description', '')}" for src in sources)
+
+    async def _asearch(query: str, namespaces: Optional[List[str]] = None) -> str:
+        selected = [ns for ns in namespaces or [] if ns in names] or names
+        return format_context(await asearch_namespaces(query, selected))
+
+    return StructuredTool.from_function(
+        coroutine=_asearch,
+        name=RAG_SEARCH_TOOL_NAME,
+        description=f"Search the knowledge base and get the most relevant passages, ranked across sources. Available sources:\n{catalog}",
+        args_schema=RagSearchInput,
+    )
+
+async def setup_tools(llm: Any, mcp_config: dict = None, exit_stack: Optional[AsyncExitStack] = None) -> List[Any]:
+    """Sets up and returns a list of tools, including MCP-based ones and RAG tool.
+
+    MCP tools come from the shared ``mcp_pool``. When ``exit_stack`` is given, the pooled connections
+    are released through it once the caller is done with the tools; otherwise they stay open for the
+    lifetime of the process.
+    """
     mcp_tools = []
     
     # Use provided config or fall back to global default (though global might be deprecated in per-user model)
@@ -30,8 +76,15 @@ async def setup_tools(llm: Any, mcp_config: dict = None) -> List[Any]:
                  print(f"⚠️ MCP Server '{server_name}' missing valid Authorization. Skipping.")
         
         if valid_servers:
-            client = MultiServerMCPClient(valid_servers)
-            mcp_tools = await client.get_tools()
+            for server_name, server_details in valid_servers.items():
+                try:
+                    server = await mcp_pool.acquire(server_name, server_details)
+                except Exception as e:
+                    print(f"❌ Error connecting to MCP server '{server_name}': {e}")
+                    continue
+                if exit_stack is not None:
+                    exit_stack.push_async_callback(mcp_pool.release, server.key)
+                mcp_tools.extend(server.tools)
             print(f"✅ MCP tools fetched successfully. Found {len(mcp_tools)} tools from {list(valid_servers.keys())}.")
         else:
              print("ℹ️ No valid MCP servers configured or auth missing.")
@@ -39,7 +92,7 @@ async def setup_tools(llm: Any, mcp_config: dict = None) -> List[Any]:
     except Exception as e:
         print(f"❌ Error setting up MCP tools: {e}")
 
-    # Create one RAG tool per source (namespace) so the agent can pick the right one
+    # RAG sources (namespaces): one fan-out search tool, or one answering tool per source
     sources = []
     sources_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "sources.json")
     try:
@@ -51,17 +104,12 @@ async def setup_tools(llm: Any, mcp_config: dict = None) -> List[Any]:
     except Exception as e:
         print(f"❌ Error reading sources.json for RAG tools: {e}")
 
+    sources = [src for src in sources if src.get("resource_name")]
     rag_tools: List[Any] = []
-    for src in sources:
-        resource_name = src.get("resource_name", "")
-        description = src.get("resource_description", "")
-        if not resource_name:
-            continue
-        tool = Tool(
-            name=f"RAG_{resource_name}",
-            func=lambda query, rn=resource_name: query_vector_database(query, llm, namespace=rn)[0],
-            description=f"RAG over '{resource_name}'. {description}",
-        )
-        rag_tools.append(tool)
+    if config.RAG_TOOL_MODE == "per_source":
+        for src in sources:
+            rag_tools.append(_make_rag_tool(llm, src["resource_name"], src.get("resource_description", "")))
+    elif sources:
+        rag_tools.append(_make_rag_search_tool(sources))
 
     return mcp_tools + rag_tools
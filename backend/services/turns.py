@@ -0,0 +1,178 @@
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from contextlib import aclosing
+import asyncio
+import logging
+import time
+from fastapi import FastAPI # type: ignore
+from fastapi.encoders import jsonable_encoder # type: ignore
+from langchain.agents import AgentExecutor # type: ignore
+from langchain_core.messages import BaseMessage # type: ignore
+from langchain_openai import ChatOpenAI # type: ignore
+from core import config
+from core.database import AsyncSessionLocal
+from core.schemas import ChatMessageResponse, MessageResponse
+from services import chat as chat_crud
+from services import user as user_crud
+from services import memory
+from services.agent import stream_agent_response, partial_output, with_budget, TurnProgress
+from services.jobs import Job, JobStoppedError, job_runner
+from services.llm import llm_user, LLMUnavailableError
+from services.principal_cache import principal_cache
+from services.response_cache import response_cache
+from services.session_locks import session_locks
+
+# Strong references to turn writes that must finish even if the request is cancelled
+_background_tasks: Set[asyncio.Task] = set()
+
+def _spawn(coro: Awaitable[Any]) -> asyncio.Task:
+    task = asyncio.ensure_future(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+def save_partial_turn(session_id: str, content: str, progress: TurnProgress, *records: Any) -> asyncio.Task:
+    """Persists a turn that stopped early: the staged ``records`` plus an AI message holding the partial answer.
+
+    Runs as its own task with its own DB session, so the write completes even while the request is being
+    cancelled. The task's result is the saved AI message.
+    """
+    ai_message = chat_crud.new_ai_message(
+        session_id, partial_output(content, progress), list(dict.fromkeys(progress.tool_names_used)), progress.tool_calls,
+        status=progress.status
+    )
+
+    async def save():
+        try:
+            async with AsyncSessionLocal() as db:
+                await chat_crud.save_turn(db, *records, ai_message, touch_session_id=session_id)
+            logging.info(f"Saved {progress.status} turn for session {session_id}")
+        except Exception as e:
+            logging.error(f"❌ Error saving {progress.status} turn for session {session_id}: {e}")
+        return ai_message
+
+    return _spawn(save())
+
+async def _save_final_message(session_id: str, final: Dict[str, Any], llm_instance: ChatOpenAI) -> Any:
+    async with AsyncSessionLocal() as db:
+        ai_message = await chat_crud.add_ai_message_to_session(
+            db, session_id, final["output"], final["tool_names_used"], final["tool_calls"]
+        )
+    memory.schedule_summarization(llm_instance, session_id)
+    return ai_message
+
+async def stream_turn(
+    session_id: str,
+    content: str,
+    lc_history: List[BaseMessage],
+    agent_executor: AgentExecutor,
+    llm_instance: ChatOpenAI,
+    formatter_llm: ChatOpenAI,
+    cache_scope: Optional[str] = None,
+    timeout: float = config.TURN_TIMEOUT_SECONDS
+) -> AsyncIterator[Tuple[str, Any]]:
+    """Streams one agent turn and persists the AI message once the final output is ready.
+
+    Uses its own DB session because the request-scoped one may already be closed while the response streams.
+    If the consumer goes away mid-turn (the response is cancelled or this generator is closed) the agent run
+    is stopped and the text streamed so far is saved; a turn past ``timeout`` seconds is stopped the same
+    way and ends with its partial ``message``.
+    """
+    progress = TurnProgress()
+    deadline = time.monotonic() + timeout
+    saved = False
+    async with aclosing(stream_agent_response(agent_executor, content, lc_history, formatter_llm, cache_scope, progress=progress)) as stream:
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(stream.__anext__(), timeout=max(deadline - time.monotonic(), 0))
+                except StopAsyncIteration:
+                    break
+                if event["event"] != "final":
+                    yield event["event"], event["data"]
+                    continue
+
+                # Saved before anything is yielded and in its own task: a consumer that stops at a yield, or a
+                # cancel during the write, must not store the finished answer as a partial one (or as both)
+                final = event["data"]
+                write = _spawn(_save_final_message(session_id, final, llm_instance))
+                saved = True
+                ai_message = await asyncio.shield(write)
+                yield "final", {"session_id": session_id, **final}
+                yield "message", ChatMessageResponse.from_orm(ai_message)
+        except LLMUnavailableError as e:
+            yield "error", {"detail": str(e), "retry_after": e.retry_after}
+        except asyncio.TimeoutError:
+            progress.status = "timed_out"
+            ai_message = await save_partial_turn(session_id, content, progress)
+            saved = True
+            yield "message", ChatMessageResponse.from_orm(ai_message)
+        except (asyncio.CancelledError, GeneratorExit):
+            if not saved:
+                save_partial_turn(session_id, content, progress)
+            raise
+    yield "done", {"session_id": session_id}
+
+async def run_chat_job(app: FastAPI, job: Job, publish: Callable[[str, Any], None]) -> Dict[str, Any]:
+    """Job handler: runs a queued turn like ``/chat/stream`` does, publishing its events to the job's subscribers.
+
+    Background turns get the larger ``JOB_TIMEOUT_SECONDS`` and ``JOB_MAX_ITERATIONS`` budget. An upstream
+    LLM failure fails the job with its message; a turn stopped early finishes the job as "timed_out" (or
+    "cancelled") with the partial answer as its result.
+    """
+    agent_manager = app.state.agent_manager
+    llm_instance = app.state.llm_instance
+    formatter_llm = getattr(app.state, "formatter_llm", llm_instance)
+
+    async with AsyncSessionLocal() as db:
+        user = await user_crud.get_user_by_id(db, job.user_id)
+    if user is None:
+        raise ValueError("User not found.")
+    current_user = principal_cache.put(user.username, user)
+    llm_user.set(current_user.id)
+
+    agent_executor = await agent_manager.get_agent(current_user)
+    if not agent_executor:
+        raise RuntimeError("Failed to initialize AI agent.")
+    agent_executor = with_budget(agent_executor, config.JOB_MAX_ITERATIONS, config.JOB_TIMEOUT_SECONDS)
+
+    result: Dict[str, Any] = {"session_id": job.session_id}
+    async with session_locks.hold(job.session_id):
+        async with AsyncSessionLocal() as db:
+            session = await chat_crud.get_chat_session(db, job.session_id)
+            if not session or session.user_id != job.user_id:
+                raise ValueError("Chat session not found.")
+            # A requeued job reuses the user message its interrupted run saved instead of adding it again
+            user_message = None
+            if job.user_message_id is not None:
+                user_message = await chat_crud.get_chat_message(db, job.session_id, job.user_message_id)
+            if user_message is not None:
+                lc_history = await memory.load_history(db, job.session_id, before_id=user_message.id)
+            else:
+                lc_history = await memory.load_history(db, job.session_id)
+                user_message = await chat_crud.add_user_message_to_session(db, job.session_id, job.content)
+        if job.user_message_id != user_message.id:
+            job.user_message_id = user_message.id
+            await job_runner.queue.record_user_message(job)
+        result["user_message"] = ChatMessageResponse.from_orm(user_message)
+        publish("user_message", result["user_message"])
+
+        cache_scope = response_cache.scope_key(agent_manager.tool_scope(current_user.id), lc_history)
+        turn = stream_turn(job.session_id, job.content, lc_history, agent_executor, llm_instance, formatter_llm, cache_scope, timeout=config.JOB_TIMEOUT_SECONDS)
+        async with aclosing(turn) as events:
+            async for event, data in events:
+                publish(event, data)
+                if event == "error":
+                    raise LLMUnavailableError(data["detail"], data.get("retry_after", 5.0))
+                if event == "final":
+                    result.update(tool_names_used=data["tool_names_used"], tool_calls=data["tool_calls"])
+                elif event == "message":
+                    result["ai_response"] = data
+
+    if "ai_response" not in result:
+        raise RuntimeError("The turn ended without a response.")
+    response = jsonable_encoder(MessageResponse(**result))
+    content = result["ai_response"].content
+    stopped = content.get("status") if isinstance(content, dict) else None
+    if stopped:
+        raise JobStoppedError(stopped, "The turn was stopped early; its partial answer was saved.", result=response)
+    return response
@@ -2,7 +2,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from models.user import User
 from core.schemas import UserCreate
-from core.security import get_password_hash
+from core.security import aget_password_hash
+from services.principal_cache import principal_cache
 
 async def get_user_by_username(db: AsyncSession, username: str):
     result = await db.execute(select(User).filter(User.username == username))
@@ -13,7 +14,7 @@ async def get_user_by_id(db: AsyncSession, user_id: int):
     return result.scalars().first()
 
 async def create_user(db: AsyncSession, user: UserCreate):
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await aget_password_hash(user.password)
     db_user = User(username=user.username, hashed_password=hashed_password)
     db.add(db_user)
     await db.commit()
@@ -27,4 +28,11 @@ async def update_user_mcp_config(db: AsyncSession, user_id: int, mcp_config: dic
         user.mcp_config = mcp_config
         await db.commit()
         await db.refresh(user)
+        principal_cache.invalidate_user(user_id)
+    return user
+
+async def update_user_password_hash(db: AsyncSession, user: User, hashed_password: str):
+    user.hashed_password = hashed_password
+    await db.commit()
+    await db.refresh(user)
     return user
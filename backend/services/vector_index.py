@@ -0,0 +1,218 @@
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+from dataclasses import dataclass, field
+import json
+import os
+import threading
+import numpy as np # type: ignore
+from langchain_core.documents import Document # type: ignore
+from langchain_core.embeddings import Embeddings # type: ignore
+
+try:
+    import hnswlib # type: ignore
+except ImportError: # Optional: only needed for namespaces above the HNSW size threshold
+    hnswlib = None
+
+MANIFEST_NAME = "manifest.json"
+INT8_SCALE = 127.0
+INT8_BLOCK_ROWS = 16384 # Rows upcast per step when scoring an int8 matrix, bounds the temporary copy
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+def _write_json(path: str, data: Any):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+@dataclass(frozen=True)
+class _Snapshot:
+    """One generation of a namespace; swapped as a whole so a search never mixes two generations."""
+    vectors: Optional[np.ndarray] = None
+    records: List[Dict[str, Any]] = field(default_factory=list)
+    hnsw: Optional[Any] = None
+
+_EMPTY_SNAPSHOT = _Snapshot()
+
+class MmapVectorIndex:
+    """In-process vector index for one namespace: a memory-mapped embedding matrix plus a metadata sidecar.
+
+    Each write produces a new generation of files (``vectors.<n>.npy``, ``metadata.<n>.json`` and, for
+    large namespaces when hnswlib is installed, ``hnsw.<n>.bin``) and then swaps ``manifest.json``, so
+    readers never see a half-written index. The matrix is opened with ``mmap_mode="r"``: uvicorn workers
+    share its pages through the OS page cache instead of each holding a copy. Readers pick up a new
+    generation on their next search; each search reads one snapshot of matrix, records and HNSW index,
+    so a concurrent refresh cannot mix two generations.
+
+    Vectors are L2-normalized, so scores are cosine similarities. ``int8`` storage quantizes them
+    (4x smaller) at a small accuracy cost.
+    """
+
+    def __init__(self, directory: str, namespace: str, embedding_function: Optional[Embeddings] = None, hnsw_ef_search: int = 64):
+        self.directory = os.path.join(directory, namespace)
+        self.namespace = namespace
+        self.embedding_function = embedding_function
+        self.hnsw_ef_search = hnsw_ef_search
+        self._lock = threading.Lock()
+        self._manifest_version: Optional[Tuple[int, int]] = None
+        self._snapshot = _EMPTY_SNAPSHOT
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.directory, MANIFEST_NAME)
+
+    def _read_manifest(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.manifest_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _refresh(self) -> _Snapshot:
+        """Maps the current generation when the manifest changed since the last search and returns it."""
+        try:
+            stat = os.stat(self.manifest_path)
+            # The manifest is replaced, never rewritten in place, so a new inode marks a new generation even
+            # when two writes land within one tick of a coarse filesystem clock
+            version = (stat.st_ino, stat.st_mtime_ns)
+        except OSError:
+            version = None
+        if version == self._manifest_version:
+            return self._snapshot
+        with self._lock:
+            if version == self._manifest_version:
+                return self._snapshot
+            manifest = self._read_manifest() if version is not None else None
+            if manifest is None or not manifest.get("count"):
+                snapshot = _EMPTY_SNAPSHOT
+            else:
+                vectors = np.load(os.path.join(self.directory, manifest["vectors"]), mmap_mode="r")
+                with open(os.path.join(self.directory, manifest["metadata"]), "r") as f:
+                    records = json.load(f)
+                snapshot = _Snapshot(vectors, records, self._load_hnsw(manifest))
+            # Snapshot before version: a reader that sees the new version must also see the new generation
+            self._snapshot = snapshot
+            self._manifest_version = version
+            return snapshot
+
+    def _load_hnsw(self, manifest: Dict[str, Any]) -> Optional[Any]:
+        if not manifest.get("hnsw") or hnswlib is None:
+            return None
+        index = hnswlib.Index(space="ip", dim=manifest["dim"])
+        index.load_index(os.path.join(self.directory, manifest["hnsw"]), max_elements=manifest["count"])
+        index.set_ef(max(self.hnsw_ef_search, 1))
+        return index
+
+    @property
+    def count(self) -> int:
+        return len(self._refresh().records)
+
+    def ids(self) -> List[str]:
+        return [record["id"] for record in self._refresh().records]
+
+    def _scores(self, vectors: np.ndarray, query: np.ndarray) -> np.ndarray:
+        if vectors.dtype != np.int8:
+            return vectors @ query
+        scores = np.empty(len(vectors), dtype=np.float32)
+        for start in range(0, len(vectors), INT8_BLOCK_ROWS):
+            block = vectors[start:start + INT8_BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32) @ query
+        return scores / INT8_SCALE
+
+    def _top_k(self, snapshot: _Snapshot, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if snapshot.hnsw is not None:
+            labels, distances = snapshot.hnsw.knn_query(query, k=k)
+            return labels[0], 1.0 - distances[0]
+        scores = self._scores(snapshot.vectors, query)
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return top, scores[top]
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding: List[float], k: int = 4) -> List[Tuple[Document, float]]:
+        """Top ``k`` documents with their cosine similarity (higher is better), best first.
+
+        Same call shape as the Chroma method, but Chroma's returns distances; see ``rag._search_by_vector``.
+        """
+        snapshot = self._refresh()
+        records = snapshot.records
+        if not records or k <= 0:
+            return []
+        query = _normalize(embedding)
+        indices, scores = self._top_k(snapshot, query, min(k, len(records)))
+        return [
+            (Document(page_content=records[i]["text"], metadata=records[i]["metadata"]), float(score))
+            for i, score in zip(indices, scores)
+        ]
+
+    def similarity_search_with_score(self, query: str, k: int = 4) -> List[Tuple[Document, float]]:
+        if self.embedding_function is None:
+            raise ValueError("An embedding function is required to search by text.")
+        return self.similarity_search_by_vector_with_relevance_scores(self.embedding_function.embed_query(query), k)
+
+    def write(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]], embeddings: Any, dtype: str = "float32", hnsw_min_size: int = 0):
+        """Replaces the namespace with these rows as a new generation, then drops generations older than the previous one."""
+        os.makedirs(self.directory, exist_ok=True)
+        previous = self._read_manifest() or {}
+        generation = previous.get("generation", 0) + 1
+        matrix = _normalize(embeddings).reshape(len(ids), -1) if ids else np.zeros((0, previous.get("dim", 0)), dtype=np.float32)
+        if dtype == "int8":
+            matrix = np.round(matrix * INT8_SCALE).astype(np.int8)
+
+        manifest: Dict[str, Any] = {
+            "generation": generation,
+            "count": len(ids),
+            "dim": int(matrix.shape[1]),
+            "dtype": dtype,
+            "vectors": f"vectors.{generation}.npy",
+            "metadata": f"metadata.{generation}.json",
+            "hnsw": None,
+        }
+        np.save(os.path.join(self.directory, manifest["vectors"]), matrix)
+        records = [{"id": i, "text": t, "metadata": m or {}} for i, t, m in zip(ids, texts, metadatas)]
+        _write_json(os.path.join(self.directory, manifest["metadata"]), records)
+        if hnsw_min_size and hnswlib is not None and len(ids) >= hnsw_min_size:
+            index = hnswlib.Index(space="ip", dim=manifest["dim"])
+            index.init_index(max_elements=len(ids), ef_construction=200, M=16)
+            index.add_items(_normalize(embeddings).reshape(len(ids), -1), np.arange(len(ids)))
+            manifest["hnsw"] = f"hnsw.{generation}.bin"
+            index.save_index(os.path.join(self.directory, manifest["hnsw"]))
+        _write_json(self.manifest_path, manifest)
+        self._remove_generations_before(generation - 1)
+
+    def add(
+        self,
+        ids: List[str],
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        embeddings: Any,
+        delete_ids: Iterable[str] = (),
+        dtype: str = "float32",
+        hnsw_min_size: int = 0
+    ):
+        """Appends rows and drops ``delete_ids`` in one new generation (rewrites the matrix, fine at ingestion time)."""
+        snapshot = self._refresh()
+        old_vectors, old_records = snapshot.vectors, snapshot.records
+        deleted = set(delete_ids)
+        keep = [row for row, record in enumerate(old_records) if record["id"] not in deleted]
+        if old_vectors is not None and keep:
+            old_matrix = np.asarray(old_vectors[keep], dtype=np.float32)
+            if old_vectors.dtype == np.int8:
+                old_matrix /= INT8_SCALE
+            new_matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), old_matrix.shape[1])
+            embeddings = np.vstack([old_matrix, new_matrix])
+            ids = [old_records[row]["id"] for row in keep] + list(ids)
+            texts = [old_records[row]["text"] for row in keep] + list(texts)
+            metadatas = [old_records[row]["metadata"] for row in keep] + list(metadatas)
+        self.write(ids, texts, metadatas, embeddings, dtype=dtype, hnsw_min_size=hnsw_min_size)
+
+    def _remove_generations_before(self, generation: int):
+        # The previous generation stays for readers that loaded the old manifest a moment ago
+        for name in os.listdir(self.directory):
+            parts = name.split(".")
+            if len(parts) == 3 and parts[1].isdigit() and int(parts[1]) < generation:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
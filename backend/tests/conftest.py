@@ -0,0 +1,33 @@
+"""Shared setup for the backend test suite.
+
+Run from the backend directory with ``python -m pytest``. The tests need no LLM, MCP or Chroma server:
+agents run against the stand-ins in ``benchmarks.fakes`` and the database is a temporary SQLite file.
+"""
+import asyncio
+import os
+import sys
+from typing import Any, Awaitable, Callable
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def run_with_db(tmp_path) -> Callable[[Callable[[AsyncSession], Awaitable[Any]]], Any]:
+    """Runs ``body(db)`` in a fresh event loop against a new SQLite database with every table created."""
+    from core.database import Base
+    import models.chat, models.job, models.user # noqa: F401 (register the tables)
+
+    def run(body: Callable[[AsyncSession], Awaitable[Any]]) -> Any:
+        async def main():
+            engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            try:
+                async with async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)() as db:
+                    return await body(db)
+            finally:
+                await engine.dispose()
+        return asyncio.run(main())
+    return run
@@ -0,0 +1,85 @@
+import asyncio
+from langchain_core.messages import AIMessage # type: ignore
+from benchmarks.fakes import ScriptedChatModel, StreamingScriptedChatModel, CountingTool, tool_call_message
+from services import agent as agent_service
+from services.agent import TurnProgress, create_mcp_agent_executor, get_agent_response, stream_agent_response
+
+
+def test_turn_runs_the_agent_executor_once():
+    tool = CountingTool()
+    llm = ScriptedChatModel(responses=[tool_call_message(tool.name, "ping"), AIMessage(content="pong")])
+    executor = create_mcp_agent_executor(llm, [tool.as_tool()])
+
+    for _ in range(3):
+        _, tool_names, tool_calls = asyncio.run(get_agent_response(executor, "ping", [], llm))
+        assert tool_names == [tool.name]
+        assert tool_calls == [{"name": tool.name, "input": {"input": "ping"}, "output": "echo: ping"}]
+
+    # One tool-calling step plus the final answer per turn
+    assert llm.calls == 6
+    assert tool.calls == 3
+
+
+def _record_cache_stores(monkeypatch) -> list:
+    """Turns the response cache on for every turn (a miss) and records what gets stored."""
+    stored = []
+
+    async def lookup(cache_scope, user_input):
+        return [1.0, 0.0], None
+
+    monkeypatch.setattr(agent_service, "_cache_lookup", lookup)
+    monkeypatch.setattr(agent_service.response_cache, "store", lambda *args: stored.append(args))
+    return stored
+
+
+def test_completed_turn_is_cached(monkeypatch):
+    stored = _record_cache_stores(monkeypatch)
+    tool = CountingTool()
+    llm = ScriptedChatModel(responses=[tool_call_message(tool.name, "ping"), AIMessage(content="pong")])
+    executor = create_mcp_agent_executor(llm, [tool.as_tool()])
+    progress = TurnProgress()
+
+    asyncio.run(get_agent_response(executor, "ping", [], llm, "scope", progress=progress))
+
+    assert progress.early_stopped is False
+    assert len(stored) == 1
+
+
+def test_turn_stopped_by_its_budget_is_not_cached(monkeypatch):
+    stored = _record_cache_stores(monkeypatch)
+    tool = CountingTool()
+    # The model never stops calling the tool, so the turn runs out of iterations
+    llm = ScriptedChatModel(responses=[tool_call_message(tool.name, "ping")])
+    executor = create_mcp_agent_executor(llm, [tool.as_tool()], max_iterations=2)
+    progress = TurnProgress()
+
+    asyncio.run(get_agent_response(executor, "ping", [], llm, "scope", progress=progress))
+
+    assert tool.calls == 2
+    assert progress.early_stopped is True
+    assert stored == []
+
+
+def _collect_stream(executor, llm):
+    async def main():
+        return [event async for event in stream_agent_response(executor, "ping", [], llm)]
+    return asyncio.run(main())
+
+
+def test_stream_discards_text_of_steps_that_call_tools():
+    tool = CountingTool()
+    thinking = tool_call_message(tool.name, "ping")
+    thinking.content = "Let me check. "
+    llm = StreamingScriptedChatModel(responses=[thinking, AIMessage(content="pong")])
+    executor = create_mcp_agent_executor(llm, [tool.as_tool()])
+
+    events = _collect_stream(executor, llm)
+
+    names = [event["event"] for event in events]
+    assert names.index("step_reset") < names.index("tool_start") < names.index("tool_end")
+    assert events[names.index("step_reset")]["data"] == {"discarded": "Let me check. "}
+    # Tokens after the last reset are the answer
+    last_reset = max(i for i, name in enumerate(names) if name == "step_reset")
+    answer = "".join(event["data"]["text"] for event in events[last_reset:] if event["event"] == "token")
+    assert answer == "pong"
+    assert names[-1] == "final"
@@ -0,0 +1,91 @@
+import asyncio
+from types import SimpleNamespace
+from services import agent_manager as agent_manager_module
+from services.agent_manager import AgentManager
+
+USER = SimpleNamespace(id=1, mcp_config=None)
+
+
+def _fake_builds(monkeypatch, failing: set = frozenset()) -> list:
+    """Replaces tool setup and executor creation; returns the executors built, one per build (None when it failed)."""
+    built = []
+
+    async def setup_tools(llm, mcp_config, exit_stack=None):
+        await asyncio.sleep(0.01)
+        if len(built) in failing:
+            built.append(None)
+            raise RuntimeError("MCP server down")
+        return []
+
+    def create_executor(llm, tools):
+        executor = object()
+        built.append(executor)
+        return executor
+
+    monkeypatch.setattr(agent_manager_module, "setup_tools", setup_tools)
+    monkeypatch.setattr(agent_manager_module, "create_mcp_agent_executor", create_executor)
+    return built
+
+
+def _manager() -> AgentManager:
+    manager = AgentManager(ttl_seconds=60, refresh_ahead_seconds=10)
+    manager.set_llm(object())
+    return manager
+
+
+async def _settle(manager: AgentManager):
+    """Lets background refreshes finish (retired agents close later, after their grace period)."""
+    for _ in range(10):
+        await asyncio.sleep(0.02)
+        if not manager._inflight:
+            return
+
+
+def test_concurrent_requests_share_one_build(monkeypatch):
+    built = _fake_builds(monkeypatch)
+
+    async def main():
+        manager = _manager()
+        executors = await asyncio.gather(*(manager.get_agent(USER) for _ in range(5)))
+        assert len(built) == 1
+        assert all(executor is built[0] for executor in executors)
+        assert await manager.get_agent(USER) is built[0]
+        assert manager.stats()["hits"] == 1
+    asyncio.run(main())
+
+
+def test_agent_near_expiry_is_refreshed_in_the_background(monkeypatch):
+    built = _fake_builds(monkeypatch)
+
+    async def main():
+        manager = _manager()
+        first = await manager.get_agent(USER)
+        manager._agent_cache[USER.id].created_at -= 55 # Inside the refresh-ahead window
+
+        assert await manager.get_agent(USER) is first # Served from cache while the rebuild runs
+        await _settle(manager)
+        assert len(built) == 2
+        assert await manager.get_agent(USER) is built[1]
+        assert manager.stats()["refreshes"] == 1
+    asyncio.run(main())
+
+
+def test_failed_refresh_can_be_retried(monkeypatch):
+    built = _fake_builds(monkeypatch, failing={1})
+
+    async def main():
+        manager = _manager()
+        first = await manager.get_agent(USER)
+        manager._agent_cache[USER.id].created_at -= 55
+
+        assert await manager.get_agent(USER) is first
+        await _settle(manager)
+        entry = manager._agent_cache[USER.id]
+        assert entry.executor is first and entry.refreshing is False
+
+        assert await manager.get_agent(USER) is first # Starts a second refresh
+        await _settle(manager)
+        assert built[1] is None and built[2] is not None
+        assert await manager.get_agent(USER) is built[2]
+        assert manager.stats()["refreshes"] == 2
+    asyncio.run(main())
@@ -0,0 +1,36 @@
+from benchmarks.run import find_regressions, percentile
+
+
+def _summary(p95_ms: float = 100.0, throughput_rps: float = 50.0, errors: int = 0) -> dict:
+    return {"p95_ms": p95_ms, "throughput_rps": throughput_rps, "errors": errors}
+
+
+def test_percentile_uses_nearest_rank():
+    ordered = [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0]
+    assert percentile(ordered, 50) == 5.0
+    assert percentile(ordered, 95) == 10.0
+    assert percentile(ordered, 10) == 1.0
+    assert percentile(ordered, 0) == 1.0
+    assert percentile(ordered, 100) == 10.0
+
+
+def test_percentile_of_empty_list_is_zero():
+    assert percentile([], 95) == 0.0
+
+
+def test_find_regressions_within_tolerance():
+    baseline = {"chat": _summary()}
+    assert find_regressions({"chat": _summary(p95_ms=109.0, throughput_rps=46.0)}, baseline, 0.1) == []
+
+
+def test_find_regressions_reports_latency_throughput_and_errors():
+    baseline = {"chat": _summary()}
+    regressions = find_regressions({"chat": _summary(p95_ms=120.0, throughput_rps=40.0, errors=2)}, baseline, 0.1)
+    assert len(regressions) == 3
+    assert regressions[0].startswith("chat: p95")
+    assert regressions[1].startswith("chat: throughput")
+    assert regressions[2] == "chat: errors 0 -> 2"
+
+
+def test_find_regressions_skips_phases_without_baseline():
+    assert find_regressions({"list": _summary(p95_ms=1000.0)}, {"chat": _summary()}, 0.1) == []
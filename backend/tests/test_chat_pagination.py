@@ -0,0 +1,91 @@
+from datetime import datetime
+import pytest
+from sqlalchemy import text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.chat import ChatSession
+from services import chat as chat_crud
+
+
+async def _list_all_sessions(db: AsyncSession, user_id: int, limit: int):
+    pages, cursor = [], None
+    while True:
+        sessions, has_more = await chat_crud.get_user_sessions(db, user_id, limit, cursor)
+        pages.append([s.id for s in sessions])
+        if not has_more:
+            return pages
+        # Through the opaque form, as a client would send it back
+        cursor = chat_crud.decode_session_cursor(chat_crud.encode_session_cursor(sessions[-1]))
+
+
+def test_message_cursor_round_trip():
+    assert chat_crud.decode_cursor(chat_crud.encode_cursor(42)) == 42
+
+
+def test_session_cursor_round_trip():
+    session = ChatSession(id="s1", updated_at=datetime(2024, 5, 1, 12, 30, 15))
+    assert chat_crud.decode_session_cursor(chat_crud.encode_session_cursor(session)) == (datetime(2024, 5, 1, 12, 30, 15), "s1")
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", "bnVsbA", chat_crud.encode_cursor(1)])
+def test_malformed_session_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        chat_crud.decode_session_cursor(cursor)
+
+
+def test_sessions_page_newest_first_without_gaps(run_with_db):
+    async def body(db):
+        ids = []
+        for i in range(7):
+            session, _ = await chat_crud.create_chat_session(db, 1, f"message {i}")
+            ids.append(session.id)
+        await chat_crud.create_chat_session(db, 2, "someone else's")
+        # Distinct activity times for some sessions; the rest share one second and tie-break on id
+        for minute, session_id in enumerate(ids[:3]):
+            await db.execute(
+                update(ChatSession).where(ChatSession.id == session_id).values(updated_at=datetime(2030, 1, 1, 0, minute))
+            )
+        await db.commit()
+
+        pages = await _list_all_sessions(db, 1, limit=3)
+        listed = [session_id for page in pages for session_id in page]
+        assert [len(page) for page in pages] == [3, 3, 1]
+        assert listed[:3] == [ids[2], ids[1], ids[0]]
+        assert listed[3:] == sorted(ids[3:], reverse=True)
+    run_with_db(body)
+
+
+def test_backfill_normalizes_updated_at_for_paging(run_with_db):
+    async def body(db):
+        newer, _ = await chat_crud.create_chat_session(db, 1, "newer")
+        await db.execute(text(
+            "INSERT INTO chat_sessions (id, user_id, title, updated_at) VALUES ('old', 1, 'old', '2000-01-01 00:00:00.500000')"
+        ))
+        await db.commit()
+        async with db.bind.begin() as conn:
+            await chat_crud.backfill_session_updated_at(conn)
+        stored = (await db.execute(text("SELECT updated_at FROM chat_sessions WHERE id = 'old'"))).scalar_one()
+        assert stored == "2000-01-01 00:00:00"
+        assert await _list_all_sessions(db, 1, limit=1) == [[newer.id], ["old"]]
+    run_with_db(body)
+
+
+def test_messages_page_backwards_and_forwards(run_with_db):
+    async def body(db):
+        session, first = await chat_crud.create_chat_session(db, 1, "message 0")
+        message_ids = [first.id]
+        for i in range(1, 5):
+            message = await chat_crud.add_user_message_to_session(db, session.id, f"message {i}")
+            message_ids.append(message.id)
+
+        latest, has_older, has_newer = await chat_crud.get_chat_messages_page(db, session.id, 2)
+        assert [m.id for m in latest] == message_ids[3:]
+        assert (has_older, has_newer) == (True, False)
+
+        older, has_older, has_newer = await chat_crud.get_chat_messages_page(db, session.id, 2, before=latest[0].id)
+        assert [m.id for m in older] == message_ids[1:3]
+        assert (has_older, has_newer) == (True, True)
+
+        newer, _, has_newer = await chat_crud.get_chat_messages_page(db, session.id, 2, after=older[-1].id)
+        assert [m.id for m in newer] == message_ids[3:]
+        assert has_newer is False
+    run_with_db(body)
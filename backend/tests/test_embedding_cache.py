@@ -0,0 +1,63 @@
+from typing import List
+from services import embedding_cache as embedding_cache_module
+from services.embedding_cache import EmbeddingCache
+from services.embeddings import EmbeddingEngine
+
+
+class CountingModel:
+    def __init__(self):
+        self.encoded: List[str] = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.encoded.extend(texts)
+        return [[float(len(text)), 0.5, -1.0] for text in texts]
+
+
+def test_vectors_are_scoped_to_the_model_and_survive_a_restart(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    cache = EmbeddingCache(path, max_mb=1)
+    cache.put_many("model-a", ["hello"], [[0.25, -1.5, 3.0]])
+
+    assert cache.get_many("model-a", ["hello", "other"]) == [[0.25, -1.5, 3.0], None]
+    assert cache.get_many("model-b", ["hello"]) == [None]
+    # Another process (or the next run of populate_vectors.py) opening the same file
+    assert EmbeddingCache(path, max_mb=1).get_many("model-a", ["hello"]) == [[0.25, -1.5, 3.0]]
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_least_recently_used_rows_are_evicted_past_the_budget(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache_module, "EVICTION_CHECK_EVERY", 1)
+    # Room for 10 rows of 4 floats
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite"), max_mb=10 * (16 + embedding_cache_module.ROW_OVERHEAD_BYTES) / 1024 / 1024)
+    old = [f"old {i}" for i in range(10)]
+    new = [f"new {i}" for i in range(10)]
+    cache.put_many("model", old, [[1.0, 2.0, 3.0, 4.0]] * 10)
+    assert cache.stats()["evictions"] == 0
+
+    cache.put_many("model", new, [[1.0, 2.0, 3.0, 4.0]] * 10)
+
+    assert cache.get_many("model", old) == [None] * 10
+    assert sum(vector is not None for vector in cache.get_many("model", new)) == 9
+    assert cache.stats()["evictions"] == 11
+
+
+def test_unreadable_cache_is_treated_as_misses(tmp_path):
+    path = tmp_path / "embeddings.sqlite"
+    path.write_bytes(b"not a sqlite database" * 100)
+    cache = EmbeddingCache(str(path), max_mb=1)
+
+    cache.put_many("model", ["hello"], [[1.0]])
+    assert cache.get_many("model", ["hello"]) == [None]
+
+
+def test_engine_encodes_only_texts_never_seen(tmp_path):
+    model = CountingModel()
+    engine = EmbeddingEngine(model_name="model", cache=EmbeddingCache(str(tmp_path / "embeddings.sqlite"), max_mb=1))
+    engine._model = model
+
+    first = engine.embed_documents(["a", "bb", "a"])
+    second = engine.embed_documents(["bb", "ccc"])
+
+    assert model.encoded == ["a", "bb", "ccc"]
+    assert first == [[1.0, 0.5, -1.0], [2.0, 0.5, -1.0], [1.0, 0.5, -1.0]]
+    assert second == [[2.0, 0.5, -1.0], [3.0, 0.5, -1.0]]
@@ -0,0 +1,77 @@
+import asyncio
+import pytest
+from services.idempotency import IdempotencyStore, IdempotencyKeyReusedError, request_fingerprint
+
+
+def test_retry_replays_the_first_result():
+    async def main():
+        store = IdempotencyStore()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            return {"answer": len(calls)}
+
+        fingerprint = request_fingerprint({"content": "hi"})
+        assert await store.run("k", fingerprint, work) == ({"answer": 1}, False)
+        assert await store.run("k", fingerprint, work) == ({"answer": 1}, True)
+        assert len(calls) == 1
+        assert store.stats()["replays"] == 1
+    asyncio.run(main())
+
+
+def test_concurrent_retry_attaches_to_the_running_work():
+    async def main():
+        store = IdempotencyStore()
+        started = asyncio.Event()
+        release = asyncio.Event()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            started.set()
+            await release.wait()
+            return "done"
+
+        first = asyncio.create_task(store.run("k", "f", work))
+        await started.wait()
+        retry = asyncio.create_task(store.run("k", "f", work))
+        await asyncio.sleep(0)
+        release.set()
+        assert await first == ("done", False)
+        assert await retry == ("done", True)
+        assert len(calls) == 1
+        assert store.stats()["attached"] == 1
+    asyncio.run(main())
+
+
+def test_key_reused_with_another_body_is_rejected():
+    async def main():
+        store = IdempotencyStore()
+
+        async def work():
+            return "done"
+
+        await store.run("k", request_fingerprint({"content": "a"}), work)
+        with pytest.raises(IdempotencyKeyReusedError):
+            await store.run("k", request_fingerprint({"content": "b"}), work)
+    asyncio.run(main())
+
+
+def test_failed_work_is_forgotten_so_a_retry_runs_again():
+    async def main():
+        store = IdempotencyStore()
+        attempts = []
+
+        async def work():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise RuntimeError("upstream down")
+            return "done"
+
+        with pytest.raises(RuntimeError):
+            await store.run("k", "f", work)
+        await asyncio.sleep(0) # Let the done callback drop the failed entry
+        assert await store.run("k", "f", work) == ("done", False)
+        assert len(attempts) == 2
+    asyncio.run(main())
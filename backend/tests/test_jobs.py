@@ -0,0 +1,98 @@
+import asyncio
+from datetime import timedelta
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from services import jobs as jobs_module
+from services.jobs import Job, JobRunner, MemoryJobQueue, SQLJobQueue
+
+
+def _job(job_id: str, priority: int = 5) -> Job:
+    return Job(id=job_id, user_id=1, session_id="s1", content="hi", priority=priority)
+
+
+def test_claims_follow_priority_then_submission_order():
+    async def main():
+        queue = MemoryJobQueue()
+        for job in (_job("a"), _job("b", priority=1), _job("c")):
+            await queue.submit(job)
+        assert await queue.queued_count() == 3
+        claimed = [(await queue.claim()).id for _ in range(3)]
+        assert claimed == ["b", "a", "c"]
+        assert (await queue.get("b")).status == "running"
+        assert await queue.claim() is None
+        assert await queue.queued_count() == 0
+    asyncio.run(main())
+
+
+def test_cancelled_job_is_never_claimed():
+    async def main():
+        queue = MemoryJobQueue()
+        await queue.submit(_job("a"))
+        await queue.submit(_job("b"))
+        assert await queue.cancel_queued("a") is True
+        assert (await queue.get("a")).status == "cancelled"
+        assert await queue.queued_count() == 1
+        assert (await queue.claim()).id == "b"
+        assert await queue.claim() is None
+        # Running and finished jobs cannot be cancelled as queued ones
+        assert await queue.cancel_queued("b") is False
+        assert await queue.cancel_queued("a") is False
+    asyncio.run(main())
+
+
+def test_cancel_requests_only_apply_to_running_jobs():
+    async def main():
+        queue = MemoryJobQueue()
+        await queue.submit(_job("a"))
+        assert await queue.request_cancel("a") is False
+        await queue.claim()
+        assert await queue.request_cancel("a") is True
+        assert (await queue.get("a")).cancel_requested is True
+    asyncio.run(main())
+
+
+def test_runner_stops_a_job_flagged_by_another_process():
+    async def main():
+        queue = MemoryJobQueue()
+        runner = JobRunner(queue, workers=1, poll_seconds=0.01)
+        started = asyncio.Event()
+
+        async def handler(job, publish):
+            started.set()
+            await asyncio.sleep(30)
+            return {}
+
+        runner.start(handler)
+        try:
+            job = await runner.submit(1, "s1", "hi")
+            await asyncio.wait_for(started.wait(), 5)
+            # What a runner that does not own the job does on cancel
+            assert await queue.request_cancel(job.id) is True
+            for _ in range(200):
+                if (await queue.get(job.id)).finished:
+                    break
+                await asyncio.sleep(0.01)
+            assert (await queue.get(job.id)).status == "cancelled"
+        finally:
+            await runner.aclose()
+    asyncio.run(main())
+
+
+def test_sql_queue_requeues_stale_jobs_unless_cancel_was_requested(monkeypatch, run_with_db):
+    async def body(db):
+        monkeypatch.setattr(jobs_module, "AsyncSessionLocal", async_sessionmaker(bind=db.bind, expire_on_commit=False))
+        queue = SQLJobQueue()
+        for job in (_job("a"), _job("b", priority=1), _job("c")):
+            await queue.submit(job)
+        assert (await queue.claim()).id == "b"
+        assert (await queue.claim()).id == "a"
+        assert await queue.request_cancel("a") is True
+
+        # Nothing has been running long enough to count as left behind
+        assert await queue.requeue_stale(jobs_module._utcnow() - timedelta(minutes=5)) == 0
+        assert await queue.requeue_stale(jobs_module._utcnow() + timedelta(seconds=1)) == 1
+
+        assert (await queue.get("a")).status == "cancelled"
+        assert (await queue.get("b")).status == "queued"
+        assert await queue.queued_count() == 2
+        assert (await queue.claim()).id == "b"
+    run_with_db(body)
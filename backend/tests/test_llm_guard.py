@@ -0,0 +1,147 @@
+import asyncio
+import httpx
+import openai
+import pytest
+from core import config
+from services.llm import AdaptiveLimiter, LLMGuard, LLMUnavailableError, TokenBucket
+
+REQUEST = httpx.Request("POST", "https://llm.example.com/v1/chat/completions")
+
+
+def _timeout() -> openai.APITimeoutError:
+    return openai.APITimeoutError(request=REQUEST)
+
+
+def _bad_request() -> openai.BadRequestError:
+    return openai.BadRequestError("bad request", response=httpx.Response(400, request=REQUEST), body=None)
+
+
+@pytest.fixture
+def guard(monkeypatch) -> LLMGuard:
+    monkeypatch.setattr(config, "LLM_MAX_RETRIES", 1)
+    monkeypatch.setattr(config, "LLM_RETRY_BASE_SECONDS", 0.0)
+    return LLMGuard()
+
+
+def test_token_bucket_allows_a_burst_then_paces():
+    bucket = TokenBucket(rate=10, burst=2)
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+    bucket.refund()
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+
+
+def test_limiter_halves_on_overload_and_grows_by_one_per_window():
+    limiter = AdaptiveLimiter(max_limit=8, min_limit=2)
+    limiter.on_overload()
+    assert limiter.limit == 4
+    for _ in range(4):
+        limiter.on_success()
+    assert 4.9 < limiter.limit < 5
+    for _ in range(5):
+        limiter.on_overload()
+    assert limiter.limit == 2
+
+
+def test_limiter_admits_waiters_in_arrival_order():
+    async def main():
+        limiter = AdaptiveLimiter(max_limit=1)
+        await limiter.acquire()
+        admitted = []
+
+        async def wait(name):
+            await limiter.acquire()
+            admitted.append(name)
+
+        waiters = [asyncio.create_task(wait(name)) for name in ("first", "cancelled", "second")]
+        await asyncio.sleep(0)
+        assert limiter.waiting == 3
+        waiters[1].cancel()
+        for _ in range(2):
+            limiter.release()
+            await asyncio.sleep(0)
+        await asyncio.gather(waiters[0], waiters[2])
+        assert admitted == ["first", "second"]
+        assert limiter.in_flight == 1
+    asyncio.run(main())
+
+
+def test_retries_then_falls_back_in_order(guard):
+    tried = []
+
+    async def call(model):
+        tried.append(model)
+        if model != "backup-2":
+            raise _timeout()
+        return "ok"
+
+    assert asyncio.run(guard.call(call, ["main", "backup-1", "backup-2"])) == "ok"
+    assert tried == ["main", "main", "backup-1", "backup-1", "backup-2"]
+    stats = guard.stats()
+    assert (stats["retries"], stats["fallbacks"], stats["in_flight"]) == (2, 2, 0)
+
+
+def test_errors_a_retry_cannot_fix_are_raised_at_once(guard):
+    tried = []
+
+    async def call(model):
+        tried.append(model)
+        raise _bad_request()
+
+    with pytest.raises(openai.BadRequestError):
+        asyncio.run(guard.call(call, ["main", "backup"]))
+    assert tried == ["main"]
+
+
+def test_exhausted_models_raise_unavailable(guard):
+    async def call(model):
+        raise _timeout()
+
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(guard.call(call, ["main"]))
+    assert guard.stats()["failures"] == 1
+
+
+def test_stream_retries_only_before_the_first_chunk(guard):
+    opened = []
+
+    async def open_stream(model):
+        opened.append(model)
+        if len(opened) == 1:
+            raise _timeout()
+        yield "a"
+        raise _timeout()
+
+    async def main():
+        return [chunk async for chunk in guard.stream(open_stream, ["main"])]
+
+    with pytest.raises(openai.APITimeoutError):
+        asyncio.run(main())
+    assert opened == ["main", "main"]
+
+
+def test_slow_stream_is_hedged_on_its_first_chunk(guard, monkeypatch):
+    monkeypatch.setattr(config, "LLM_HEDGE_ENABLED", True)
+    monkeypatch.setattr(config, "LLM_HEDGE_MIN_SAMPLES", 1)
+    guard.first_chunk_latencies.add(0.02)
+    opened, closed = [], []
+
+    async def open_stream(model):
+        attempt = len(opened)
+        opened.append(attempt)
+        try:
+            if attempt == 0:
+                await asyncio.sleep(5)
+            yield f"{attempt}:a"
+            yield f"{attempt}:b"
+        finally:
+            closed.append(attempt)
+
+    async def main():
+        return [chunk async for chunk in guard.stream(open_stream, ["main"])]
+
+    assert asyncio.run(main()) == ["1:a", "1:b"]
+    assert sorted(closed) == [0, 1]
+    stats = guard.stats()
+    assert (stats["hedges"], stats["hedge_wins"], stats["in_flight"]) == (1, 1, 0)
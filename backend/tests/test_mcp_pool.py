@@ -0,0 +1,76 @@
+import asyncio
+import gc
+from services.mcp_pool import MCPConnectionPool, PooledMCPServer
+
+SERVER = {"transport": "streamable_http", "url": "https://mcp.example.com/mcp"}
+
+
+def _fake_connections(monkeypatch, failing: bool = False) -> dict:
+    """Replaces connecting and closing; returns counters of both."""
+    calls = {"started": 0, "closed": 0}
+
+    async def start(self):
+        await asyncio.sleep(0.01)
+        if failing:
+            raise ConnectionError("unreachable")
+        calls["started"] += 1
+
+    async def close(self):
+        calls["closed"] += 1
+
+    monkeypatch.setattr(PooledMCPServer, "start", start)
+    monkeypatch.setattr(PooledMCPServer, "close", close)
+    return calls
+
+
+def test_same_config_shares_one_connection_until_last_release(monkeypatch):
+    calls = _fake_connections(monkeypatch)
+
+    async def scenario():
+        pool = MCPConnectionPool()
+        first, second = await asyncio.gather(pool.acquire("search", SERVER), pool.acquire("search", dict(SERVER)))
+        assert first is second
+        assert calls["started"] == 1
+        assert pool.stats()["references"] == 2
+
+        await pool.release(first.key)
+        assert calls["closed"] == 0
+        assert pool.stats()["servers"] == 1
+
+        await pool.release(first.key)
+        assert calls["closed"] == 1
+        assert pool.stats() == {"servers": 0, "connected": 0, "references": 0}
+        gc.collect()
+        assert len(pool._locks) == 0
+
+    asyncio.run(scenario())
+
+
+def test_credentials_get_their_own_connection(monkeypatch):
+    calls = _fake_connections(monkeypatch)
+
+    async def scenario():
+        pool = MCPConnectionPool()
+        alice = await pool.acquire("search", {**SERVER, "headers": {"Authorization": "Bearer a"}})
+        bob = await pool.acquire("search", {**SERVER, "headers": {"Authorization": "Bearer b"}})
+        assert alice is not bob
+        assert calls["started"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_failed_connect_leaves_nothing_behind(monkeypatch):
+    _fake_connections(monkeypatch, failing=True)
+
+    async def scenario():
+        pool = MCPConnectionPool()
+        for _ in range(3):
+            try:
+                await pool.acquire("search", SERVER)
+            except ConnectionError:
+                pass
+        assert pool.stats()["servers"] == 0
+        gc.collect()
+        assert len(pool._locks) == 0
+
+    asyncio.run(scenario())
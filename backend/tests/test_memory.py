@@ -0,0 +1,63 @@
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage # type: ignore
+from benchmarks.fakes import ScriptedChatModel
+from core import config
+from models.chat import ChatMessage
+from services import memory
+
+# estimate_tokens: 40 characters are 11 tokens
+TEXT = "x" * 40
+
+
+async def _add_messages(db, count: int) -> list:
+    messages = [
+        ChatMessage(chat_session_id="s1", role="user" if i % 2 == 0 else "ai", content={"text": f"{i:02d}{TEXT[2:]}"})
+        for i in range(count)
+    ]
+    db.add_all(messages)
+    await db.commit()
+    return messages
+
+
+def test_history_keeps_the_newest_messages_within_the_budget(run_with_db, monkeypatch):
+    monkeypatch.setattr(config, "MEMORY_TOKEN_BUDGET", 35)
+
+    async def body(db):
+        messages = await _add_messages(db, 6)
+        history = await memory.load_history(db, "s1")
+        assert [type(m) for m in history] == [AIMessage, HumanMessage, AIMessage]
+        assert [m.content[:2] for m in history] == ["03", "04", "05"]
+        before = await memory.load_history(db, "s1", before_id=messages[4].id)
+        assert [m.content[:2] for m in before] == ["01", "02", "03"]
+    run_with_db(body)
+
+
+def test_session_within_budget_is_not_summarized(run_with_db, monkeypatch):
+    monkeypatch.setattr(config, "MEMORY_TOKEN_BUDGET", 1000)
+    llm = ScriptedChatModel(responses=[AIMessage(content="summary")])
+
+    async def body(db):
+        await _add_messages(db, 6)
+        assert await memory.summarize_session(db, llm, "s1") is None
+    run_with_db(body)
+    assert llm.calls == 0
+
+
+def test_backlog_is_folded_in_bounded_chunks(run_with_db, monkeypatch):
+    monkeypatch.setattr(config, "MEMORY_TOKEN_BUDGET", 30)
+    monkeypatch.setattr(config, "MEMORY_RECENT_TOKENS", 25)
+    monkeypatch.setattr(config, "MEMORY_MAX_TAIL_MESSAGES", 5)
+    monkeypatch.setattr(config, "MEMORY_SUMMARY_BATCH_MESSAGES", 4)
+    llm = ScriptedChatModel(responses=[AIMessage(content="summary 1"), AIMessage(content="summary 2"), AIMessage(content="summary 3")])
+
+    async def body(db):
+        messages = await _add_messages(db, 12)
+        summary = await memory.summarize_session(db, llm, "s1")
+        # The two newest messages stay verbatim; the ten before them fold as 4 + 4 + 2
+        assert summary.content == {"text": "summary 3", "covers_until_id": messages[9].id}
+        history = await memory.load_history(db, "s1")
+        assert isinstance(history[0], SystemMessage) and "summary 3" in history[0].content
+        assert [m.content[:2] for m in history[1:]] == ["10", "11"]
+        # Nothing left to fold
+        assert await memory.summarize_session(db, llm, "s1") is None
+    run_with_db(body)
+    assert llm.calls == 3
@@ -0,0 +1,61 @@
+import hashlib
+import shutil
+from typing import List
+import pytest
+from langchain_core.documents import Document
+from data import populate_vectors
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.embedded: List[str] = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.embedded.extend(texts)
+        return [[float(byte) + 1.0 for byte in hashlib.sha256(text.encode()).digest()[:4]] for text in texts]
+
+
+@pytest.fixture
+def embeddings(tmp_path, monkeypatch) -> CountingEmbeddings:
+    engine = CountingEmbeddings()
+    monkeypatch.setattr(populate_vectors, "VECTOR_INDEX_DIR", str(tmp_path / "index"))
+    monkeypatch.setattr(populate_vectors, "INGEST_MANIFEST_DIR", str(tmp_path / "manifests"))
+    monkeypatch.setattr(populate_vectors, "get_embedding_function", lambda: engine)
+    return engine
+
+
+def _chunks(*texts: str) -> List[Document]:
+    return [Document(page_content=text, metadata={"source": "guide.pdf", "page": 1}) for text in texts]
+
+
+def _ids(*texts: str) -> List[str]:
+    return [chunk.metadata["id"] for chunk in populate_vectors.calculate_chunk_ids(_chunks(*texts))]
+
+
+def test_chunk_ids_follow_content_not_position():
+    # Text inserted before a chunk does not change its ID; exact duplicates collapse
+    assert _ids("intro", "alpha", "beta", "beta") == _ids("intro") + _ids("alpha", "beta")
+
+
+def test_only_changed_chunks_are_embedded(embeddings):
+    assert populate_vectors.sync_chunks(_chunks("alpha", "beta", "gamma"), "guide", "mmap") == (0, 3, 0)
+    embeddings.embedded.clear()
+
+    assert populate_vectors.sync_chunks(_chunks("alpha", "beta, edited", "delta"), "guide", "mmap") == (1, 2, 2)
+    assert sorted(embeddings.embedded) == ["beta, edited", "delta"]
+    assert sorted(populate_vectors.MmapChunkStore("guide").index.ids()) == sorted(_ids("alpha", "beta, edited", "delta"))
+
+    embeddings.embedded.clear()
+    assert populate_vectors.sync_chunks(_chunks("alpha", "beta, edited", "delta"), "guide", "mmap") == (3, 0, 0)
+    assert embeddings.embedded == []
+
+
+def test_chunks_missing_from_the_store_are_restored(embeddings, tmp_path):
+    populate_vectors.sync_chunks(_chunks("alpha", "beta"), "guide", "mmap")
+    # The manifest survives, but the index was wiped (e.g. restored from an old backup)
+    shutil.rmtree(tmp_path / "index" / "guide")
+    embeddings.embedded.clear()
+
+    assert populate_vectors.sync_chunks(_chunks("alpha", "beta"), "guide", "mmap") == (0, 2, 0)
+    assert sorted(embeddings.embedded) == ["alpha", "beta"]
+    assert populate_vectors.MmapChunkStore("guide").index.count == 2
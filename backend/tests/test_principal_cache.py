@@ -0,0 +1,93 @@
+from datetime import datetime
+from types import SimpleNamespace
+from models.user import User
+from services import auth as auth_service
+from services import user as user_service
+from services.auth import create_access_token, get_current_user
+from services.principal_cache import PrincipalCache
+
+
+def _user(user_id: int, username: str) -> SimpleNamespace:
+    return SimpleNamespace(id=user_id, username=username, mcp_config=None, created_at=datetime(2024, 1, 1), updated_at=None)
+
+
+def _use_cache(monkeypatch, cache: PrincipalCache) -> list:
+    """Installs ``cache`` for auth and profile writes; returns the usernames looked up in the database."""
+    lookups = []
+    get_user_by_username = user_service.get_user_by_username
+
+    async def counting_lookup(db, username):
+        lookups.append(username)
+        return await get_user_by_username(db, username)
+
+    monkeypatch.setattr(auth_service, "principal_cache", cache)
+    monkeypatch.setattr(user_service, "principal_cache", cache)
+    monkeypatch.setattr(auth_service.user_crud, "get_user_by_username", counting_lookup)
+    return lookups
+
+
+def test_repeat_requests_skip_the_user_lookup(monkeypatch, run_with_db):
+    cache = PrincipalCache(ttl_seconds=60, max_entries=10)
+    lookups = _use_cache(monkeypatch, cache)
+
+    async def body(db):
+        db.add(User(username="alice", hashed_password="x"))
+        await db.commit()
+        token = create_access_token({"sub": "alice"})
+
+        first = await get_current_user(db, token)
+        second = await get_current_user(db, token)
+
+        assert second == first
+        assert lookups == ["alice"]
+        assert cache.stats()["hits"] == 1
+
+    run_with_db(body)
+
+
+def test_profile_update_invalidates_the_cached_principal(monkeypatch, run_with_db):
+    cache = PrincipalCache(ttl_seconds=60, max_entries=10)
+    lookups = _use_cache(monkeypatch, cache)
+
+    async def body(db):
+        db.add(User(username="alice", hashed_password="x"))
+        await db.commit()
+        token = create_access_token({"sub": "alice"})
+        principal = await get_current_user(db, token)
+
+        await user_service.update_user_mcp_config(db, principal.id, {"mcpServers": {}})
+        refreshed = await get_current_user(db, token)
+
+        assert refreshed.mcp_config == {"mcpServers": {}}
+        assert lookups == ["alice", "alice"]
+        assert cache.stats()["invalidations"] == 1
+
+    run_with_db(body)
+
+
+def test_invalidation_drops_every_subject_of_the_user():
+    cache = PrincipalCache(ttl_seconds=60, max_entries=10)
+    cache.put("alice", _user(1, "alice"))
+    cache.put("alice-old-name", _user(1, "alice"))
+    cache.put("bob", _user(2, "bob"))
+
+    cache.invalidate_user(1)
+
+    assert cache.get("alice") is None
+    assert cache.get("alice-old-name") is None
+    assert cache.get("bob").id == 2
+
+
+def test_expired_and_least_recently_used_entries_are_dropped():
+    expired = PrincipalCache(ttl_seconds=0, max_entries=10)
+    expired.put("alice", _user(1, "alice"))
+    assert expired.get("alice") is None
+    assert expired.stats()["size"] == 0
+
+    bounded = PrincipalCache(ttl_seconds=60, max_entries=2)
+    bounded.put("alice", _user(1, "alice"))
+    bounded.put("bob", _user(2, "bob"))
+    bounded.get("alice")
+    bounded.put("carol", _user(3, "carol"))
+    assert bounded.get("bob") is None
+    assert bounded.get("alice") is not None
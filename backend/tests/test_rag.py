@@ -0,0 +1,78 @@
+import asyncio
+import uuid
+from typing import List
+import chromadb
+import pytest
+from core import config
+from services import rag
+
+VECTORS = {"north": [0.0, 1.0], "east": [1.0, 0.0], "north-east": [0.6, 0.8]}
+
+
+class FakeEmbeddings:
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [VECTORS[text] for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return VECTORS[text]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return self.embed_query(text)
+
+
+@pytest.fixture
+def chroma(monkeypatch):
+    """A fresh in-memory chromadb behind rag's pooled clients; returns a helper that creates a filled collection."""
+    client = chromadb.EphemeralClient()
+    monkeypatch.setattr(rag, "_chroma_server_client", client)
+    monkeypatch.setattr(rag, "_chroma_clients", {})
+    monkeypatch.setattr(rag, "_chroma_relevance", {})
+    monkeypatch.setattr(rag, "get_embedding_function", FakeEmbeddings)
+    monkeypatch.setattr(config, "VECTOR_STORE_BACKEND", "chroma")
+
+    def create(texts: List[str], space: str = None) -> str:
+        name = f"test-{uuid.uuid4().hex}"
+        collection = client.create_collection(name, metadata={"hnsw:space": space} if space else None)
+        collection.add(ids=texts, documents=texts, embeddings=[VECTORS[text] for text in texts])
+        return name
+
+    return create
+
+
+def _search(namespace: str, query: str) -> List[tuple]:
+    db = rag._get_chroma_client(namespace)
+    return [(doc.page_content, round(score, 3)) for doc, score in rag._search_by_vector(db, VECTORS[query], 3, namespace)]
+
+
+def test_cosine_distances_become_cosine_similarity(chroma):
+    namespace = chroma(["north", "east", "north-east"], space="cosine")
+    assert _search(namespace, "north") == [("north", 1.0), ("north-east", 0.8), ("east", 0.0)]
+
+
+def test_default_l2_space_ranks_closest_first(chroma):
+    namespace = chroma(["north", "east", "north-east"])
+    results = _search(namespace, "north")
+    assert [text for text, _ in results] == ["north", "north-east", "east"]
+    assert results[0][1] == 1.0
+    assert results[0][1] > results[1][1] > results[2][1]
+
+
+def test_unreadable_space_falls_back_to_l2(chroma):
+    assert rag._collection_space("no-such-collection") == "l2"
+
+
+def test_fan_out_merges_namespaces_by_relevance(chroma, monkeypatch):
+    async def available():
+        return True
+
+    monkeypatch.setattr(rag, "_ais_chroma_available", available)
+    first = chroma(["east", "north-east"], space="cosine")
+    second = chroma(["north", "north-east"], space="cosine")
+
+    hits = asyncio.run(rag.asearch_namespaces("north", [first, second], k=3, k_per_namespace=2, mmr=False))
+
+    # "north-east" is in both namespaces and is kept once
+    assert [(hit.document.page_content, round(hit.score, 3)) for hit in hits] == [("north", 1.0), ("north-east", 0.8), ("east", 0.0)]
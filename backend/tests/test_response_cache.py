@@ -0,0 +1,80 @@
+import json
+import os
+import numpy as np
+from langchain_core.messages import AIMessage, HumanMessage
+from core import config
+from core.schemas import LLMOutputBlock
+from services.response_cache import SemanticResponseCache
+
+QUERY = np.array([1.0, 0.0], dtype=np.float32)
+PARAPHRASE = np.array([0.98, 0.199], dtype=np.float32)
+UNRELATED = np.array([0.0, 1.0], dtype=np.float32)
+
+
+def _answer(text: str) -> LLMOutputBlock:
+    return LLMOutputBlock(blocks=[{"type": "text", "text": text}], query="q")
+
+
+def _cache(monkeypatch, tmp_path, **kwargs) -> SemanticResponseCache:
+    monkeypatch.setattr(config, "RAG_VERSIONS_PATH", str(tmp_path / "rag_versions.json"))
+    options = {"enabled": True, "max_entries": 10, "ttl_seconds": 60, "threshold": 0.95, **kwargs}
+    return SemanticResponseCache(**options)
+
+
+def _ingest(tmp_path, **versions: float):
+    # Replaced rather than rewritten, as populate_vectors.py does
+    tmp = tmp_path / "rag_versions.json.tmp"
+    tmp.write_text(json.dumps(versions))
+    os.replace(tmp, tmp_path / "rag_versions.json")
+
+
+def test_scope_covers_agent_and_last_exchange(monkeypatch, tmp_path):
+    cache = _cache(monkeypatch, tmp_path)
+    history = [HumanMessage(content="hi"), AIMessage(content="hello")]
+
+    assert cache.scope_key("agent-1", history) == cache.scope_key("agent-1", [HumanMessage(content="older"), *history])
+    assert cache.scope_key("agent-1", history) != cache.scope_key("agent-2", history)
+    assert cache.scope_key("agent-1", history) != cache.scope_key("agent-1", history[:1])
+    assert cache.scope_key(None, history) is None
+    assert _cache(monkeypatch, tmp_path, enabled=False).scope_key("agent-1", history) is None
+
+
+def test_similar_query_hits_only_in_its_scope(monkeypatch, tmp_path):
+    cache = _cache(monkeypatch, tmp_path)
+    cache.store("scope-a", QUERY, _answer("cached"), [], [], latency=2.0)
+
+    assert cache.lookup("scope-a", PARAPHRASE).output["blocks"][0]["text"] == "cached"
+    assert cache.lookup("scope-a", UNRELATED) is None
+    assert cache.lookup("scope-b", QUERY) is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["saved_latency_seconds"]) == (1, 2, 2.0)
+
+
+def test_reingesting_a_namespace_drops_answers_built_from_it(monkeypatch, tmp_path):
+    cache = _cache(monkeypatch, tmp_path)
+    _ingest(tmp_path, guide=1.0, faq=1.0)
+    cache.store("from-guide", QUERY, _answer("guide"), ["RAG_guide"], [], latency=1.0)
+    search = {"name": "RAG_search", "input": {"query": "q", "namespaces": ["faq"]}}
+    cache.store("from-faq", QUERY, _answer("faq"), ["RAG_search"], [search], latency=1.0)
+    cache.store("no-rag", QUERY, _answer("plain"), [], [], latency=1.0)
+
+    _ingest(tmp_path, guide=2.0, faq=1.0)
+
+    assert cache.lookup("from-guide", QUERY) is None
+    assert cache.lookup("from-faq", QUERY) is not None
+    assert cache.lookup("no-rag", QUERY) is not None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_expired_and_least_recently_used_entries_are_evicted(monkeypatch, tmp_path):
+    expired = _cache(monkeypatch, tmp_path, ttl_seconds=0)
+    expired.store("scope", QUERY, _answer("old"), [], [], latency=1.0)
+    assert expired.lookup("scope", QUERY) is None
+
+    bounded = _cache(monkeypatch, tmp_path, max_entries=2)
+    for scope in ("a", "b"):
+        bounded.store(scope, QUERY, _answer(scope), [], [], latency=1.0)
+    bounded.lookup("a", QUERY)
+    bounded.store("c", QUERY, _answer("c"), [], [], latency=1.0)
+    assert bounded.lookup("b", QUERY) is None
+    assert bounded.lookup("a", QUERY) is not None
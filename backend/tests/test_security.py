@@ -0,0 +1,50 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from passlib.hash import bcrypt
+from api.v1.endpoints.auth import login_for_access_token
+from core import config
+from core.security import PasswordHashBusyError, averify_and_update, pwd_context
+from models.user import User
+from services.user import get_user_by_username
+
+
+def _outdated_hash(password: str) -> str:
+    return bcrypt.using(rounds=config.BCRYPT_ROUNDS - 1).hash(password)
+
+
+def test_outdated_cost_is_rehashed_on_verify():
+    verified, new_hash = asyncio.run(averify_and_update("s3cret", _outdated_hash("s3cret")))
+    assert verified is True
+    assert new_hash is not None
+    assert bcrypt.from_string(new_hash).rounds == config.BCRYPT_ROUNDS
+    assert pwd_context.verify("s3cret", new_hash)
+
+
+def test_current_cost_is_not_rehashed():
+    assert asyncio.run(averify_and_update("s3cret", pwd_context.hash("s3cret"))) == (True, None)
+
+
+def test_wrong_password_is_not_rehashed():
+    assert asyncio.run(averify_and_update("wrong", _outdated_hash("s3cret"))) == (False, None)
+
+
+def test_full_hash_queue_is_refused(monkeypatch):
+    monkeypatch.setattr(config, "PASSWORD_HASH_MAX_PENDING", 0)
+    with pytest.raises(PasswordHashBusyError):
+        asyncio.run(averify_and_update("s3cret", pwd_context.hash("s3cret")))
+
+
+def test_login_stores_the_rehashed_password(run_with_db):
+    async def body(db):
+        old_hash = _outdated_hash("s3cret")
+        db.add(User(username="alice", hashed_password=old_hash))
+        await db.commit()
+
+        await login_for_access_token(db, SimpleNamespace(username="alice", password="s3cret"))
+
+        user = await get_user_by_username(db, "alice")
+        assert user.hashed_password != old_hash
+        assert bcrypt.from_string(user.hashed_password).rounds == config.BCRYPT_ROUNDS
+
+    run_with_db(body)
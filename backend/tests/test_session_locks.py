@@ -0,0 +1,35 @@
+import asyncio
+import pytest
+from services.session_locks import SessionLocks, SessionBusyError
+
+
+def test_turns_of_one_session_queue_and_overflow_is_busy():
+    async def main():
+        locks = SessionLocks(max_queued=1)
+        order = []
+        release = asyncio.Event()
+
+        async def turn(name):
+            async with locks.hold("s1"):
+                order.append(name)
+                await release.wait()
+
+        first = asyncio.create_task(turn("first"))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(turn("second"))
+        await asyncio.sleep(0)
+        assert order == ["first"]
+        assert locks.stats() == {"active_sessions": 1, "queued_turns": 1}
+
+        with pytest.raises(SessionBusyError):
+            async with locks.hold("s1"):
+                pass
+        # Other sessions are not affected
+        async with locks.hold("s2"):
+            pass
+
+        release.set()
+        await asyncio.gather(first, second)
+        assert order == ["first", "second"]
+        assert locks.stats() == {"active_sessions": 0, "queued_turns": 0}
+    asyncio.run(main())
@@ -0,0 +1,64 @@
+import os
+import numpy as np
+import pytest
+from services.vector_index import MmapVectorIndex
+
+
+def _rows(count: int, dim: int = 8, seed: int = 0):
+    vectors = np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+    ids = [f"doc-{seed}-{i}" for i in range(count)]
+    return ids, [f"text of {i}" for i in ids], [{"source": i} for i in ids], vectors
+
+
+def _search_ids(index: MmapVectorIndex, query, k: int = 3):
+    return [doc.metadata["source"] for doc, _ in index.similarity_search_by_vector_with_relevance_scores(list(query), k)]
+
+
+def test_readers_pick_up_a_new_generation_without_mixing(tmp_path):
+    writer = MmapVectorIndex(str(tmp_path), "docs")
+    reader = MmapVectorIndex(str(tmp_path), "docs")
+    first = _rows(5, seed=1)
+    writer.write(*first)
+    assert _search_ids(reader, first[3][2], k=1) == [first[0][2]]
+    old_snapshot = reader._snapshot
+
+    second = _rows(4, seed=2)
+    writer.write(*second)
+    assert reader.count == 4
+    assert _search_ids(reader, second[3][0], k=1) == [second[0][0]]
+    # A search that started on the old generation can still read it
+    assert len(old_snapshot.records) == len(old_snapshot.vectors) == 5
+
+    writer.write(*_rows(3, seed=3))
+    files = sorted(os.listdir(tmp_path / "docs"))
+    assert files == ["manifest.json", "metadata.2.json", "metadata.3.json", "vectors.2.npy", "vectors.3.npy"]
+
+
+def test_int8_scores_match_float32_closely(tmp_path):
+    ids, texts, metadatas, vectors = _rows(50)
+    exact = MmapVectorIndex(str(tmp_path), "float32")
+    exact.write(ids, texts, metadatas, vectors)
+    quantized = MmapVectorIndex(str(tmp_path), "int8")
+    quantized.write(ids, texts, metadatas, vectors, dtype="int8")
+
+    assert quantized._refresh().vectors.dtype == np.int8
+    for query in vectors[:5]:
+        expected = exact.similarity_search_by_vector_with_relevance_scores(list(query), 5)
+        actual = quantized.similarity_search_by_vector_with_relevance_scores(list(query), 5)
+        assert [doc.metadata for doc, _ in actual][0] == [doc.metadata for doc, _ in expected][0]
+        assert [score for _, score in actual] == pytest.approx([score for _, score in expected], abs=0.02)
+
+
+def test_add_to_an_int8_index_keeps_and_deletes_rows(tmp_path):
+    ids, texts, metadatas, vectors = _rows(6)
+    index = MmapVectorIndex(str(tmp_path), "docs")
+    index.write(ids, texts, metadatas, vectors, dtype="int8")
+    new_ids, new_texts, new_metadatas, new_vectors = _rows(2, seed=9)
+
+    index.add(new_ids, new_texts, new_metadatas, new_vectors, delete_ids=ids[:2], dtype="int8")
+
+    assert index.ids() == ids[2:] + new_ids
+    # Kept rows were dequantized before being stored again, so they still find themselves
+    for row in range(2, 6):
+        assert _search_ids(index, vectors[row], k=1) == [ids[row]]
+    assert _search_ids(index, new_vectors[1], k=1) == [new_ids[1]]